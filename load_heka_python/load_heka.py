@@ -1,50 +1,82 @@
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+import copy
 from io import open
+import mmap
 import numpy as np
 import struct
+import time
 from .trees.SharedTrees import (
     BundleHeader,
-    MarkerRootRecord,
-    MarkerRecord,
-    get_stim_to_dac_id,
-    get_data_kind,
+    TreeRecord,
+    LeafRecord,
+    get_compiled_description,
 )
+from .trees import TreeSchemas
 from .readers import stim_reader
 from .readers import data_reader
+from .readers import tree_cache
+from .readers import tree_index
+from .readers import trace_table
 import warnings
 
 warnings.simplefilter("always", UserWarning)
 
-OLD_VERSIONS = ["v2x65, 19-Dec-2011"]
-
-
-def _import_trees(header):
+OLD_VERSIONS = TreeSchemas.SCHEMA_VERSIONS["v9_pre_2x90"]
+
+TREE_KEYS = ["pul", "pgf", "amp", "sol", "mrk", "onl"]
+
+# Record names of each level of a tree (from the root), keyed by bundle item extension
+TREE_LEVELS = {
+    ".pul": ["PulseRootRecord", "GroupRecord", "PulSeriesRecord", "SweepRecord", "TraceRecord"],
+    ".pgf": ["StimRootRecord", "StimStimulationRecord", "StimChannelRecord", "StimStimSegmentRecord"],
+    ".amp": ["AmpRootRecord", "AmpSeriesRecord", "AmplStateRecord"],
+    ".sol": ["SolutionsRootRecord", "SolutionRecord", "ChemicalRecord"],
+    ".mrk": ["MarkerRootRecord", "MarkerRecord"],
+    ".onl": ["AnalRootRecord", "MethodRecord", "FunctionRecord"],
+}
+
+# Pulse tree entries used to load and return series data, always decoded when `fields` is passed to LoadHeka
+REQUIRED_FIELDS = {
+    "GroupRecord": ["GrLabel"],
+    "PulSeriesRecord": ["SeLabel", "SeNumberSweeps"],
+    "SweepRecord": ["SwStimCount"],
+    "TraceRecord": [
+        "TrLabel",
+        "TrData",
+        "TrDataPoints",
+        "TrDataKind",
+        "TrRecordingMode",
+        "TrDataFormat",
+        "TrDataScaler",
+        "TrTimeOffset",
+        "TrZeroData",
+        "TrYUnit",
+        "TrXInterval",
+        "TrXStart",
+        "TrXUnit",
+        "TrYOffset",
+        "TrGLeak",
+        "TrInterleaveSize",
+        "TrInterleaveSkip",
+        # also checked by get_sweep_param_violations()
+        "TrAdcChannel",
+        "TrCellPotential",
+    ],
+}
+
+
+def _parse_tree_task(worker, key):
     """
-    Import the relevant tree (v9 or v1000) based on header. TODO: Probably a nicer way to do this.
+    Parse a single tree with a copy of a LoadHeka object (see LoadHeka._get_worker()) using its own file handle,
+    so trees can be parsed concurrently. At module level so it can be run in a process pool.
     """
-    if header["oVersion"] in OLD_VERSIONS:
-        from .trees import Trees_v9_pre_2x90 as Trees
-
-    elif header["oVersion"] in ["v2x90.2, 22-Nov-2016"]:
-        from .trees import Trees_v9 as Trees
-
-    elif header["oVersion"] in [
-        "v2x90.3, 19-Mar-2018",
-        "v2x90.4, 30-Oct-2018",
-        "v2x90.5, 09-Apr-2019",
-        "1.2.0 [Build 1469]",
-        "1.3.0 [Build 1008]",
-        "1.4.1 [Build 1036]",
-        "1.5.0 [Build 1061]",
-        "v2x91, 23-Feb-2021",
-        "v2x91, 06-Jul-2020",
-        "v2x92, 23-February-2023",
-        "v2x92, 1-June-2023",
-    ]:
-        from .trees import Trees_v1000 as Trees
-    else:
-        raise BaseException("Version not current supported, please contact support@easyelectrophysiology.com")
-
-    return Trees
+    worker.open()
+    try:
+        tree = worker._get_cached_tree(key, getattr(worker, "_get_" + key))
+    finally:
+        worker.close()
+
+    return tree, worker.tree_parse_times[key], worker.read_stats
 
 
 class LoadHeka:
@@ -64,12 +96,84 @@ class LoadHeka:
           contact HEKA and get their structure information.
     """
 
-    def __init__(self, full_filepath):
+    def __init__(
+        self,
+        full_filepath,
+        fields=None,
+        scan_mode=False,
+        use_index=False,
+        compact=False,
+        cache_dir=None,
+        max_cache_bytes=tree_cache.DEFAULT_MAX_CACHE_BYTES,
+        parallel=None,
+        backend="file",
+        max_read_gap=data_reader.DEFAULT_MAX_READ_GAP,
+    ):
+        """
+        full_filepath - full path to the HEKA .dat file.
+
+        fields - optional dictionary of record name to list of entries to decode for that record,
+                 e.g. {"TraceRecord": ["TrData", "TrDataPoints", ...]}. All other entries of that record are
+                 skipped when parsing the tree, saving time and memory on large files. Records not
+                 in the dictionary are decoded in full. The pulse tree entries needed to load series data
+                 (see REQUIRED_FIELDS) are always decoded.
+
+        scan_mode - if True, only the Root, Group and Series records of the pulse tree are unpacked. Sweep and
+                    Trace records are skipped (series have no children) so series data cannot be loaded.
+                    For quickly listing the contents of many files, see also LoadHeka.catalog().
+
+        use_index - if True, the pulse tree is not unpacked on initialisation. Instead an offset index of all its
+                    records is built (self.pul_index, see readers/tree_index.py) and the records of self.pul are
+                    only decoded when accessed. This makes opening large files fast when only a few series are used.
+
+        compact - if True, tree records are slotted TreeRecord / LeafRecord objects rather than dicts and the headers
+                  of the lowest level records (e.g. all traces) are read-only RecordRow views onto a single
+                  RecordTable (see SharedTrees). Both are accessed as the dicts (e.g. rec["hd"]["TrLabel"]) but use
+                  much less memory for files with many traces.
+
+        cache_dir - optional directory in which to cache the parsed trees. Trees are cached per file (keyed by path,
+                    size, modification time and header oTime) so re-opening an unchanged file loads the trees
+                    from the cache rather than parsing them. See readers/tree_cache.py. Cache files are pickles, which
+                    can run arbitrary code when loaded, so only use a directory that only trusted users can write to.
+
+        max_cache_bytes - maximum total size of cache_dir, the least recently used trees are removed above this.
+
+        parallel - "thread" or "process" to parse all trees on initialisation at the same time in a thread or process
+                   pool, each reading the file with its own file handle. By default only the pulse tree is parsed
+                   on initialisation and other trees on first access. The time taken to parse each tree is stored
+                   in self.tree_parse_times.
+
+        backend - "file" to read the file with seek / read calls, or "mmap" to memory-map the file once on open().
+                  Trees are then unpacked directly from the mapping and trace data is read as np.frombuffer views
+                  onto it before scaling, with no intermediate copies. The mapped pages are shared (through the
+                  page cache) between processes reading the same file.
+
+        max_read_gap - when series data is loaded, records of the channel at most this many bytes apart in the file
+                       are read in one read, reading the bytes in between (e.g. the other channels' data). By default
+                       (0) only records stored next to each other are read together. A gap of a few kB can be faster
+                       on high latency storage, at the cost of reading data that was not requested.
+        """
+        assert not (scan_mode and use_index), "scan_mode and use_index cannot be used together"
+        assert parallel in [None, "thread", "process"], "parallel must be None, 'thread' or 'process'"
+        assert backend in ["file", "mmap"], "backend must be 'file' or 'mmap'"
 
-        self.Trees = None  # filled with import once version is known
+        self.Trees = None  # filled with the Schema (record layouts) once version is known
         self.full_filepath = full_filepath
+        self.fields = fields
+        self.scan_mode = scan_mode
+        self.use_index = use_index
+        self.compact = compact
+        self.cache_dir = cache_dir
+        self.max_cache_bytes = max_cache_bytes
+        self.parallel = parallel
+        self.backend = backend
+        self.max_read_gap = max_read_gap
 
         self.fh = None
+        self.mmap = None
+        self.read_stats = {"num_reads": 0, "num_bytes": 0}  # file reads made, see _read()
+        self.data_read_stats = {"num_seeks": 0, "num_reads": 0, "num_bytes": 0}  # see data_reader.read_records()
+        self.tree_parse_times = {}  # seconds to parse (or load from cache) each tree, see _get_cached_tree()
         self.open()
 
         self.header = self._get_header()
@@ -77,26 +181,156 @@ class LoadHeka:
 
         assert self.header["oSignature"] == "DAT2", "Version DAT1 not supported"
 
-        self.Trees = _import_trees(self.header)
-        self.pul = self._get_pul()
+        self.Trees = TreeSchemas.get_schema(self.version)
+        self._check_fields()
+
+        if self.cache_dir is not None:
+            self._cache_key = tree_cache.get_file_key(self.full_filepath, self.header, self._get_cache_options())
+
+        # The remaining trees are parsed on first access, see _get_lazy_tree()
+        self._lazy_trees = {}
 
-        if self.version not in OLD_VERSIONS:
+        if self.use_index:
+            self.pul_index = self._get_pul_index()
+            self.pul = self.pul_index.get_tree() if self.pul_index else None
+        elif self.parallel:
+            self.pul_index = None
+            self.pul = self._parse_trees_concurrently()
+        else:
+            self.pul_index = None
+            self.pul = self._get_cached_tree("pul", self._get_pul)
+
+        self._channel_index = {"series": {}, "groups": {}}  # see _get_indexed_series_channels()
+        self._trace_table = None  # see trace_table()
 
-            self.pgf = self._get_pgf()
-            self.amp = self._get_amp()
-            self.sol = self._get_sol()
-            self.mrk = self._get_mrk()
-            self.onl = self._get_onl()
+    @classmethod
+    def catalog(cls, full_filepath):
+        """
+        Read the group and series of a file without unpacking any Sweep or Trace records (see scan_mode).
+
+        Returns a dict with the file version and time (from the bundle header) and for each group its label and
+        a list of series with their label, number of sweeps and time.
+        """
+        with cls(full_filepath, scan_mode=True) as heka_file:
+
+            catalog = {"version": heka_file.version, "time": heka_file.header["oTime"], "groups": []}
+            for group in heka_file.pul["ch"]:
+
+                series = [
+                    {
+                        "label": series["hd"]["SeLabel"],
+                        "num_sweeps": series["hd"]["SeNumberSweeps"],
+                        "time": series["hd"]["SeTime"],
+                    }
+                    for series in group["ch"]
+                ]
+                catalog["groups"].append({"label": group["hd"]["GrLabel"], "series": series})
+
+        return catalog
+
+    @property
+    def pgf(self):
+        return self._get_lazy_tree("pgf", self._get_pgf)
+
+    @property
+    def amp(self):
+        return self._get_lazy_tree("amp", self._get_amp)
+
+    @property
+    def sol(self):
+        return self._get_lazy_tree("sol", self._get_sol)
+
+    @property
+    def mrk(self):
+        return self._get_lazy_tree("mrk", self._get_mrk)
+
+    @property
+    def onl(self):
+        return self._get_lazy_tree("onl", self._get_onl)
+
+    def _get_lazy_tree(self, key, get_tree):
+        """
+        Only the pulse tree is read on initialisation. The stimulus, amplifier, solutions, marker and analysis
+        trees are parsed the first time they are accessed (e.g. pgf for stimulus reconstruction) and then cached.
+        The file must be open on first access. These trees are not read for versions before 2x90.
+        """
+        if key not in self._lazy_trees:
+            self._lazy_trees[key] = None if self.version in OLD_VERSIONS else self._get_cached_tree(key, get_tree)
+
+        return self._lazy_trees[key]
+
+    def _get_cached_tree(self, key, get_tree):
+        """
+        If a cache_dir is set, load the tree from the cache or parse it and add it to the cache.
+        Trees are saved as parsed, before any data is filled in.
+        """
+        t_start = time.perf_counter()
+
+        if self.cache_dir is None:
+            tree = get_tree()
+        else:
+            tree = tree_cache.load_tree(self.cache_dir, self._cache_key, key)
+            if tree is False:
+                tree = get_tree()
+                tree_cache.save_tree(self.cache_dir, self._cache_key, key, tree, self.max_cache_bytes)
+
+        self.tree_parse_times[key] = time.perf_counter() - t_start
+
+        return tree
+
+    def _parse_trees_concurrently(self):
+        """
+        Parse all trees at once (only the pulse tree for versions before 2x90), each tree in its own thread or
+        process (see `parallel` in __init__()). The bundle items are independent byte ranges of the file, so each task
+        reads its tree with its own file handle. The other trees are stored as if they had been accessed, and the
+        pulse tree returned.
+        """
+        keys = ["pul"] if self.version in OLD_VERSIONS else TREE_KEYS
+        Executor = ThreadPoolExecutor if self.parallel == "thread" else ProcessPoolExecutor
+
+        with Executor(max_workers=len(keys)) as executor:
+            futures = {key: executor.submit(_parse_tree_task, self._get_worker(), key) for key in keys}
+
+            for key, future in futures.items():
+                tree, seconds, read_stats = future.result()
+
+                self._lazy_trees[key] = tree
+                self.tree_parse_times[key] = seconds
+                for stat in self.read_stats:
+                    self.read_stats[stat] += read_stats[stat]
+
+        return self._lazy_trees.pop("pul")
+
+    def _get_worker(self):
+        """
+        Copy of this object with no file handle or trees, for parsing a tree in another thread or process,
+        see _parse_tree_task().
+        """
+        worker = copy.copy(self)
+        worker.fh = None
+        worker.mmap = None
+        worker.pul = worker.pul_index = None
+        worker._lazy_trees = {}
+        worker.read_stats = {"num_reads": 0, "num_bytes": 0}
+        worker.tree_parse_times = {}
+
+        return worker
+
+    def _get_cache_options(self):
+        """
+        Options that change the parsed trees, included in the cache key
+        """
+        fields = None if self.fields is None else sorted((key, sorted(val)) for key, val in self.fields.items())
+        return (fields, self.scan_mode, self.compact)
 
     def _get_header(self):
         """ """
-        self.fh.seek(0)
-        header = self._unpack_header(BundleHeader())
+        buffer = self._read(0, BundleHeader().size)
+        header = self._unpack_header(buffer, BundleHeader())
 
         if not header["oIsLittleEndian"]:
             raise BaseException("Big endian on the header not tested ")
-            self.fh.seek(0)
-            header = self._unpack_header(BundleHeader(), ">")
+            header = self._unpack_header(buffer, BundleHeader(), ">")
 
         return header
 
@@ -104,47 +338,46 @@ class LoadHeka:
         """ """
         pgf_start_bit, pgf_num_bits = self._get_start_bit(".pgf")
         if pgf_num_bits > 0:
-            pgf, pgf_sizes = self._unpack_tree(
-                pgf_start_bit,
-                self.Trees.StimRootRecord,
-                self.Trees.StimStimulationRecord,
-                self.Trees.StimChannelRecord,
-                self.Trees.StimStimSegmentRecord,
-                None,
-            )
-            assert self.fh.tell() == pgf_start_bit + pgf_num_bits
+            pgf, pgf_sizes = self._unpack_tree(pgf_start_bit, pgf_num_bits, *self._get_tree_levels(".pgf"))
 
             return pgf
 
     def _get_pul(self):
-        """ """
+        """
+        In scan_mode the tree is only unpacked to the series level (see _unpack_tree())
+        """
         pul_start_bit, pul_num_bits = self._get_start_bit(".pul")
         if pul_num_bits > 0:
             pul, pul_sizes = self._unpack_tree(
                 pul_start_bit,
-                self.Trees.PulseRootRecord,
-                self.Trees.GroupRecord,
-                self.Trees.PulSeriesRecord,
-                self.Trees.SweepRecord,
-                self.Trees.TraceRecord,
+                pul_num_bits,
+                *self._get_tree_levels(".pul"),
+                num_levels=3 if self.scan_mode else None,
             )
-            assert self.fh.tell() == pul_start_bit + pul_num_bits
 
             return pul
 
+    def _get_pul_index(self):
+        """
+        Build the offset index of the pulse tree, see TreeIndex.
+        """
+        pul_start_bit, pul_num_bits = self._get_start_bit(".pul")
+        if pul_num_bits > 0:
+            buffer = memoryview(self._read(pul_start_bit, pul_num_bits))
+
+            endian, levels, sizes, offset = self._get_magic_level_sizes(buffer)
+            descriptions = self._get_compiled_descriptions(endian, sizes, self._get_tree_levels(".pul"))
+
+            pul_index = tree_index.TreeIndex(buffer, offset, endian, sizes, descriptions)
+            assert pul_index.end == pul_num_bits, "Tree size does not match the length of the bundle item"
+
+            return pul_index
+
     def _get_amp(self):
         """ """
         amp_start_bit, amp_num_bits = self._get_start_bit(".amp")
         if amp_num_bits > 0:
-            amp, amp_sizes = self._unpack_tree(
-                amp_start_bit,
-                self.Trees.AmpRootRecord,
-                self.Trees.AmpSeriesRecord,
-                self.Trees.AmplStateRecord,
-                None,
-                None,
-            )
-            assert self.fh.tell() == amp_start_bit + amp_num_bits
+            amp, amp_sizes = self._unpack_tree(amp_start_bit, amp_num_bits, *self._get_tree_levels(".amp"))
 
             return amp
 
@@ -152,15 +385,7 @@ class LoadHeka:
         """ """
         sol_start_bit, sol_num_bits = self._get_start_bit(".sol")
         if sol_num_bits > 0:
-            sol, sol_sizes = self._unpack_tree(
-                sol_start_bit,
-                self.Trees.SolutionsRootRecord,
-                self.Trees.SolutionRecord,
-                self.Trees.ChemicalRecord,
-                None,
-                None,
-            )
-            assert self.fh.tell() == sol_start_bit + sol_num_bits
+            sol, sol_sizes = self._unpack_tree(sol_start_bit, sol_num_bits, *self._get_tree_levels(".sol"))
 
             return sol
 
@@ -170,8 +395,7 @@ class LoadHeka:
         """
         mrk_start_bit, mrk_num_bits = self._get_start_bit(".mrk")
         if mrk_start_bit > 0:
-            mrk, mrk_sizes = self._unpack_tree(mrk_start_bit, MarkerRootRecord, MarkerRecord, None, None, None)
-            assert self.fh.tell() == mrk_start_bit + mrk_num_bits
+            mrk, mrk_sizes = self._unpack_tree(mrk_start_bit, mrk_num_bits, *self._get_tree_levels(".mrk"))
 
             return mrk
 
@@ -179,13 +403,17 @@ class LoadHeka:
         """ """
         onl_start_bit, onl_num_bits = self._get_start_bit(".onl")
         if onl_num_bits > 0:
-            onl, onl_sizes = self._unpack_tree(
-                onl_start_bit, self.Trees.AnalRootRecord, self.Trees.MethodRecord, self.Trees.FunctionRecord, None, None
-            )
-            assert self.fh.tell() == onl_start_bit + onl_num_bits
+            onl, onl_sizes = self._unpack_tree(onl_start_bit, onl_num_bits, *self._get_tree_levels(".onl"))
 
             return onl
 
+    def _get_tree_levels(self, key):
+        """
+        Record descriptions of the five levels of a tree (from the root), None where the tree has fewer levels.
+        """
+        Levels = [self.Trees.records[name] for name in TREE_LEVELS[key]]
+        return Levels + [None] * (5 - len(Levels))
+
     def _get_start_bit(self, key):
         """ """
         for item in self.header["oBundleItems"]:
@@ -208,7 +436,7 @@ class LoadHeka:
     # Extract headers
     # ----------------------------------------------------------------------------------------------------------------------------------------------------
 
-    def _unpack_header(self, description, endian="<"):
+    def _unpack_header(self, buffer, description, endian="<", offset=0):
         """
         Unpack the header of a tree record,. See Trees_v9 or Trees_v1000 for the expected record entries and types and structure of the
         description superclass.
@@ -216,165 +444,308 @@ class LoadHeka:
         In short, struct.unpack will return a list of bytes and known types (fmts, see struct documentation) of total size
         description.size and split into each record entry (e.g. one integer, one double, 10s). We iterate through
         this list of bytes / types and decode each one at a time if required. Simple types (i.e. int, double)
-        will be decoded by struct. Sometimes we need to decode by a function, done in self._read_byte()
+        will be decoded by struct. Sometimes we need to decode by a function.
 
-        In some instances we need to decode with another tree record. In this case we pass to self._unpack_substruct()
-        which does pretty much the same thing, unpacking another byte array using this new class. These tree records are
-        recursive, and so self._unpack_substruct() can be called from within itself to unpack this recursive structure.
+        In some instances we need to decode with another tree record. These tree records are recursive, and so
+        are unpacked in the same way with their own compiled description.
+
+        The format, position of each entry and decoders are compiled once per Description class and reused,
+        see SharedTrees.CompiledDescription.
         """
-        items = struct.unpack(endian + description.get_fmt(), self.fh.read(description.size))
+        return get_compiled_description(description, endian).unpack(buffer, offset)[0]
 
-        header_dict = {}
-        i = 0
-        for entry in description.description:
+    # ----------------------------------------------------------------------------------------------------------------------------------------------------
+    # Unpack Tree Structure
+    # ----------------------------------------------------------------------------------------------------------------------------------------------------
 
-            name, fmt, decoder = self._get_entry_details(entry)
+    def _unpack_tree(self, start_bit, num_bits, Root, LevelTwo, LevelThree, LevelFour, LevelFive, num_levels=None):
+        """
+        Unpack a tree structure. See HEKA documentation (links in HekaLoader docstring) for their organisation.
+        The three is output as a dictionary, starting at the root level. Each level has two entries, "hd" and "ch".
+        "hd" is the header containing all relevant record entries, as described in Trees_9 or Trees_v1000.
+        "ch" is a list of children dicts (each with its own "hd" and "ch" entry. The only exception is the lowest record level,
+            which as "data" entry instead. TODO: this is for the pulse tree, but is kind of meaningless for other Trees.
 
-            # pull item(s) out of the list based on format string
-            if len(fmt) == 1 or fmt[-1] == "s":
-                item = items[i]
-                i += 1
-            else:
-                n = int(fmt[:-1])
-                item = items[i : i + n]
-                i += n
+        The whole tree is read from file in one go and then unpacked from memory, moving an offset through the buffer.
+        Here we iterate through each level, finding the number of children at each level and then iterating through
+        each one sequentially, unpacking the tree. The records of the lowest level (e.g. all traces of a sweep) are
+        stored one after the other, so the position of each run of these is only stored here. Once the tree is traversed,
+        all lowest-level records are unpacked at once (see CompiledDescription.unpack_records()) and split back into
+        their runs.
 
-            if self._decoder_is_class(decoder):
-                header_dict[name] = self._unpack_substruct(item, decoder, endian)
-            else:
-                header_dict[name] = self._read_byte(item, decoder, endian)
+        Each level is unpacked with its compiled description (see self._unpack_header()).
+
+        If num_levels is given, only that many levels (from the root) are unpacked. Records of lower levels are
+        skipped over using the record sizes of each level, without being decoded (see _skip_children()).
+        """
+        buffer = memoryview(self._read(start_bit, num_bits))
+
+        endian, levels, sizes, offset = self._get_magic_level_sizes(buffer)
+
+        descriptions = self._get_compiled_descriptions(
+            endian, sizes, [Root, LevelTwo, LevelThree, LevelFour, LevelFive]
+        )
+
+        nchilds_struct = struct.Struct(endian + "i")
+
+        tree = self._new_record(descriptions[0].unpack(buffer, offset)[0])
+        root_nchilds = nchilds_struct.unpack_from(buffer, offset + descriptions[0].size)[0]
+        offset += descriptions[0].size + 4
+
+        num_levels = len(descriptions) if num_levels is None else num_levels
+
+        runs = []
+        tree["ch"], offset = self._unpack_children(
+            buffer, offset, descriptions[:num_levels], 1, root_nchilds, nchilds_struct, runs, sizes
+        )
+        assert offset == num_bits, "Tree size does not match the length of the bundle item"
 
-        return header_dict
+        if num_levels < len(descriptions):
+            return tree, sizes
 
-    def _unpack_substruct(self, item, description, endian):
+        leaf_buffer = b"".join(buffer[start:stop] for __, start, stop in runs)
+
+        if self.compact:
+            table, nchilds = descriptions[-1].unpack_table(leaf_buffer, endian)
+            if len(descriptions) == 5:
+                table.columns["TrYUnit"] = [unit.upper() for unit in table.columns["TrYUnit"]]
+            headers = table.get_rows()
+        else:
+            headers, nchilds = descriptions[-1].unpack_records(leaf_buffer, endian)
+            if len(descriptions) == 5:
+                for header in headers:
+                    header["TrYUnit"] = header["TrYUnit"].upper()
+
+        assert not np.any(nchilds), "Records at the lowest level of the tree should not have children"
+
+        records = [self._new_record(header, is_data_level=len(descriptions) == 5) for header in headers]
+
+        i = 0
+        for children, start, stop in runs:
+            num_records = (stop - start) // (descriptions[-1].size + 4)
+            children.extend(records[i : i + num_records])
+            i += num_records
+
+        return tree, sizes
+
+    def _new_record(self, header, is_data_level=False):
         """
-        See _unpack_header()
+        Create a record of the tree, with "hd" and "ch" entries or "hd" and "data" for the lowest level of the
+        pulse tree. These are dicts or slotted records if self.compact.
         """
-        substruct = struct.unpack(endian + description.get_fmt(), item)
+        if self.compact:
+            return LeafRecord(header) if is_data_level else TreeRecord(header, [])
 
-        repeats = []
-        cnt = 0
-        assert len(substruct) == (description.n * len(description.description))
+        return {"hd": header, "data": None} if is_data_level else {"hd": header, "ch": []}
 
-        for repeat in range(description.n):
-            sub_array = {}
+    def _get_compiled_descriptions(self, endian, sizes, Levels):
+        """
+        Get the compiled description of each level of a tree (Levels that are None are not in the tree),
+        checking their size matches the size in the tree magic.
+        """
+        descriptions = [
+            self.Trees.get_compiled(Level.__name__, endian, self._get_fields(Level))
+            for Level in Levels
+            if Level is not None
+        ]
+        for description, size in zip(descriptions, sizes):
+            assert description.size == size
 
-            for entry in description.description:
+        return descriptions
 
-                name, fmt, decoder = self._get_entry_details(entry)
+    def _check_fields(self):
+        """
+        Check every record name in `fields` is a record of this file version and every entry name an entry of that
+        record, before any tree is parsed. The file is closed before raising.
+        """
+        if self.fields is None:
+            return
+
+        for record_name, entry_names in self.fields.items():
+            if record_name not in self.Trees.records:
+                self.close()
+                raise BaseException("{0} is not a record of version {1}".format(record_name, self.version))
+
+            record_entries = [entry[0] for entry in self.Trees.records[record_name]().description]
+            for entry_name in entry_names:
+                if entry_name not in record_entries:
+                    self.close()
+                    raise BaseException(
+                        "{0} is not an entry of {1} in version {2}".format(entry_name, record_name, self.version)
+                    )
+
+    def _get_fields(self, Level):
+        """
+        Get the entries to decode for a record class, if restricted with `fields` (see __init__()).
+        """
+        if self.fields is None or Level.__name__ not in self.fields:
+            return None
 
-                if self._decoder_is_class(decoder):
-                    sub_array[name] = self._unpack_substruct(substruct[cnt], decoder, endian)
-                else:
-                    sub_array[name] = self._read_byte(substruct[cnt], decoder, endian)
-                cnt += 1
+        return list(self.fields[Level.__name__]) + REQUIRED_FIELDS.get(Level.__name__, [])
 
-            repeats.append(sub_array)
+    def _unpack_children(self, buffer, offset, descriptions, level, nchilds, nchilds_struct, runs, sizes):
+        """
+        Unpack all children of a record starting at offset in the buffer, recursively unpacking their own children.
+        Returns the children and the offset after the last of them.
 
-        repeats = tuple(repeats)
-        return repeats
+        Children at the lowest level of the tree are stored as a single run of records, its start and
+        stop are appended to `runs` together with the (empty) list of children to fill once the runs
+        are unpacked. See _unpack_tree().
 
-    @staticmethod
-    def _decoder_is_class(decoder):
-        is_class = False if (decoder is None or callable(decoder)) else True
-        return is_class
+        If descriptions does not go down to this level, the children are skipped and not returned.
+        """
+        if level == len(descriptions):
+            return [], self._skip_children(buffer, offset, sizes, level, nchilds, nchilds_struct)
 
-    @staticmethod
-    def _get_entry_details(entry):
-        """ """
-        if len(entry) == 2:
-            name, fmt = entry
-            decoder = None
-        else:
-            name, fmt, decoder = entry
+        description = descriptions[level]
+        children = []
 
-        return name, fmt, decoder
+        if level == len(sizes) - 1:
+            stop = offset + (description.size + 4) * nchilds
+            runs.append((children, offset, stop))
+            return children, stop
 
-    @staticmethod
-    def _read_byte(item, decoder, endian):
-        """ """
-        if decoder in [get_stim_to_dac_id, get_data_kind]:
-            return decoder(item, endian)
-        if decoder:
-            return decoder(item)
-        else:
-            return item
+        for __ in range(nchilds):
 
-    # ----------------------------------------------------------------------------------------------------------------------------------------------------
-    # Unpack Tree Structure
-    # ----------------------------------------------------------------------------------------------------------------------------------------------------
+            child = self._new_record(description.unpack(buffer, offset)[0])
+            child_nchilds = nchilds_struct.unpack_from(buffer, offset + description.size)[0]
+            offset += description.size + 4
 
-    def _unpack_tree(self, start_bit, Root, LevelTwo, LevelThree, LevelFour, LevelFive):
+            child["ch"], offset = self._unpack_children(
+                buffer, offset, descriptions, level + 1, child_nchilds, nchilds_struct, runs, sizes
+            )
+
+            children.append(child)
+
+        return children, offset
+
+    def iter_records(self, tree=".pul"):
         """
-        Unpack a tree structure. See HEKA documentation (links in HekaLoader docstring) for their organisation.
-        The three is output as a dictionary, starting at the root level. Each level has two entries, "hd" and "ch".
-        "hd" is the header containing all relevant record entries, as described in Trees_9 or Trees_v1000.
-        "ch" is a list of children dicts (each with its own "hd" and "ch" entry. The only exception is the lowest record level,
-            which as "data" entry instead. TODO: this is for the pulse tree, but is kind of meaningless for other Trees.
+        Visit every record of a tree (by bundle item extension, e.g. ".pul", ".pgf") in order, without building the
+        tree. Yields (level, path, header) for each record, where level is 0 for the root, path is the tuple of child
+        indices from the root (e.g. (group_idx, series_idx, sweep_idx, trace_idx)) and header is the header dict.
 
-        Here we iterate through each level, finding the number of children at each level and then iterating through
-        each one sequentially, unpacking the tree.
+        Records are decoded one at a time as they are reached, following the same traversal as _unpack_tree().
+        The file must be open.
         """
-        endian, levels, sizes = self._get_magic_level_sizes(start_bit)
+        if self.version in OLD_VERSIONS and tree != ".pul":
+            return
 
-        tree = {"hd": self._unpack_header(Root()), "ch": []}
+        start_bit, num_bits = self._get_start_bit(tree)
+        if not num_bits:
+            return
 
-        root_nchilds = struct.unpack(endian + "i", self.fh.read(4))[0]
-        assert Root().size == sizes[0]
+        buffer = memoryview(self._read(start_bit, num_bits))
 
-        for i_level2 in range(root_nchilds):
+        endian, levels, sizes, offset = self._get_magic_level_sizes(buffer)
+        descriptions = self._get_compiled_descriptions(endian, sizes, self._get_tree_levels(tree))
+        nchilds_struct = struct.Struct(endian + "i")
 
-            this_level2 = {"hd": self._unpack_header(LevelTwo()), "ch": []}
-            level2_nchilds = struct.unpack(endian + "i", self.fh.read(4))[0]
-            assert LevelTwo().size == sizes[1]
+        yield 0, (), descriptions[0].unpack(buffer, offset)[0]
+        root_nchilds = nchilds_struct.unpack_from(buffer, offset + descriptions[0].size)[0]
 
-            for i_level3 in range(level2_nchilds):
+        offset = yield from self._iter_children(
+            buffer, offset + descriptions[0].size + 4, descriptions, 1, root_nchilds, nchilds_struct, ()
+        )
+        assert offset == num_bits, "Tree size does not match the length of the bundle item"
 
-                this_level3 = {"hd": self._unpack_header(LevelThree()), "ch": []}
-                level3_nchilds = struct.unpack(endian + "i", self.fh.read(4))[0]
-                assert LevelThree().size == sizes[2]
+    def _iter_children(self, buffer, offset, descriptions, level, nchilds, nchilds_struct, path):
+        """
+        Yield all children of a record (see iter_records()) starting at offset in the buffer, followed by their
+        own children. Returns the offset after the last of them.
+        """
+        description = descriptions[level]
 
-                for i_level4 in range(level3_nchilds):
+        for idx in range(nchilds):
 
-                    this_level4 = {"hd": self._unpack_header(LevelFour()), "ch": []}
-                    level4_nchilds = struct.unpack(endian + "i", self.fh.read(4))[0]
-                    assert LevelFour().size == sizes[3]
+            header = description.unpack(buffer, offset)[0]
+            child_nchilds = nchilds_struct.unpack_from(buffer, offset + description.size)[0]
+            offset += description.size + 4
 
-                    for i_level5 in range(level4_nchilds):
+            if level == 4:
+                header["TrYUnit"] = header["TrYUnit"].upper()
 
-                        this_record = {"hd": self._unpack_header(LevelFive()), "data": None}
-                        this_record["hd"]["TrYUnit"] = this_record["hd"]["TrYUnit"].upper()
+            yield level, path + (idx,), header
 
-                        record_childs = struct.unpack(endian + "i", self.fh.read(4))[0]
-                        assert record_childs == 0
+            if level == len(descriptions) - 1:
+                assert child_nchilds == 0, "Records at the lowest level of the tree should not have children"
+                continue
 
-                        this_level4["ch"].append(this_record)
+            offset = yield from self._iter_children(
+                buffer, offset, descriptions, level + 1, child_nchilds, nchilds_struct, path + (idx,)
+            )
 
-                    this_level3["ch"].append(this_level4)
+        return offset
 
-                this_level2["ch"].append(this_level3)
+    def _skip_children(self, buffer, offset, sizes, level, nchilds, nchilds_struct):
+        """
+        Return the offset after all children of a record (and their own children), without unpacking them.
+        Only the number of children of each record is read, records are jumped over using the level sizes.
+        """
+        if level == len(sizes) - 1:
+            return offset + (sizes[level] + 4) * nchilds
 
-            tree["ch"].append(this_level2)
+        for __ in range(nchilds):
+            offset += sizes[level]
+            child_nchilds = nchilds_struct.unpack_from(buffer, offset)[0]
+            offset = self._skip_children(buffer, offset + 4, sizes, level + 1, child_nchilds, nchilds_struct)
 
-        return tree, sizes
+        return offset
 
-    def _get_magic_level_sizes(self, start_bit):
+    def _get_magic_level_sizes(self, buffer):
         """
         The 'Magic' as described in the HEKA documentation is read from the first few bytes of the
         tree and contains its endianness, number of levels contained within it and sizes of each record.
+
+        Returns also the offset of the first record after the magic.
         """
-        self.fh.seek(start_bit)
-        magic = self.fh.read(4)
+        magic = bytes(buffer[:4])
         if magic == b"eerT":
             endian = "<"
         elif magic == b"Tree":
             endian = ">"
             raise BaseException("Big endian not tested yet")
 
-        levels = struct.unpack(endian + "i", self.fh.read(4))[0]
-        sizes = struct.unpack(endian + "i" * levels, self.fh.read(4 * levels))
+        levels = struct.unpack_from(endian + "i", buffer, 4)[0]
+        sizes = struct.unpack_from(endian + "i" * levels, buffer, 8)
+
+        return endian, levels, sizes, 8 + 4 * levels
+
+    def _read(self, start, num_bytes):
+        """
+        Read num_bytes from the file starting at start. All file reads for tree headers go through here
+        so the number of reads and bytes read can be checked in self.read_stats.
+
+        With backend="mmap" the buffer is a memoryview onto the mapping, so nothing is copied.
+
+        Trees other than the pulse tree are read on first access, so the file must still be open (see open()).
+        """
+        self._check_open()
+
+        if self.mmap is not None:
+            buffer = memoryview(self.mmap)[start : start + num_bytes]
+        else:
+            self.fh.seek(start)
+            buffer = self.fh.read(num_bytes)
+
+        self.read_stats["num_reads"] += 1
+        self.read_stats["num_bytes"] += len(buffer)
+
+        return buffer
 
-        return endian, levels, sizes
+    def _get_data_file(self):
+        """
+        The open file to read trace data from, or the memory-mapped file with backend="mmap". Looked up by the
+        TraceData of the pulse tree each time data is read (see data_reader.fill_pul_with_data()), so data is read
+        from the file currently open.
+        """
+        self._check_open()
+
+        return self.fh if self.mmap is None else self.mmap
+
+    def _check_open(self):
+        if self.fh is None:
+            raise BaseException("File is closed, call open() before accessing the tree or data")
 
     def get_stimulus_for_series(self, group_idx, series_idx, experimental_mode, stim_channel_idx):
 
@@ -409,6 +780,8 @@ class LoadHeka:
         fill_with_mean=False,
         add_zero_offset=True,
         stim_channel_idx=None,
+        raw=False,
+        dtype="float64",
     ):
         """
         Convenience function to extract Im or Vm channel data from a series. If the data has not already been loaded into memory,
@@ -440,6 +813,12 @@ class LoadHeka:
             stim_channel_index - if `None`, the first stimulus channel with a non-zero seVoltage field will be used. Otherwise,
                                  this can be manually specified with an integer index.
 
+            raw - if `True`, "data" holds the samples as stored in the file (e.g. int16) without scaling, with the
+                  per-sweep "scales" and "offsets" arrays to scale them (data * scale - offset). Shorter sweeps are padded
+                  with zero for integer samples. Uses 4x less memory than the scaled float64 data for int16 samples.
+
+            dtype - "float64" (default) or "float32", the type of the scaled "data". Ignored if raw is `True`.
+
         OUTPUTS:
             dictionary of parameters (see out below). For each sweep, the parameter value is appended to a list.
 
@@ -451,6 +830,9 @@ class LoadHeka:
             stim protocol for the series. see stim_reader.py for details on supported stimulation protocols. If the StimTree cannot
             be reconstructed a warning will be shown and the field False.
         """
+        assert not self.scan_mode, "Series data cannot be loaded from a file opened with scan_mode=True"
+        assert np.dtype(dtype) in [np.float64, np.float32], "dtype must be 'float64' or 'float32'"
+
         series = self.pul["ch"][group_idx]["ch"][series_idx]
 
         out = {
@@ -467,13 +849,23 @@ class LoadHeka:
             "stim": None,
             "sampling_step": [],
             "zero_offsets": [],
-            "dtype": "float64",  # note this is after processing (not the original stored data)
+            "dtype": np.dtype(dtype).name,  # note this is after processing (not the original stored data)
         }
 
         num_rows = len(series["ch"])
         max_num_samples = self._get_max_num_samples_from_sweeps_in_series(series["ch"])
 
-        data_reader.fill_pul_with_data(self.pul, self.fh, group_idx, series_idx, add_zero_offset)
+        data_reader.fill_pul_with_data(
+            self.pul,
+            self._get_data_file,
+            group_idx,
+            series_idx,
+            add_zero_offset,
+            read_stats=self.data_read_stats,
+        )
+        channel_traces = [sweep["ch"][channel_idx]["data"] for sweep in series["ch"]]
+        load_samples = raw or np.dtype(dtype) != np.float64
+        data_reader.load_trace_data(channel_traces, max_gap=self.max_read_gap, raw=load_samples)
 
         if include_stim_protocol:
             out["stim"] = self.get_stimulus_for_series(
@@ -483,8 +875,19 @@ class LoadHeka:
                 stim_channel_idx=stim_channel_idx,
             )
 
-        for key in ["data", "time"]:
-            out[key] = np.full([num_rows, max_num_samples], np.nan)
+        out["time"] = np.full([num_rows, max_num_samples], np.nan)
+
+        if raw:
+            __, __, sample_dtype, out["dtype"] = data_reader.get_dataformat(
+                series["ch"][0]["ch"][channel_idx]["hd"]["TrDataFormat"]
+            )
+            out["data"] = np.zeros([num_rows, max_num_samples], dtype=sample_dtype)
+            if np.issubdtype(sample_dtype, np.floating):
+                out["data"][:] = np.nan
+            out["scales"] = np.empty(num_rows)
+            out["offsets"] = np.empty(num_rows)
+        else:
+            out["data"] = np.full([num_rows, max_num_samples], np.nan, dtype=dtype)
 
         for sweep_idx, sweep in enumerate(series["ch"]):
 
@@ -519,10 +922,30 @@ class LoadHeka:
 
             out["time"][sweep_idx, :] = np.arange(max_num_samples) * ts + t_start
 
-            out["data"][sweep_idx, 0:num_samples] = sweep["ch"][channel_idx]["data"]
+            if load_samples:
+                rec = sweep["ch"][channel_idx]
+                samples = rec["data"].load_samples()
+
+                if raw:
+                    assert (
+                        samples.dtype == out["data"].dtype
+                    ), "Sample types that differ across sweeps are not supported."
+                    out["scales"][sweep_idx], out["offsets"][sweep_idx] = data_reader.get_scale_and_offset(
+                        rec, add_zero_offset
+                    )
+                    sweep_data = samples
+                else:
+                    sweep_data = data_reader.scale_samples(rec, samples, add_zero_offset, np.dtype(dtype).type)
+            else:
+                sweep_data = sweep["ch"][channel_idx]["data"]
+
+            out["data"][sweep_idx, 0:num_samples] = sweep_data
 
-            if len(sweep["ch"][channel_idx]["data"]) < max_num_samples:
-                fill = np.mean(sweep["ch"][channel_idx]["data"]) if fill_with_mean else np.nan
+            if len(sweep_data) < max_num_samples:
+                if fill_with_mean:
+                    fill = np.mean(sweep_data)
+                else:
+                    fill = 0 if np.issubdtype(out["data"].dtype, np.integer) else np.nan
                 out["data"][sweep_idx, num_samples:] = fill
 
         for key in out.keys():
@@ -570,6 +993,32 @@ class LoadHeka:
 
         return groups_and_series
 
+    def trace_table(self):
+        """
+        Return a columnar table of all traces in the file, a dict of numpy arrays with one entry per trace for
+        each TraceRecord entry, the trace position ("group_idx", "series_idx", "sweep_idx", "trace_idx") and the
+        entries of its series and sweep. See readers/trace_table.py.
+
+        The file must be open the first time this is called. The table is built from the pulse tree index (see
+        use_index in __init__()), which is built here if the file was not opened with use_index. The table is kept,
+        later calls return a new dict of the same arrays.
+        """
+        if self._trace_table is None:
+            pul_index = self.pul_index if self.pul_index is not None else self._get_pul_index()
+            self._trace_table = trace_table.get_trace_table(pul_index)
+
+        return dict(self._trace_table)
+
+    def get_sweep_param_violations(self, table=None):
+        """
+        Check that parameters expected to be the same across all sweeps of a series (e.g. TrDataScaler, TrXInterval)
+        are so for every series in the file. Returns a list of all violations, see
+        data_reader.get_sweep_param_violations().
+
+        table - the trace table to check, by default self.trace_table().
+        """
+        return data_reader.get_sweep_param_violations(self.trace_table() if table is None else table)
+
     def get_num_sweeps_in_series(self, group_idx, series_idx):
         return self.pul["ch"][group_idx]["ch"][series_idx]["hd"]["SeNumberSweeps"]
 
@@ -579,19 +1028,49 @@ class LoadHeka:
 
         Note that not all series may have all channels.
         """
-        channels = data_reader.get_channel_parameters_across_all_series(self.pul, group_idx)
+        if group_idx not in self._channel_index["groups"]:
+            num_series = len(self.pul["ch"][group_idx]["ch"])
+            all_series_channels = [self._get_indexed_series_channels(group_idx, idx) for idx in range(num_series)]
+
+            self._channel_index["groups"][group_idx] = data_reader.get_channel_parameters_from_series_channels(
+                all_series_channels
+            )
+
+        channels = [dict(channel) for channel in self._channel_index["groups"][group_idx]]
         return channels
 
     def get_series_channels(self, group_idx, series_idx):
-        channels = data_reader.get_series_channels(self.pul, group_idx, series_idx)
+        channels = [dict(channel) for channel in self._get_indexed_series_channels(group_idx, series_idx)]
         return channels
 
+    def _get_indexed_series_channels(self, group_idx, series_idx):
+        """
+        Channel summaries (see data_reader.get_series_channels()) are computed on first use for each series and group
+        and stored in self._channel_index, so later calls to get_channels() and get_series_channels() are lookups.
+        Copies of the stored channel dicts are returned to the user.
+        """
+        key = (group_idx, series_idx)
+        if key not in self._channel_index["series"]:
+            self._channel_index["series"][key] = data_reader.get_series_channels(self.pul, group_idx, series_idx)
+
+        return self._channel_index["series"][key]
+
     # Close file -----------------------------------------------------------------------------------------------------------------------------------------
 
     def open(self):
         assert not self.fh, "File already open. Use close() before open()"
         self.fh = open(self.full_filepath, "rb")
 
+        if self.backend == "mmap":
+            self.mmap = mmap.mmap(self.fh.fileno(), 0, access=mmap.ACCESS_READ)
+
     def close(self):
+        if self.mmap is not None:
+            try:
+                self.mmap.close()
+            except BufferError:  # still referenced by views (e.g. use_index), unmapped once these are deleted
+                pass
+            self.mmap = None
+
         self.fh.close()
         self.fh = None
@@ -1,71 +1,317 @@
 import copy
+import mmap
 import numpy as np
-import struct
+from numpy.lib.mixins import NDArrayOperatorsMixin
 import warnings
 
+# Records at most this many bytes apart on disk are read together in one read (see plan_reads()). The gap between the
+# records of one channel usually holds the data of the other channels, so by default only adjacent or overlapping
+# (interleaved) records are read together and no unrequested data is read.
+DEFAULT_MAX_READ_GAP = 0
 
-def fill_pul_with_data(pul, fh, group_idx, series_idx, add_zero_offset):
+
+def fill_pul_with_data(pul, get_file, group_idx, series_idx, add_zero_offset, read_stats=None):
     """
-    Fill the ["data"] field of all pulse tree records for the specified group and series with raw data from file.
+    Fill the ["data"] field of all pulse tree records for the specified group and series with a TraceData, which
+    reads the raw data from file the first time it is used.
 
     The record header contains the starting bit of the raw data, and parameters for its reconstruction.
+
+    Nothing is read here. To read the data of many records together with the fewest reads possible (see
+    plan_reads()), pass their TraceData to load_trace_data().
+
+    get_file - function returning the open file to read from, or a memory-mapped file (LoadHeka(...,
+               backend="mmap")) in which case samples are read as views onto the mapping, see read_samples().
+               Called each time data is read, so data can be read after the file is closed and opened again
+               (see LoadHeka._get_data_file()).
+
+    read_stats - optional dict with "num_seeks", "num_reads" and "num_bytes" entries, incremented with the reads made.
     """
     series = pul["ch"][group_idx]["ch"][series_idx]
 
-    if np.any(series["ch"][0]["ch"][0]["data"]):
+    if series["ch"][0]["ch"][0]["data"] is not None:
         warnings.warn("Data already exists for the passed group, series index. Overwriting...")
 
     for sweep in series["ch"]:
         for rec in sweep["ch"]:
+            rec["data"] = TraceData(rec, get_file, add_zero_offset, read_stats)
+
+
+def load_trace_data(traces, max_gap=DEFAULT_MAX_READ_GAP, raw=False):
+    """
+    Read and scale the data of all TraceData in traces that are not yet loaded (e.g. one channel of every sweep
+    of a series), with the reads planned for all of them together (see read_records()).
+
+    max_gap - records up to this many bytes apart on disk are read together, reading the bytes in between.
+
+    raw - if True, only read the samples as stored (see TraceData.load_samples()) without scaling them.
+    """
+    if not raw:
+        for trace in traces:
+            if trace.has_samples:
+                trace.load()  # scaled from the samples already read
+
+    traces = [trace for trace in traces if not (trace.has_samples if raw else trace.is_loaded)]
+    if not traces:
+        return
+
+    get_file, read_stats = traces[0].get_file, traces[0].read_stats
+    assert all(trace.get_file == get_file for trace in traces), "TraceData must be from the same file"
+
+    buffers = read_records(get_file(), [trace.rec for trace in traces], read_stats, max_gap)
+
+    for trace, (raw_bytes, offset) in zip(traces, buffers):
+        samples = get_record_samples(trace.rec, raw_bytes, offset)
+
+        if raw:
+            trace._samples = samples
+        else:
+            trace._data = scale_samples(trace.rec, samples, trace.add_zero_offset)
+
+
+def get_record_samples(rec, raw, offset):
+    """
+    Take the samples of a trace record, as stored (e.g. int16), from the raw bytes holding it starting offset bytes in.
+    """
+    length = rec["hd"]["TrDataPoints"]
+    data_kind = rec["hd"]["TrDataKind"]
+
+    endian = "<" if data_kind["IsLittleEndian"] else ">"
+
+    __, size, np_dtype, __ = get_dataformat(rec["hd"]["TrDataFormat"])
+    sample_dtype = np.dtype(np_dtype).newbyteorder(endian)
+
+    interleave_size = rec["hd"]["TrInterleaveSize"]
+    if interleave_size != 0:
+        assert interleave_size % size == 0, "`size` does not divide " "evenly `interleave size"
+
+        batch_size = int(interleave_size / size)
+
+        assert length % batch_size == 0, "`length` does not divide " "evenly `batch_size size"
+
+        samples = take_interleaved_samples(
+            raw, offset, length, sample_dtype, interleave_size, rec["hd"]["TrInterleaveSkip"]
+        )
+    else:
+        samples = np.frombuffer(raw, dtype=sample_dtype, count=length, offset=offset)
+
+    run_checks(rec, samples, data_kind)
+
+    return samples
 
-            # Just make sure whatever happens, any existing
-            # data is cleared to avoid confusion.
-            rec["data"] = None
 
-            start = rec["hd"]["TrData"]
-            length = rec["hd"]["TrDataPoints"]
-            data_kind = rec["hd"]["TrDataKind"]
+def get_scale_and_offset(rec, add_zero_offset):
+    """
+    Scale and offset of the samples of a trace record, data = samples * scale - offset. Only integer samples are
+    scaled with TrDataScaler.
+    """
+    __, __, np_dtype, __ = get_dataformat(rec["hd"]["TrDataFormat"])
+
+    scale = rec["hd"]["TrDataScaler"] if np_dtype in [np.int16, np.int32] else 1.0
+    offset = rec["hd"]["TrZeroData"] if add_zero_offset else 0.0
+
+    return scale, offset
+
+
+def scale_samples(rec, samples, add_zero_offset, dtype=np.float64):
+    """
+    Scale the samples of a trace record (see get_scale_and_offset()) to dtype, float64 by default.
+    """
+    scale, offset = get_scale_and_offset(rec, add_zero_offset)
+
+    data = samples.astype(dtype)
+    if scale != 1.0:
+        data *= dtype(scale)
+
+    if add_zero_offset:
+        data -= dtype(offset)
+
+    return data
+
+
+class TraceData(NDArrayOperatorsMixin):
+    """
+    Data of a trace record (its ["data"] entry, see fill_pul_with_data()), read from file and scaled the first time
+    it is used as an array, e.g. with np.asarray(), indexing, arithmetic or ndarray attributes and methods (.shape,
+    .mean()), after which it is kept. Only the data of traces that are used is read. The number of samples (len())
+    is known without reading. It is not an ndarray instance, use np.asarray() where one is required.
 
-            endian = "<" if data_kind["IsLittleEndian"] else ">"
+    The samples as stored (e.g. int16) are available unscaled with load_samples().
 
-            fmt, size, np_dtype, __ = get_dataformat(rec["hd"]["TrDataFormat"])
+    The file is looked up with get_file() when the data is read, so it must be open when the data is first used
+    (see fill_pul_with_data()).
+    """
 
-            interleave_size = rec["hd"]["TrInterleaveSize"]
-            if interleave_size != 0:
-                assert interleave_size % size == 0, "`size` does not divide " "evenly `interleave size"
+    __slots__ = ("rec", "get_file", "add_zero_offset", "read_stats", "_data", "_samples")
 
-                batch_size = int(interleave_size / size)
+    def __init__(self, rec, get_file, add_zero_offset, read_stats=None):
+        self.rec = rec
+        self.get_file = get_file
+        self.add_zero_offset = add_zero_offset
+        self.read_stats = read_stats
+        self._data = None
+        self._samples = None
 
-                assert length % batch_size == 0, "`length` does not divide " "evenly `batch_size size"
-                n_batches = int(length / batch_size)
+    @property
+    def is_loaded(self):
+        return self._data is not None
 
-                data = np.zeros((n_batches * batch_size)).astype(np_dtype)
+    @property
+    def has_samples(self):
+        return self._samples is not None
 
-                for chunk in range(n_batches):
-                    fh.seek(start)
-                    chunk_data = struct.unpack(endian + fmt * batch_size, fh.read(size * batch_size))
-                    data[chunk * batch_size : chunk * batch_size + batch_size] = np.array(chunk_data, dtype=np_dtype)
-                    start += rec["hd"]["TrInterleaveSkip"]
+    def load(self):
+        if self._data is None:
+            if self._samples is not None:
+                self._data = scale_samples(self.rec, self._samples, self.add_zero_offset)
             else:
-                fh.seek(start)
-                data = struct.unpack(endian + fmt * length, fh.read(size * length))
-                data = np.array(data, dtype=np_dtype)
+                load_trace_data([self])
+        return self._data
+
+    def load_samples(self):
+        """
+        Samples as stored in the file, unscaled (see get_scale_and_offset()). These are not kept once read.
+        """
+        if self._samples is not None:
+            return self._samples
+
+        load_trace_data([self], raw=True)
+        samples, self._samples = self._samples, None
+
+        return samples
+
+    def __array__(self, dtype=None, copy=None):
+        return np.asarray(self.load(), dtype=dtype)
+
+    def __array_ufunc__(self, ufunc, method, *inputs, **kwargs):
+        inputs = [item.load() if isinstance(item, TraceData) else item for item in inputs]
+        return getattr(ufunc, method)(*inputs, **kwargs)
+
+    def __getattr__(self, name):
+        """
+        Forward ndarray attributes and methods (e.g. .shape, .dtype, .mean(), .copy()) to the loaded data. Slots
+        that are not yet set (e.g. while copying) and special names (probed by numpy, copy and pickle) are not
+        forwarded, so probing them does not read the data.
+        """
+        if name in TraceData.__slots__ or name.startswith("__"):
+            raise AttributeError(name)
+        return getattr(self.load(), name)
+
+    def __len__(self):
+        return self.rec["hd"]["TrDataPoints"]
+
+    def __getitem__(self, idx):
+        return self.load()[idx]
+
+    def __reduce__(self):
+        """
+        The file cannot be pickled (or copied), so the data is passed as an array.
+        """
+        return np.asarray, (self.load(),)
+
+    def __repr__(self):
+        return "TraceData({0}, {1} samples, {2})".format(
+            self.rec["hd"]["TrLabel"], len(self), "loaded" if self.is_loaded else "not loaded"
+        )
+
+
+def read_records(fh, recs, read_stats=None, max_gap=DEFAULT_MAX_READ_GAP):
+    """
+    Read the data of trace records with the reads planned by plan_reads(), e.g. consecutive sweeps stored one after
+    the other are read at once, as are records recorded together in interleaved blocks.
 
-            # Scale and recast to float64
-            if np_dtype in [np.int16, np.int32]:
-                scaling_factor = np.array(rec["hd"]["TrDataScaler"], dtype=np.float64)
+    Returns, for each record, the (raw bytes of the read holding its data, offset of its data in them). Records with
+    no data are not read.
+    """
+    ranges = [get_record_range(rec) + (rec_idx,) for rec_idx, rec in enumerate(recs)]
+
+    buffers = [(b"", 0)] * len(recs)
+    ranges = [data_range for data_range in ranges if data_range[1] > data_range[0]]
+    previous_stop = None
+    for start, stop, rec_idxs in plan_reads(ranges, max_gap):
+        raw = read_samples(fh, start, stop - start, np.dtype(np.uint8))
+
+        if read_stats is not None:
+            read_stats["num_seeks"] += start != previous_stop
+            read_stats["num_reads"] += 1
+            read_stats["num_bytes"] += stop - start
+        previous_stop = stop
+
+        for rec_idx in rec_idxs:
+            buffers[rec_idx] = (raw, recs[rec_idx]["hd"]["TrData"] - start)
+
+    return buffers
+
+
+def plan_reads(ranges, max_gap=DEFAULT_MAX_READ_GAP):
+    """
+    Plan the reads for a set of (start, stop, idx) byte ranges. Ranges are sorted by start and merged with the
+    previous range when they overlap it or start at most max_gap bytes after its end, so nearby data is read
+    sequentially in a few large reads. Returns a list of (start, stop, [idx, ...]) reads in order of start.
+    """
+    reads = []
+    for start, stop, idx in sorted(ranges):
+        if reads and start <= reads[-1][1] + max_gap:
+            reads[-1][1] = max(reads[-1][1], stop)
+            reads[-1][2].append(idx)
+        else:
+            reads.append([start, stop, [idx]])
+
+    return [tuple(read) for read in reads]
+
+
+def get_record_range(rec):
+    """
+    Start and stop byte of the data of a trace record, for interleaved records from the start of the first block
+    to the end of the last.
+    """
+    __, size, __, __ = get_dataformat(rec["hd"]["TrDataFormat"])
+    start = rec["hd"]["TrData"]
+
+    if rec["hd"]["TrInterleaveSize"] != 0:
+        num_bytes = get_interleaved_span_size(
+            rec["hd"]["TrDataPoints"], size, rec["hd"]["TrInterleaveSize"], rec["hd"]["TrInterleaveSkip"]
+        )
+    else:
+        num_bytes = rec["hd"]["TrDataPoints"] * size
+
+    return start, start + num_bytes
+
+
+def read_samples(fh, start, length, dtype):
+    """
+    Read length samples of dtype (including byte order) starting at byte start, decoded directly from the
+    read buffer with np.frombuffer. For a memory-mapped file the samples are a read-only view onto the
+    mapping (no copy is made until the data is scaled).
+    """
+    if isinstance(fh, mmap.mmap):
+        return np.frombuffer(fh, dtype=dtype, count=length, offset=start)
 
-                data = data * scaling_factor
+    fh.seek(start)
+    return np.frombuffer(fh.read(dtype.itemsize * length), dtype=dtype, count=length)
 
-            elif np_dtype == np.float32:
-                data = data.astype(np.float64)
 
-            if add_zero_offset:
-                data -= rec["hd"]["TrZeroData"]
+def get_interleaved_span_size(length, sample_size, interleave_size, interleave_skip):
+    """
+    Number of bytes from the start of the first block to the end of the last block of an interleaved record.
+    """
+    n_blocks = length * sample_size // interleave_size
+    return (n_blocks - 1) * interleave_skip + interleave_size if n_blocks else 0
 
-            rec["data"] = data
 
-            run_checks(rec, data, data_kind)
+def take_interleaved_samples(raw, offset, length, dtype, interleave_size, interleave_skip):
+    """
+    Take the blocks of an interleaved record, starting offset bytes into raw, with a strided view and copy them
+    out together as samples of dtype.
+    """
+    n_blocks = length * dtype.itemsize // interleave_size
+    raw = np.frombuffer(raw, dtype=np.uint8)[offset:]
+
+    blocks = np.lib.stride_tricks.as_strided(
+        raw, shape=(n_blocks, interleave_size), strides=(interleave_skip, 1), writeable=False
+    )
+
+    return np.ascontiguousarray(blocks).view(dtype).ravel()
 
 
 def run_checks(rec, data, data_kind):
@@ -112,6 +358,14 @@ def get_channel_parameters_across_all_series(pul, group_idx):
 
         all_series_channels.append(get_series_channels(pul, group_idx, series_idx))
 
+    return get_channel_parameters_from_series_channels(all_series_channels)
+
+
+def get_channel_parameters_from_series_channels(all_series_channels):
+    """
+    Combine the channels of all series in a group (each from get_series_channels()), taking the channel
+    parameters from the first series that has the channel.
+    """
     results = []
     for series_channel in all_series_channels:
         for channel_idx, channel in enumerate(series_channel):
@@ -175,10 +429,19 @@ def get_max_num_channels_in_series(pul, group_idx, series_idx):
     return max_channels
 
 
+# Parameters expected to be the same for a record across all sweeps of a series (may differ between records)
+PARAMS_EQUAL_PER_RECORD = ["TrDataScaler", "TrYUnit", "TrDataFormat", "TrAdcChannel", "TrRecordingMode"]
+
+# Parameters expected to be the same for all records of all sweeps of a series
+PARAMS_EQUAL_ALL_RECORDS = ["TrXUnit", "TrXInterval", "TrCellPotential"]
+
+
 def check_sweep_params_are_equal_for_every_series_in_file(pul):
     """
     Check that parameters assumed to be the same across a series (within within or between Im and Vm records) are so
     for all series (but not necessarily between series or groups)
+
+    See get_sweep_param_violations() to run the same checks on the whole file at once and report all violations.
     """
     for group_idx, group in enumerate(pul["ch"]):
         for series_idx, series in enumerate(group["ch"]):
@@ -187,14 +450,85 @@ def check_sweep_params_are_equal_for_every_series_in_file(pul):
             assert (
                 len(recs_in_sweeps) == 1
             ), "number of recs is not equal for al sweeps in group: {0}, series: {1}".format(group_idx, series_idx)
-            for param_key in ["TrDataScaler", "TrYUnit", "TrDataFormat", "TrAdcChannel", "TrRecordingMode"]:
+            for param_key in PARAMS_EQUAL_PER_RECORD:
                 for rec_idx in range(recs_in_sweeps[0]):
                     check_sweep_params_are_equal(pul, group_idx, series_idx, rec_idx, param_key)
 
-            for param_key in ["TrXUnit", "TrXInterval", "TrCellPotential"]:
+            for param_key in PARAMS_EQUAL_ALL_RECORDS:
                 check_sweep_params_are_equal(pul, group_idx, series_idx, "all", param_key)
 
 
+def get_sweep_param_violations(table):
+    """
+    Vectorised version of check_sweep_params_are_equal_for_every_series_in_file() on a trace table
+    (see readers/trace_table.py). Every check is run for all series at once by grouping the table rows
+    by series (and record), rather than series by series.
+
+    Returns a list of violations, each a dict with:
+        "group_idx", "series_idx" - the series that fails the check.
+        "rec_idx" - index of the record within the sweep, or "all" where all records are checked together.
+        "param" - the parameter that differs, or "num_recs" if the number of records differs between sweeps.
+        "values" - the different values found.
+    """
+    new_series = np.ones(len(table["group_idx"]), dtype=bool)
+    new_series[1:] = (np.diff(table["group_idx"]) != 0) | (np.diff(table["series_idx"]) != 0)
+    series_ids = np.cumsum(new_series) - 1
+    series_first_rows = np.flatnonzero(new_series)
+
+    new_sweep = new_series | np.r_[False, np.diff(table["sweep_idx"]) != 0]
+    recs_in_sweeps = np.bincount(np.cumsum(new_sweep) - 1)
+
+    # key for each (series, record) pair
+    num_recs = int(table["trace_idx"].max()) + 1 if len(table["trace_idx"]) else 1
+    series_rec_ids = series_ids * num_recs + table["trace_idx"]
+
+    violations = []
+    for series_id, values in get_groups_with_unequal_values(series_ids[new_sweep], recs_in_sweeps):
+        violations.append(get_violation(table, series_first_rows[series_id], "all", "num_recs", values))
+
+    for param in PARAMS_EQUAL_PER_RECORD:
+        for series_rec_id, values in get_groups_with_unequal_values(series_rec_ids, table[param]):
+            series_id, rec_idx = divmod(series_rec_id, num_recs)
+            violations.append(get_violation(table, series_first_rows[series_id], rec_idx, param, values))
+
+    for param in PARAMS_EQUAL_ALL_RECORDS:
+        for series_id, values in get_groups_with_unequal_values(series_ids, table[param]):
+            violations.append(get_violation(table, series_first_rows[series_id], "all", param, values))
+
+    return violations
+
+
+def get_violation(table, row, rec_idx, param, values):
+    return {
+        "group_idx": int(table["group_idx"][row]),
+        "series_idx": int(table["series_idx"][row]),
+        "rec_idx": rec_idx,
+        "param": param,
+        "values": values,
+    }
+
+
+def get_groups_with_unequal_values(group_keys, values):
+    """
+    For integer group_keys and values of the same length, return (key, unique values) for every group key
+    whose values are not all the same. NaN values are considered equal.
+    """
+    if len(values) == 0:
+        return []
+
+    unique_values, value_codes = np.unique(values, return_inverse=True)
+    value_codes = value_codes.ravel()
+
+    unique_pairs = np.unique(group_keys.astype(np.int64) * len(unique_values) + value_codes)
+    pair_keys = unique_pairs // len(unique_values)
+
+    unequal_keys = np.unique(pair_keys[np.r_[False, np.diff(pair_keys) == 0]])
+
+    return [
+        (int(key), unique_values[unique_pairs[pair_keys == key] % len(unique_values)].tolist()) for key in unequal_keys
+    ]
+
+
 def check_sweep_params_are_equal(pul, group_idx, series_idx, rec_idx, param_key):
     """
     Determine whether all records for all sweeps in a series have the same parameters. For some these are expected to be
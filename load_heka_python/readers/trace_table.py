@@ -0,0 +1,73 @@
+import numpy as np
+from ..trees.SharedTrees import BitFlags
+
+GROUP_LEVEL, SERIES_LEVEL, SWEEP_LEVEL, TRACE_LEVEL = 1, 2, 3, 4
+
+# ----------------------------------------------------------------------------------------------------------------------------------------------------
+# Trace Table
+# ----------------------------------------------------------------------------------------------------------------------------------------------------
+
+
+def get_trace_table(pul_index):
+    """
+    Columnar table of all traces in the pulse tree, built from its offset index (see TreeIndex).
+
+    Returns a dict of column name to a numpy array with one entry per trace, in tree order:
+        "group_idx", "series_idx", "sweep_idx", "trace_idx" - position of the trace in the pulse tree.
+        TraceRecord entries, followed by the PulSeriesRecord and SweepRecord entries of the trace's series and sweep.
+
+    Numeric entries are numeric arrays, strings are str arrays, bit options (e.g. TrDataKind) integer arrays
+    of their flags and all other decoded entries object arrays. Traces can be selected with boolean masks over
+    the columns, e.g. (table["TrXInterval"] == 2e-05) & (table["TrDataPoints"] > 500000) or
+    (table["TrDataKind"] & DataKind.IsLeak) > 0.
+    """
+    sweep_rows = pul_index.get_parent_rows(TRACE_LEVEL)
+    series_rows = pul_index.get_parent_rows(SWEEP_LEVEL)[sweep_rows]
+    group_rows = pul_index.get_parent_rows(SERIES_LEVEL)[series_rows]
+
+    table = {
+        "group_idx": group_rows,
+        "series_idx": series_rows - pul_index.first_child[GROUP_LEVEL][group_rows],
+        "sweep_idx": sweep_rows - pul_index.first_child[SERIES_LEVEL][series_rows],
+        "trace_idx": np.arange(len(sweep_rows)) - pul_index.first_child[SWEEP_LEVEL][sweep_rows],
+    }
+
+    trace_columns = get_level_columns(pul_index, TRACE_LEVEL)
+    if "TrYUnit" in trace_columns:
+        trace_columns["TrYUnit"] = to_array([unit.upper() for unit in trace_columns["TrYUnit"]])
+    table.update(trace_columns)
+
+    for name, column in get_level_columns(pul_index, SERIES_LEVEL).items():
+        table[name] = column[series_rows]
+
+    for name, column in get_level_columns(pul_index, SWEEP_LEVEL).items():
+        table[name] = column[sweep_rows]
+
+    return table
+
+
+def get_level_columns(pul_index, level):
+    """
+    Unpack all records of a level of the tree into a dict of entry name to numpy array (see get_trace_table()).
+    """
+    description = pul_index.descriptions[level]
+    columns, __ = description.unpack_columns(pul_index.get_level_buffer(level), pul_index.endian, keep_numeric=True)
+
+    return {name: to_array(column) for name, column in columns.items()}
+
+
+def to_array(column):
+    if isinstance(column, np.ndarray):
+        return column
+
+    if all(isinstance(item, str) for item in column):
+        return np.array(column, dtype=str)
+
+    if column and all(isinstance(item, BitFlags) for item in column):
+        return np.array(column, dtype=np.int64)
+
+    # filled item by item, so sequences (e.g. substructures) are not unpacked into extra dimensions
+    array = np.empty(len(column), dtype=object)
+    for idx, item in enumerate(column):
+        array[idx] = item
+    return array
@@ -0,0 +1,130 @@
+import gc
+import hashlib
+import os
+import pickle
+import tempfile
+
+# Increment when the structure of parsed trees changes, so trees cached by older versions are not used
+CACHE_VERSION = 2
+
+CACHE_EXTENSION = ".hekatree"
+
+DEFAULT_MAX_CACHE_BYTES = 2**30
+
+# ----------------------------------------------------------------------------------------------------------------------------------------------------
+# Cache Keys
+# ----------------------------------------------------------------------------------------------------------------------------------------------------
+
+
+def get_file_key(full_filepath, header, options=None):
+    """
+    Key identifying a HEKA file, made from its absolute path, size, modification time and the
+    oTime of its bundle header. If the file changes on disk, its key changes and previously cached
+    trees are no longer found (they are then removed by size-based eviction, see evict()).
+
+    options - any LoadHeka options that change the parsed trees (e.g. fields, scan_mode) so these
+              are cached separately.
+    """
+    stat = os.stat(full_filepath)
+    identity = repr(
+        (
+            CACHE_VERSION,
+            os.path.abspath(full_filepath),
+            stat.st_size,
+            stat.st_mtime_ns,
+            header["oTime"],
+            options,
+        )
+    )
+    return hashlib.sha1(identity.encode("utf-8")).hexdigest()
+
+
+def get_cache_path(cache_dir, file_key, tree_name):
+    return os.path.join(cache_dir, "{0}_{1}{2}".format(file_key, tree_name, CACHE_EXTENSION))
+
+
+# ----------------------------------------------------------------------------------------------------------------------------------------------------
+# Load / Save
+# ----------------------------------------------------------------------------------------------------------------------------------------------------
+
+
+def load_tree(cache_dir, file_key, tree_name):
+    """
+    Load a parsed tree from the cache. Returns False if it is not cached (or the cache file cannot be read,
+    in which case it is removed).
+
+    The access time of the cache file is updated so the most recently used trees are kept on eviction.
+
+    Cache files are pickles, so the cache directory must only be writable by trusted users.
+    """
+    cache_path = get_cache_path(cache_dir, file_key, tree_name)
+    if not os.path.isfile(cache_path):
+        return False
+
+    # trees are many small dicts, garbage collection passes while they are created slow loading considerably
+    gc_enabled = gc.isenabled()
+    gc.disable()
+    try:
+        with open(cache_path, "rb") as fh:
+            tree = pickle.load(fh)
+    except (OSError, EOFError, pickle.UnpicklingError, AttributeError, ImportError):
+        _remove(cache_path)
+        return False
+    finally:
+        if gc_enabled:
+            gc.enable()
+
+    os.utime(cache_path)
+
+    return tree
+
+
+def save_tree(cache_dir, file_key, tree_name, tree, max_cache_bytes=DEFAULT_MAX_CACHE_BYTES):
+    """
+    Save a parsed tree to the cache directory and evict the least recently used trees if the
+    cache is larger than max_cache_bytes.
+
+    The tree is written to a temporary file and moved into place, so an interrupted
+    write never leaves a partial cache file behind.
+    """
+    os.makedirs(cache_dir, exist_ok=True)
+
+    fd, temp_path = tempfile.mkstemp(dir=cache_dir, suffix=".tmp")
+    try:
+        with os.fdopen(fd, "wb") as fh:
+            pickle.dump(tree, fh, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(temp_path, get_cache_path(cache_dir, file_key, tree_name))
+    except BaseException:
+        _remove(temp_path)
+        raise
+
+    evict(cache_dir, max_cache_bytes)
+
+
+def evict(cache_dir, max_cache_bytes):
+    """
+    Remove cached trees, least recently used first, until the total size of the cache is at most max_cache_bytes.
+    """
+    entries = []
+    for filename in os.listdir(cache_dir):
+        if filename.endswith(CACHE_EXTENSION):
+            path = os.path.join(cache_dir, filename)
+            try:
+                stat = os.stat(path)
+            except OSError:  # removed by another process while listing
+                continue
+            entries.append((stat.st_mtime_ns, stat.st_size, path))
+
+    total_bytes = sum(entry[1] for entry in entries)
+    for __, size, path in sorted(entries):
+        if total_bytes <= max_cache_bytes:
+            break
+        _remove(path)
+        total_bytes -= size
+
+
+def _remove(path):
+    try:
+        os.remove(path)
+    except OSError:
+        pass
@@ -0,0 +1,199 @@
+from collections.abc import MutableMapping
+import struct
+import numpy as np
+
+# Trace entries held as arrays for all traces in the index, enough to locate and scale the raw data of a trace
+INDEX_TRACE_FIELDS = ["TrData", "TrDataPoints", "TrDataFormat", "TrDataScaler"]
+
+# ----------------------------------------------------------------------------------------------------------------------------------------------------
+# Tree Index
+# ----------------------------------------------------------------------------------------------------------------------------------------------------
+
+
+class TreeIndex:
+    def __init__(self, buffer, offset, endian, sizes, descriptions):
+        """
+        Offset index of all records in a tree, built in one pass over the tree bytes without decoding any record.
+
+        For each level, self.offsets holds the position of every record in the buffer (in tree order) and
+        self.first_child the row of its first child in the next level (with one extra entry, so the children of
+        row i are rows first_child[i] to first_child[i + 1]). A record at any position in the tree (e.g. group,
+        series, sweep, trace) is found from these arrays with get_row().
+
+        For trees with a TraceRecord level, INDEX_TRACE_FIELDS of all traces are held in self.trace_fields
+        as arrays, indexed by trace row.
+
+        Headers are decoded on demand from the buffer with get_header(), and a tree with the same structure as
+        LoadHeka._unpack_tree() that decodes records when they are accessed is available from get_tree().
+        """
+        self.buffer = buffer
+        self.endian = endian
+        self.sizes = sizes
+        self.descriptions = descriptions
+        self.num_levels = len(descriptions)
+        self.nchilds_struct = struct.Struct(endian + "i")
+
+        offsets = [[] for __ in range(self.num_levels)]
+        first_child = [[] for __ in range(self.num_levels - 1)]
+
+        offsets[0].append(offset)
+        first_child[0].append(0)
+        root_nchilds = self.nchilds_struct.unpack_from(buffer, offset + sizes[0])[0]
+        self.end = self._index_children(offset + sizes[0] + 4, 1, root_nchilds, offsets, first_child)
+
+        for level in range(self.num_levels - 1):
+            first_child[level].append(len(offsets[level + 1]))
+
+        self.offsets = [np.array(level_offsets, dtype=np.int64) for level_offsets in offsets]
+        self.first_child = [np.array(level_first_child, dtype=np.int64) for level_first_child in first_child]
+
+        self.trace_fields = self._get_trace_fields()
+
+    def _index_children(self, offset, level, nchilds, offsets, first_child):
+        """
+        Add the offsets of all children of a record (and recursively their children) starting at offset,
+        returning the offset after the last of them. The lowest level records are stored one after the other.
+        """
+        record_size = self.sizes[level] + 4
+        if level == self.num_levels - 1:
+            offsets[level].extend(range(offset, offset + record_size * nchilds, record_size))
+            return offset + record_size * nchilds
+
+        for __ in range(nchilds):
+            offsets[level].append(offset)
+            first_child[level].append(len(offsets[level + 1]))
+
+            child_nchilds = self.nchilds_struct.unpack_from(self.buffer, offset + self.sizes[level])[0]
+            offset = self._index_children(offset + record_size, level + 1, child_nchilds, offsets, first_child)
+
+        return offset
+
+    def _get_trace_fields(self):
+        """
+        Read INDEX_TRACE_FIELDS of every trace at once, from a numpy view of the buffer at each trace offset.
+        """
+        description = self.descriptions[-1]
+        if description.name != "TraceRecord":
+            return None
+
+        raw = np.frombuffer(self.buffer, dtype=np.uint8)
+        trace_offsets = self.offsets[-1]
+
+        trace_fields = {}
+        for name in INDEX_TRACE_FIELDS:
+            field_dtype, field_offset = description.dtype.fields[name][:2]
+            byte_idx = trace_offsets[:, np.newaxis] + field_offset + np.arange(field_dtype.itemsize)
+            trace_fields[name] = raw[byte_idx].view(field_dtype).ravel()
+
+        return trace_fields
+
+    # Lookup ---------------------------------------------------------------------------------------------------------------------------------------------
+
+    def get_row(self, *idxs):
+        """
+        Get the level and row of the record at the passed position in the tree, e.g.
+        get_row(group_idx, series_idx, sweep_idx, trace_idx) for the row of a trace in self.trace_fields.
+        """
+        row = 0
+        for level, idx in enumerate(idxs):
+            start, stop = self.first_child[level][row], self.first_child[level][row + 1]
+            if not 0 <= idx < stop - start:
+                raise IndexError("Index {0} out of range at tree level {1}".format(idx, level + 1))
+            row = start + idx
+
+        return len(idxs), int(row)
+
+    def get_num_children(self, level, row):
+        if level == self.num_levels - 1:
+            return 0
+        return int(self.first_child[level][row + 1] - self.first_child[level][row])
+
+    def get_header(self, level, row):
+        """
+        Decode the header of a record. As in LoadHeka._unpack_tree(), units of the lowest level of the pulse tree
+        are upper case.
+        """
+        header = self.descriptions[level].unpack(self.buffer, int(self.offsets[level][row]))[0]
+
+        if level == 4 and "TrYUnit" in header:
+            header["TrYUnit"] = header["TrYUnit"].upper()
+
+        return header
+
+    def get_parent_rows(self, level):
+        """
+        Row of the parent of every record at a level (level > 0)
+        """
+        return np.repeat(np.arange(len(self.offsets[level - 1])), np.diff(self.first_child[level - 1]))
+
+    def get_level_buffer(self, level):
+        """
+        Bytes of all records of a level one after the other, each followed by its number of children as in the
+        tree (see CompiledDescription.unpack_records()).
+
+        Records stored one after the other (e.g. all traces of a sweep) are copied as a single run of bytes.
+        """
+        offsets = self.offsets[level]
+        record_size = self.sizes[level] + 4
+        if len(offsets) == 0:
+            return b""
+
+        run_starts = np.flatnonzero(np.diff(offsets) != record_size) + 1
+        starts = offsets[np.concatenate([[0], run_starts])]
+        stops = offsets[np.concatenate([run_starts - 1, [len(offsets) - 1]])] + record_size
+
+        buffer = memoryview(self.buffer)
+        return b"".join(buffer[start:stop] for start, stop in zip(starts.tolist(), stops.tolist()))
+
+    def get_tree(self):
+        return IndexedRecord(self, 0, 0)
+
+
+class IndexedRecord(MutableMapping):
+    """
+    Record of a tree backed by a TreeIndex, with the same "hd" / "ch" (or "data" for the lowest level of the
+    pulse tree) entries as the dicts of LoadHeka._unpack_tree(). The header is decoded and the list of children
+    created on first access, after which they are stored on the record.
+    """
+
+    __slots__ = ("index", "level", "row", "_items")
+
+    def __init__(self, index, level, row):
+        self.index = index
+        self.level = level
+        self.row = row
+
+        if level == 4:
+            self._items = {"hd": None, "data": None}
+        else:
+            self._items = {"hd": None, "ch": None}
+
+    def __getitem__(self, key):
+        value = self._items[key]
+
+        if value is None and key == "hd":
+            value = self._items["hd"] = self.index.get_header(self.level, self.row)
+
+        elif value is None and key == "ch":
+            start = self.index.first_child[self.level][self.row] if self.level < self.index.num_levels - 1 else 0
+            value = self._items["ch"] = [
+                IndexedRecord(self.index, self.level + 1, int(start) + idx)
+                for idx in range(self.index.get_num_children(self.level, self.row))
+            ]
+
+        return value
+
+    def __setitem__(self, key, value):
+        self._items[key] = value
+
+    def __delitem__(self, key):
+        del self._items[key]
+
+    def __iter__(self):
+        return iter(self._items)
+
+    def __len__(self):
+        return len(self._items)
+
+    def __repr__(self):
+        return "IndexedRecord(level={0}, row={1})".format(self.level, self.row)
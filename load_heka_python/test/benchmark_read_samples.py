@@ -0,0 +1,124 @@
+"""
+Compare the speed of reading trace samples from file by struct.unpack into a tuple then np.array (previous
+implementation of data_reader.fill_pul_with_data()) and by np.frombuffer on the read buffer (data_reader.read_samples()),
+on synthetic int16, int32 and float32 traces.
+
+Also compares reading interleaved traces (TrInterleaveSize != 0) block by block and with
+read_interleaved_samples() (one read and a strided view), on a synthetic recording of two interleaved int16 channels.
+
+run as `python -m load_heka_python.test.benchmark_read_samples`
+"""
+
+import os
+import struct
+import tempfile
+import time
+import numpy as np
+from load_heka_python.readers import data_reader
+
+
+def read_samples_struct(fh, start, length, dtype):
+    fmt = dtype.char
+    fh.seek(start)
+    data = struct.unpack("<" + fmt * length, fh.read(dtype.itemsize * length))
+    return np.array(data, dtype=dtype)
+
+
+def read_interleaved_blocks(fh, start, length, dtype, interleave_size, interleave_skip):
+    """
+    Read an interleaved trace one block at a time (previous implementation of data_reader.fill_pul_with_data())
+    """
+    batch_size = interleave_size // dtype.itemsize
+    data = np.zeros(length, dtype=dtype)
+    for chunk in range(length // batch_size):
+        data[chunk * batch_size : chunk * batch_size + batch_size] = data_reader.read_samples(
+            fh, start, batch_size, dtype
+        )
+        start += interleave_skip
+    return data
+
+
+def read_interleaved_samples(fh, start, length, dtype, interleave_size, interleave_skip):
+    """
+    Read length samples stored in blocks of interleave_size bytes, each block starting interleave_skip bytes
+    after the previous one (e.g. the blocks of other channels recorded at the same time are in between).
+
+    The whole span from the first to the last block is read at once and the blocks taken from it with
+    data_reader.take_interleaved_samples(), as in data_reader.fill_pul_with_data().
+    """
+    span = data_reader.get_interleaved_span_size(length, dtype.itemsize, interleave_size, interleave_skip)
+    raw = data_reader.read_samples(fh, start, span, np.dtype(np.uint8))
+
+    return data_reader.take_interleaved_samples(raw, 0, length, dtype, interleave_size, interleave_skip)
+
+
+def measure(read, fh, length, dtype, *args, repeats=3):
+    seconds = []
+    for __ in range(repeats):
+        t_start = time.perf_counter()
+        data = read(fh, 0, length, dtype, *args)
+        seconds.append(time.perf_counter() - t_start)
+
+    assert len(data) == length
+
+    return min(seconds)
+
+
+if __name__ == "__main__":
+
+    length = 5000000
+
+    for np_dtype in [np.int16, np.int32, np.float32]:
+        dtype = np.dtype(np_dtype).newbyteorder("<")
+        samples = (np.random.default_rng(0).random(length) * 1000).astype(dtype)
+
+        fd, path = tempfile.mkstemp(suffix=".dat")
+        with os.fdopen(fd, "wb") as fh:
+            fh.write(samples.tobytes())
+
+        try:
+            with open(path, "rb") as fh:
+                assert np.array_equal(
+                    read_samples_struct(fh, 0, length, dtype), data_reader.read_samples(fh, 0, length, dtype)
+                )
+
+                for name, read in [("struct", read_samples_struct), ("frombuffer", data_reader.read_samples)]:
+                    seconds = measure(read, fh, length, dtype)
+                    print(
+                        "{0}, {1}: {2:.3f} s ({3:.0f} MB/s)".format(
+                            dtype.name, name, seconds, samples.nbytes / 1e6 / seconds
+                        )
+                    )
+        finally:
+            os.remove(path)
+
+    # two int16 channels stored in turn in blocks of interleave_size bytes, read the first
+    dtype = np.dtype("<i2")
+    for interleave_size in [512, 4096, 65536]:
+        num_blocks = length * dtype.itemsize // interleave_size
+        num_samples = num_blocks * interleave_size // dtype.itemsize
+        samples = np.random.default_rng(0).integers(-1000, 1000, (num_blocks, 2, interleave_size // 2)).astype(dtype)
+        interleave_args = (interleave_size, 2 * interleave_size)
+
+        fd, path = tempfile.mkstemp(suffix=".dat")
+        with os.fdopen(fd, "wb") as fh:
+            fh.write(samples.tobytes())
+
+        try:
+            with open(path, "rb") as fh:
+                data = read_interleaved_samples(fh, 0, num_samples, dtype, *interleave_args)
+                assert np.array_equal(data, samples[:, 0].ravel())
+                assert np.array_equal(data, read_interleaved_blocks(fh, 0, num_samples, dtype, *interleave_args))
+
+                for name, read in [
+                    ("blocks", read_interleaved_blocks),
+                    ("strided", read_interleaved_samples),
+                ]:
+                    seconds = measure(read, fh, num_samples, dtype, *interleave_args)
+                    print(
+                        "interleaved {0} bytes, {1}: {2:.3f} s ({3:.0f} MB/s)".format(
+                            interleave_size, name, seconds, num_samples * dtype.itemsize / 1e6 / seconds
+                        )
+                    )
+        finally:
+            os.remove(path)
@@ -0,0 +1,145 @@
+"""
+Compare the time to decode pulse tree records one at a time as before compiled descriptions (the format string,
+entry details and decoder of every entry re-derived for every record, previous implementation of
+LoadHeka._unpack_header()), with a CompiledDescription (CompiledDescription.unpack()) and, for the lowest level of
+the tree, all records of a run at once with numpy (CompiledDescription.unpack_records()). Records are random
+synthetic records (see synthetic_files.py).
+
+Substructures (e.g. SeOldAmpState of PulSeriesRecord) are decoded in full per entry, but only on first access by
+a CompiledDescription (see LazySubstruct) so are not decoded here.
+
+run as `python -m load_heka_python.test.benchmark_tree_decoding`
+"""
+
+import struct
+import time
+import numpy as np
+from load_heka_python.trees import TreeSchemas
+from load_heka_python.trees.SharedTrees import (
+    decoder_is_class,
+    get_compiled_description,
+    get_data_kind,
+    get_entry_details,
+    get_stim_to_dac_id,
+)
+from .synthetic_files import pack_record
+
+
+def unpack_header_per_entry(buffer, offset, description, endian="<"):
+    """
+    Decode a record entry by entry, as LoadHeka._unpack_header() did before CompiledDescription.
+    """
+    items = struct.unpack_from(endian + description.get_fmt(), buffer, offset)
+
+    header_dict = {}
+    i = 0
+    for entry in description.description:
+
+        name, fmt, decoder = get_entry_details(entry)
+
+        if len(fmt) == 1 or fmt[-1] == "s":
+            item = items[i]
+            i += 1
+        else:
+            n = int(fmt[:-1])
+            item = items[i : i + n]
+            i += n
+
+        if decoder_is_class(decoder):
+            header_dict[name] = unpack_substruct_per_entry(item, decoder, endian)
+        else:
+            header_dict[name] = read_byte(item, decoder, endian)
+
+    return header_dict
+
+
+def unpack_substruct_per_entry(item, description, endian):
+    substruct = struct.unpack(endian + description.get_fmt(), item)
+
+    repeats = []
+    cnt = 0
+    for __ in range(description.n):
+        sub_array = {}
+
+        for entry in description.description:
+
+            name, fmt, decoder = get_entry_details(entry)
+
+            if decoder_is_class(decoder):
+                sub_array[name] = unpack_substruct_per_entry(substruct[cnt], decoder, endian)
+            else:
+                sub_array[name] = read_byte(substruct[cnt], decoder, endian)
+            cnt += 1
+
+        repeats.append(sub_array)
+
+    return tuple(repeats)
+
+
+def read_byte(item, decoder, endian):
+    if decoder in [get_stim_to_dac_id, get_data_kind]:
+        return decoder(item, endian)
+    if decoder:
+        return decoder(item)
+    return item
+
+
+def decode_per_entry(Record, buffer, num_records):
+    # the previous _unpack_tree() created a new Description for every record
+    record_size = Record().size + 4
+    return [unpack_header_per_entry(buffer, i * record_size, Record()) for i in range(num_records)]
+
+
+def decode_compiled(Record, buffer, num_records):
+    description = get_compiled_description(Record())
+    record_size = description.size + 4
+    return [description.unpack(buffer, i * record_size)[0] for i in range(num_records)]
+
+
+def decode_numpy(Record, buffer, num_records):
+    return get_compiled_description(Record()).unpack_records(buffer)[0]
+
+
+def make_records(Record, num_records):
+    """
+    Bytes of num_records random records stored one after the other, each followed by its number of children (0).
+    """
+    rng = np.random.default_rng(0)
+    return b"".join(pack_record(Record, rng) + struct.pack("<i", 0) for __ in range(num_records))
+
+
+def measure(decode, Record, buffer, num_records, repeats=3):
+    seconds = []
+    for __ in range(repeats):
+        t_start = time.perf_counter()
+        headers = decode(Record, buffer, num_records)
+        seconds.append(time.perf_counter() - t_start)
+
+    assert len(headers) == num_records
+
+    return min(seconds) / num_records
+
+
+if __name__ == "__main__":
+
+    num_records = 5000
+    schema = TreeSchemas.get_schema_by_name("v1000")
+
+    for record_name in ["PulSeriesRecord", "SweepRecord", "TraceRecord"]:
+        Record = schema.records[record_name]
+        buffer = make_records(Record, num_records)
+
+        decoders = [("per entry", decode_per_entry), ("compiled", decode_compiled)]
+        if record_name == "TraceRecord":
+            decoders.append(("numpy", decode_numpy))
+
+        baseline = None
+        for name, decode in decoders:
+            seconds = measure(decode, Record, buffer, num_records)
+            baseline = seconds if baseline is None else baseline
+
+            print(
+                "{0}, {1}: {2:.1f} us per record ({3:.1f}x)".format(
+                    record_name, name, seconds * 1e6, baseline / seconds
+                )
+            )
@@ -0,0 +1,70 @@
+"""
+Compare the memory used by the lowest level of the pulse tree (all TraceRecords) when stored as header dicts
+(default) or as a RecordTable with slotted records (LoadHeka(..., compact=True)), on synthetic trace records.
+
+run as `python -m load_heka_python.test.benchmark_tree_memory`
+"""
+
+import time
+import tracemalloc
+import numpy as np
+from load_heka_python.trees import Trees_v1000
+from load_heka_python.trees.SharedTrees import LeafRecord, get_compiled_description
+
+
+def make_trace_records(num_traces, endian="<"):
+    """
+    Bytes of num_traces TraceRecords stored one after the other, each followed by its number of children (0)
+    """
+    description = get_compiled_description(Trees_v1000.TraceRecord(), endian)
+    records = np.zeros(num_traces, dtype=np.dtype([("hd", description.dtype), ("nchilds", endian + "i4")]))
+
+    rng = np.random.default_rng(0)
+    records["hd"]["TrLabel"] = [b"Imon", b"Vmon"] * (num_traces // 2) + [b"Imon"] * (num_traces % 2)
+    records["hd"]["TrYUnit"] = b"A"
+    records["hd"]["TrXUnit"] = b"s"
+    records["hd"]["TrDataKind"] = 1
+    records["hd"]["TrData"] = np.arange(num_traces) * 4000
+    records["hd"]["TrDataPoints"] = 2000
+    records["hd"]["TrDataScaler"] = rng.random(num_traces)
+    records["hd"]["TrXInterval"] = 2e-05
+    records["hd"]["TrTimeOffset"] = rng.random(num_traces)
+
+    return description, records.tobytes()
+
+
+def unpack_as_dicts(description, buffer):
+    headers, __ = description.unpack_records(buffer)
+    return [{"hd": header, "data": None} for header in headers]
+
+
+def unpack_as_table(description, buffer):
+    table, __ = description.unpack_table(buffer)
+    return [LeafRecord(header) for header in table.get_rows()]
+
+
+def measure(unpack, description, buffer):
+    tracemalloc.start()
+    t_start = time.perf_counter()
+    records = unpack(description, buffer)
+    seconds = time.perf_counter() - t_start
+    memory_bytes = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+
+    assert records[-1]["hd"]["TrLabel"] in ["Imon", "Vmon"]
+
+    return memory_bytes, seconds
+
+
+if __name__ == "__main__":
+
+    for num_traces in [1000, 10000, 50000]:
+        description, buffer = make_trace_records(num_traces)
+
+        for name, unpack in [("dicts", unpack_as_dicts), ("compact", unpack_as_table)]:
+            memory_bytes, seconds = measure(unpack, description, buffer)
+            print(
+                "{0} traces, {1}: {2:.1f} MB ({3:.0f} bytes per trace), {4:.3f} s".format(
+                    num_traces, name, memory_bytes / 1e6, memory_bytes / num_traces, seconds
+                )
+            )
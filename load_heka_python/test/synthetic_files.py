@@ -0,0 +1,303 @@
+"""
+Write small synthetic HEKA .dat files for tests that need a whole file (see write_heka_file()).
+
+Tree records are filled with random values of the type of each entry (and a valid option for entries decoded
+from a list of options, e.g. seClass), with the entries needed to load series data set to known values. Trace
+data is random integers, so the data read can be checked against the samples written (see SyntheticFile).
+"""
+
+import struct
+import numpy as np
+from load_heka_python.load_heka import TREE_LEVELS
+from load_heka_python.trees import SharedTrees
+from load_heka_python.trees import TreeSchemas
+
+# Bundle header oVersion written for each schema
+SCHEMA_VERSIONS = {name: versions[0] for name, versions in TreeSchemas.SCHEMA_VERSIONS.items()}
+
+# Number of options of entries decoded by indexing a list of options (see SharedTrees)
+NUM_OPTIONS = {
+    SharedTrees.get_segment_class: 6,
+    SharedTrees.get_seg_store_type: 4,
+    SharedTrees.get_increment_mode_type: 10,
+    SharedTrees.get_break_type: 3,
+    SharedTrees.get_leak_hold_type: 4,
+    SharedTrees.get_leak_store_type: 4,
+    SharedTrees.get_adc_type: 5,
+    SharedTrees.get_ampl_mode_type: 4,
+    SharedTrees.get_recording_mode: 7,
+    SharedTrees.get_ext_trigger_type: 4,
+    SharedTrees.get_auto_ranging_type: 4,
+    SharedTrees.get_leak_comp_type: 2,
+}
+
+# TrDataFormat of each series (in turn) and its sample dtype, see data_reader.get_dataformat()
+DATA_FORMATS = [(0, "i2"), (1, "i4"), (2, "f4")]
+
+CHANNEL_LABELS = ["Imon", "Vmon", "Leak"]
+
+SAMPLING_STEP = 1e-4
+
+
+def get_random_items(Record, rng, endian="<"):
+    """
+    Random struct items (see SharedTrees.get_fmt()) for each entry of a record, as a list of (name, items).
+    Substructures (e.g. SeOldAmpState) are packed records of their own Description.
+    """
+    items = []
+    for name, fmt, decoder in [SharedTrees.get_entry_details(entry) for entry in Record().description]:
+        count, type_ = SharedTrees.split_fmt(fmt)
+
+        if SharedTrees.decoder_is_class(decoder):
+            value = [b"".join(pack_record(type(decoder), rng, endian=endian) for __ in range(decoder.n))]
+        elif type_ == "s":
+            value = [get_random_string(rng, count) if decoder is SharedTrees.cstr else rng.bytes(count)]
+        elif type_ == "c":
+            value = [rng.bytes(1) for __ in range(count)]
+        elif decoder in NUM_OPTIONS:
+            value = [int(rng.integers(0, NUM_OPTIONS[decoder])) for __ in range(count)]
+        elif decoder is SharedTrees.get_data_kind:
+            value = [1 | int(rng.choice([0, 2, 8, 16]))]
+        elif decoder is SharedTrees.get_stim_to_dac_id:
+            value = [int(rng.integers(0, 256))]
+        elif type_ == "?":
+            value = [bool(item) for item in rng.integers(0, 2, count)]
+        elif type_ in "df":
+            value = rng.normal(size=count).tolist()
+        else:
+            info = np.iinfo(SharedTrees.STRUCT_TO_NUMPY_TYPES[type_])
+            value = rng.integers(max(info.min, -(2**20)), min(info.max, 2**20), count).tolist()
+
+        items.append((name, value))
+
+    return items
+
+
+def get_random_string(rng, num_bytes):
+    """
+    C string of num_bytes, a label followed by a null and either nulls or random bytes, as written by PatchMaster.
+    """
+    label = "{0}{1}".format(rng.choice(["Imon", "Vmon", "Leak", "Series", "mV", "A"]), rng.integers(0, 100))
+    label = label.encode()[: num_bytes - 1] + b"\0"
+
+    fill = rng.bytes(num_bytes - len(label)) if rng.random() < 0.3 else b"\0" * (num_bytes - len(label))
+    return label + fill
+
+
+def pack_record(Record, rng, values=None, endian="<"):
+    """
+    Pack a record of a Description class with random items, replaced by values (entry name to value or list
+    of items) where given.
+    """
+    values = values or {}
+    items = get_random_items(Record, rng, endian)
+    assert all(name in dict(items) for name in values), "values are not all entries of {0}".format(Record.__name__)
+
+    items = [(name, value) if name not in values else (name, values[name]) for name, value in items]
+    items = [item for __, value in items for item in (value if isinstance(value, (list, tuple)) else [value])]
+
+    description = Record()
+    buffer = struct.pack(endian + description.get_fmt(), *items)
+    assert len(buffer) == description.size
+
+    return buffer
+
+
+def pack_tree(schema, key, root, rng):
+    """
+    Pack a tree (by bundle item extension, e.g. ".pul") as stored in the file, the tree magic and level sizes followed
+    by each record and its number of children, depth first. root is a (values, children) tuple of the root record,
+    each child a (values, children) tuple in turn.
+    """
+    Levels = [schema.records[name] for name in TREE_LEVELS[key]]
+    sizes = [Level().size for Level in Levels]
+
+    buffer = [b"eerT", struct.pack("<i", len(sizes)), struct.pack("<{0}i".format(len(sizes)), *sizes)]
+
+    def pack_children(level, record):
+        values, children = record
+        buffer.append(pack_record(Levels[level], rng, values))
+        buffer.append(struct.pack("<i", len(children)))
+        for child in children:
+            pack_children(level + 1, child)
+
+    pack_children(0, root)
+
+    return b"".join(buffer)
+
+
+class SyntheticFile:
+    def __init__(self, schema_name="v1000", seed=0, num_groups=2, num_series=3, num_sweeps=4):
+        """
+        Contents of a synthetic file, written with write(). By series index within each group:
+            - the data format cycles through DATA_FORMATS.
+            - series with an odd index have 3 channels (Imon, Vmon, Leak), the others 2.
+            - the last sweep of series with an odd index is 20 samples shorter than the others.
+            - the series with index 2 is interleaved, all channels of a sweep are stored in alternating blocks of
+              10 samples. The traces of other series are stored one after the other.
+
+        self.samples holds the samples written for each (group_idx, series_idx, sweep_idx, trace_idx).
+        """
+        self.schema = TreeSchemas.get_schema_by_name(schema_name)
+        self.version = SCHEMA_VERSIONS[schema_name]
+        self.rng = np.random.default_rng(seed)
+
+        self.samples = {}
+        self.data = bytearray()
+        self.data_start = SharedTrees.BundleHeader().size
+
+        groups = []
+        for group_idx in range(num_groups):
+            series = [self._get_series(group_idx, series_idx, num_sweeps) for series_idx in range(num_series)]
+            groups.append(({"GrLabel": "Group{0}".format(group_idx).encode().ljust(32, b"\0")}, series))
+
+        self.pul = ({}, groups)
+
+    def _get_series(self, group_idx, series_idx, num_sweeps):
+
+        data_format, sample_dtype = DATA_FORMATS[series_idx % len(DATA_FORMATS)]
+        num_channels = 3 if series_idx % 2 else 2
+        is_interleaved = series_idx == 2
+
+        sweeps = []
+        for sweep_idx in range(num_sweeps):
+            num_samples = 200 + 10 * series_idx
+            if sweep_idx == num_sweeps - 1 and series_idx % 2:
+                num_samples -= 20
+
+            samples = [self.rng.integers(-1000, 1000, num_samples).astype(sample_dtype) for __ in range(num_channels)]
+            starts, interleave_size, interleave_skip = self._add_samples(samples, is_interleaved)
+
+            traces = []
+            for trace_idx in range(num_channels):
+                self.samples[(group_idx, series_idx, sweep_idx, trace_idx)] = samples[trace_idx]
+                traces.append(
+                    (
+                        self._get_trace_values(
+                            trace_idx,
+                            starts[trace_idx],
+                            num_samples,
+                            data_format,
+                            interleave_size,
+                            interleave_skip,
+                        ),
+                        [],
+                    )
+                )
+            sweeps.append(({"SwStimCount": 1}, traces))
+
+        series_values = {
+            "SeLabel": "Series{0}".format(series_idx).encode().ljust(32, b"\0"),
+            "SeNumberSweeps": num_sweeps,
+        }
+        return series_values, sweeps
+
+    def _add_samples(self, samples, is_interleaved):
+        """
+        Add the samples of the traces of a sweep to the data, returning the start of each and their interleave
+        size and skip.
+        """
+        start = self.data_start + len(self.data)
+
+        if not is_interleaved:
+            starts = []
+            for trace_samples in samples:
+                starts.append(self.data_start + len(self.data))
+                self.data += trace_samples.tobytes()
+            return starts, 0, 0
+
+        block_size = 10 * samples[0].itemsize
+        blocks = np.stack([trace_samples.view(np.uint8).reshape(-1, block_size) for trace_samples in samples], axis=1)
+        self.data += blocks.tobytes()
+
+        return (
+            [start + trace_idx * block_size for trace_idx in range(len(samples))],
+            block_size,
+            block_size * len(samples),
+        )
+
+    @staticmethod
+    def _get_trace_values(trace_idx, start, num_samples, data_format, interleave_size, interleave_skip):
+        return {
+            "TrLabel": CHANNEL_LABELS[trace_idx].encode().ljust(32, b"\0"),
+            "TrData": start,
+            "TrDataPoints": num_samples,
+            "TrDataFormat": data_format,
+            "TrDataKind": 1 | (2 if trace_idx == 2 else 0),
+            "TrDataScaler": 1e-3 if trace_idx % 2 else 1e-12,
+            "TrZeroData": 0.001 * trace_idx,
+            "TrYUnit": (b"V" if trace_idx % 2 else b"A").ljust(8, b"\0"),
+            "TrXUnit": b"s".ljust(8, b"\0"),
+            "TrXInterval": SAMPLING_STEP,
+            "TrXStart": 0.0,
+            "TrTimeOffset": 0.0,
+            "TrYOffset": 0.0,
+            "TrGLeak": 0.0,
+            "TrRecordingMode": 5,
+            "TrAdcChannel": trace_idx,
+            "TrCellPotential": 0.0,
+            "TrInterleaveSize": interleave_size,
+            "TrInterleaveSkip": interleave_skip,
+        }
+
+    def get_trees(self):
+        """
+        Packed tree of each bundle item extension written. Versions before 2x90 only have a pulse tree.
+        """
+        trees = {".pul": pack_tree(self.schema, ".pul", self.pul, self.rng)}
+        if self.version in TreeSchemas.SCHEMA_VERSIONS["v9_pre_2x90"]:
+            return trees
+
+        num_series = sum(len(group[1]) for group in self.pul[1])
+        segments = [({"seClass": 0, "seStoreKind": 1, "seDuration": 0.01}, []) for __ in range(3)]
+        channels = [({"chDacUnit": b"V".ljust(8, b"\0")}, segments) for __ in range(2)]
+        stimulations = [({"stSampleInterval": SAMPLING_STEP}, channels) for __ in range(num_series)]
+
+        trees[".pgf"] = pack_tree(self.schema, ".pgf", ({}, stimulations), self.rng)
+        trees[".amp"] = pack_tree(self.schema, ".amp", ({}, [({}, [({}, [])]) for __ in range(3)]), self.rng)
+        trees[".sol"] = pack_tree(self.schema, ".sol", ({}, [({}, [({}, [])] * 2)] * 2), self.rng)
+        trees[".mrk"] = pack_tree(self.schema, ".mrk", ({}, [({}, [])] * 3), self.rng)
+        trees[".onl"] = pack_tree(self.schema, ".onl", ({}, [({}, [({}, [])] * 2)]), self.rng)
+
+        return trees
+
+    def write(self, path):
+        """
+        Write the file, the bundle header followed by the trace data and the trees.
+        """
+        trees = self.get_trees()
+
+        bundle_items = [(0, 0, b".dat")]
+        start = self.data_start + len(self.data)
+        for key, tree in trees.items():
+            bundle_items.append((start, len(tree), key.encode()))
+            start += len(tree)
+        bundle_items += [(0, 0, b"")] * (12 - len(bundle_items))
+
+        header = pack_record(
+            SharedTrees.BundleHeader,
+            self.rng,
+            {
+                "oSignature": b"DAT2\0\0\0\0",
+                "oVersion": self.version.encode().ljust(32, b"\0"),
+                "oTime": 12345.5,
+                "oItems": len(trees) + 1,
+                "oIsLittleEndian": True,
+                "oBundleItems": b"".join(struct.pack("<ii8s", *item) for item in bundle_items),
+            },
+        )
+
+        with open(path, "wb") as fh:
+            fh.write(header + bytes(self.data) + b"".join(trees.values()))
+
+        return str(path)
+
+
+def write_heka_file(path, schema_name="v1000", seed=0, **kwargs):
+    """
+    Write a synthetic file (see SyntheticFile) to path, returning the SyntheticFile.
+    """
+    synthetic_file = SyntheticFile(schema_name, seed, **kwargs)
+    synthetic_file.write(path)
+
+    return synthetic_file
@@ -0,0 +1,337 @@
+import copy
+import io
+import mmap
+import pickle
+import numpy as np
+import pytest
+from load_heka_python.readers import data_reader
+from load_heka_python.trees.SharedTrees import DataKind
+
+PARAMS = data_reader.PARAMS_EQUAL_PER_RECORD + data_reader.PARAMS_EQUAL_ALL_RECORDS
+
+DEFAULT_PARAMS = {
+    "TrDataScaler": 1e-12,
+    "TrYUnit": "A",
+    "TrDataFormat": 0,
+    "TrAdcChannel": 0,
+    "TrRecordingMode": 3,
+    "TrXUnit": "s",
+    "TrXInterval": 2e-05,
+    "TrCellPotential": 0.0,
+}
+
+
+def make_table(series):
+    """
+    Build a trace table (see readers/trace_table.py) from a list of (group_idx, series_idx, sweeps), where sweeps
+    is a list of sweeps, each a list of records given as dicts of the parameters that differ from DEFAULT_PARAMS.
+    """
+    rows = []
+    for group_idx, series_idx, sweeps in series:
+        for sweep_idx, recs in enumerate(sweeps):
+            for trace_idx, rec in enumerate(recs):
+                row = {"group_idx": group_idx, "series_idx": series_idx, "sweep_idx": sweep_idx, "trace_idx": trace_idx}
+                row.update(DEFAULT_PARAMS)
+                row.update(rec)
+                rows.append(row)
+
+    return {name: np.array([row[name] for row in rows]) for name in rows[0]}
+
+
+class TestSweepParamViolations:
+
+    def test_no_violations(self):
+        table = make_table([(0, 0, [[{}, {"TrDataScaler": 1e-3, "TrYUnit": "V"}]] * 3), (1, 0, [[{}]] * 2)])
+
+        assert data_reader.get_sweep_param_violations(table) == []
+
+    def test_unequal_record_counts(self):
+        table = make_table([(0, 0, [[{}]] * 2), (0, 1, [[{}, {}], [{}], [{}, {}]])])
+
+        assert data_reader.get_sweep_param_violations(table) == [
+            {"group_idx": 0, "series_idx": 1, "rec_idx": "all", "param": "num_recs", "values": [1, 2]}
+        ]
+
+    def test_per_record_violation(self):
+        table = make_table([(0, 0, [[{}, {"TrDataScaler": 1e-3}], [{}, {"TrDataScaler": 2e-3}]]), (2, 3, [[{}]] * 2)])
+
+        assert data_reader.get_sweep_param_violations(table) == [
+            {"group_idx": 0, "series_idx": 0, "rec_idx": 1, "param": "TrDataScaler", "values": [1e-3, 2e-3]}
+        ]
+
+    def test_all_records_violation(self):
+        # equal across sweeps for each record, but not between records
+        table = make_table(
+            [(0, 0, [[{}, {"TrXInterval": 1e-04}]] * 2), (1, 2, [[{"TrXUnit": "s"}], [{"TrXUnit": "ms"}]])]
+        )
+
+        assert data_reader.get_sweep_param_violations(table) == [
+            {"group_idx": 1, "series_idx": 2, "rec_idx": "all", "param": "TrXUnit", "values": ["ms", "s"]},
+            {"group_idx": 0, "series_idx": 0, "rec_idx": "all", "param": "TrXInterval", "values": [2e-05, 1e-04]},
+        ]
+
+    def test_nan_values_are_equal(self):
+        table = make_table([(0, 0, [[{"TrCellPotential": np.nan}, {"TrCellPotential": np.nan}]] * 3)])
+
+        assert data_reader.get_sweep_param_violations(table) == []
+
+    def test_matches_loop_check(self):
+        series = [(0, 0, [[{}, {"TrDataScaler": 1e-3}], [{}, {"TrDataScaler": 2e-3}]]), (0, 1, [[{}, {}]] * 2)]
+        table = make_table(series)
+
+        pul = {"ch": [{"ch": []}]}
+        for __, __, sweeps in series:
+            pul["ch"][0]["ch"].append(
+                {"ch": [{"ch": [{"hd": dict(DEFAULT_PARAMS, **rec)} for rec in recs]} for recs in sweeps]}
+            )
+
+        with pytest.raises(AssertionError):
+            data_reader.check_sweep_params_are_equal(pul, 0, 0, 1, "TrDataScaler")
+        data_reader.check_sweep_params_are_equal(pul, 0, 1, 1, "TrDataScaler")
+
+        assert [
+            (violation["series_idx"], violation["rec_idx"])
+            for violation in data_reader.get_sweep_param_violations(table)
+        ] == [(0, 1)]
+
+
+class TestGroupsWithUnequalValues:
+
+    def test_unequal_groups(self):
+        keys = np.array([0, 0, 1, 1, 2, 3, 3])
+        values = np.array([1.0, 1.0, 1.0, 2.0, 5.0, 3.0, 4.0])
+
+        assert data_reader.get_groups_with_unequal_values(keys, values) == [(1, [1.0, 2.0]), (3, [3.0, 4.0])]
+
+    def test_nan_equal(self):
+        keys = np.array([0, 0, 1, 1])
+        values = np.array([np.nan, np.nan, np.nan, 1.0])
+
+        result = data_reader.get_groups_with_unequal_values(keys, values)
+
+        assert len(result) == 1 and result[0][0] == 1 and result[0][1][0] == 1.0 and np.isnan(result[0][1][1])
+
+    def test_strings(self):
+        keys = np.array([0, 0, 1, 1])
+        values = np.array(["A", "A", "A", "V"])
+
+        assert data_reader.get_groups_with_unequal_values(keys, values) == [(1, ["A", "V"])]
+
+    def test_empty(self):
+        assert data_reader.get_groups_with_unequal_values(np.array([], dtype=int), np.array([])) == []
+
+
+class CountingFile(io.BytesIO):
+    """
+    In-memory file that counts the reads made from it.
+    """
+
+    def __init__(self, data):
+        super().__init__(data)
+        self.num_reads = 0
+
+    def read(self, size=-1):
+        self.num_reads += 1
+        return super().read(size)
+
+
+def make_rec(start, num_samples, interleave_size=0, interleave_skip=0):
+    hd = {
+        "TrData": start,
+        "TrDataPoints": num_samples,
+        "TrDataFormat": 0,
+        "TrDataKind": DataKind.IsLittleEndian,
+        "TrInterleaveSize": interleave_size,
+        "TrInterleaveSkip": interleave_skip,
+        "TrDataScaler": 1.0,
+        "TrZeroData": 0.0,
+        "TrYOffset": 0.0,
+        "TrGLeak": 0.0,
+        "TrXUnit": "s",
+        "TrYUnit": "A",
+        "TrLabel": "Imon",
+    }
+    return {"hd": hd, "data": None}
+
+
+def get_samples(recs, buffers):
+    return [data_reader.get_record_samples(rec, raw, offset).tolist() for rec, (raw, offset) in zip(recs, buffers)]
+
+
+class TestPlanReads:
+
+    def test_sorted_by_start(self):
+        reads = data_reader.plan_reads([(300, 400, 0), (0, 100, 1), (1000, 1100, 2)], max_gap=0)
+
+        assert reads == [(0, 100, [1]), (300, 400, [0]), (1000, 1100, [2])]
+
+    def test_adjacent_ranges_are_merged(self):
+        reads = data_reader.plan_reads([(100, 200, 1), (0, 100, 0), (200, 300, 2)], max_gap=0)
+
+        assert reads == [(0, 300, [0, 1, 2])]
+
+    def test_overlapping_ranges_are_merged(self):
+        # interleaved records, the span of each covers the blocks of the others
+        reads = data_reader.plan_reads([(512, 10752, 1), (0, 10240, 0), (20000, 20100, 2)], max_gap=0)
+
+        assert reads == [(0, 10752, [0, 1]), (20000, 20100, [2])]
+
+    def test_range_inside_another_is_merged(self):
+        reads = data_reader.plan_reads([(0, 1000, 0), (100, 200, 1)], max_gap=0)
+
+        assert reads == [(0, 1000, [0, 1])]
+
+    @pytest.mark.parametrize("gap, num_reads", [(0, 1), (99, 1), (100, 1), (101, 2)])
+    def test_max_gap(self, gap, num_reads):
+        reads = data_reader.plan_reads([(0, 100, 0), (100 + gap, 200 + gap, 1)], max_gap=100)
+
+        assert len(reads) == num_reads
+        assert [idx for read in reads for idx in read[2]] == [0, 1]
+
+    def test_zero_length_ranges(self):
+        assert data_reader.plan_reads([(50, 50, 1), (0, 100, 0)], max_gap=0) == [(0, 100, [0, 1])]
+        assert data_reader.plan_reads([(500, 500, 0)], max_gap=0) == [(500, 500, [0])]
+
+    def test_no_ranges(self):
+        assert data_reader.plan_reads([]) == []
+
+
+class TestReadRecords:
+
+    @pytest.fixture
+    def samples(self):
+        return np.arange(10000, dtype="<i2")
+
+    def test_contiguous_records_are_read_once(self, samples):
+        recs = [make_rec(200 * idx, 100) for idx in [2, 0, 1]]
+        fh = CountingFile(samples.tobytes())
+        read_stats = {"num_seeks": 0, "num_reads": 0, "num_bytes": 0}
+
+        buffers = data_reader.read_records(fh, recs, read_stats, max_gap=0)
+
+        assert get_samples(recs, buffers) == [samples[100 * idx : 100 * idx + 100].tolist() for idx in [2, 0, 1]]
+        assert fh.num_reads == 1
+        assert read_stats == {"num_seeks": 1, "num_reads": 1, "num_bytes": 600}
+
+    def test_read_stats(self, samples):
+        # one channel of three sweeps of two channels, the other channel is in between
+        recs = [make_rec(400 * idx, 100) for idx in range(3)]
+        read_stats = {"num_seeks": 0, "num_reads": 0, "num_bytes": 0}
+
+        data_reader.read_records(CountingFile(samples.tobytes()), recs, read_stats, max_gap=200)
+        assert read_stats == {"num_seeks": 1, "num_reads": 1, "num_bytes": 1000}
+
+        data_reader.read_records(CountingFile(samples.tobytes()), recs, read_stats, max_gap=199)
+        assert read_stats == {"num_seeks": 4, "num_reads": 4, "num_bytes": 1600}
+
+    def test_interleaved_records_share_a_read(self, samples):
+        # three channels in blocks of 64 bytes (32 samples), one block of each in turn
+        recs = [make_rec(64 * channel, 320, interleave_size=64, interleave_skip=192) for channel in range(3)]
+        fh = CountingFile(samples.tobytes())
+
+        buffers = data_reader.read_records(fh, recs, max_gap=0)
+
+        blocks = samples[: 320 * 3].reshape(10, 3, 32)
+        assert get_samples(recs, buffers) == [blocks[:, channel].ravel().tolist() for channel in range(3)]
+        assert fh.num_reads == 1
+
+    def test_zero_length_records_are_not_read(self, samples):
+        recs = [make_rec(0, 100), make_rec(5000, 0), make_rec(10**9, 0)]
+        fh = CountingFile(samples.tobytes())
+        read_stats = {"num_seeks": 0, "num_reads": 0, "num_bytes": 0}
+
+        buffers = data_reader.read_records(fh, recs, read_stats, max_gap=0)
+
+        assert get_samples(recs, buffers) == [samples[:100].tolist(), [], []]
+        assert fh.num_reads == 1
+        assert read_stats["num_reads"] == 1
+
+    def test_memory_mapped_file(self, samples, tmp_path):
+        path = tmp_path / "samples.dat"
+        path.write_bytes(samples.tobytes())
+        recs = [make_rec(200 * idx, 100) for idx in range(3)] + [make_rec(10**9, 0)]
+
+        with open(path, "rb") as fh, mmap.mmap(fh.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+            buffers = data_reader.read_records(mapped, recs, max_gap=0)
+            assert get_samples(recs, buffers) == [samples[100 * idx : 100 * idx + 100].tolist() for idx in range(3)] + [
+                []
+            ]
+            del buffers
+
+
+class TestTraceData:
+
+    @pytest.fixture
+    def samples(self):
+        return np.arange(300, dtype="<i2")
+
+    @pytest.fixture
+    def traces(self, samples):
+        fh = CountingFile(samples.tobytes())
+        read_stats = {"num_seeks": 0, "num_reads": 0, "num_bytes": 0}
+
+        def get_file():
+            return fh
+
+        return [data_reader.TraceData(make_rec(200 * idx, 100), get_file, False, read_stats) for idx in range(3)]
+
+    def test_len_does_not_read(self, traces):
+        assert len(traces[0]) == 100
+        assert not traces[0].is_loaded
+        assert traces[0].get_file().num_reads == 0
+
+    def test_attribute_access(self, traces, samples):
+        trace = traces[1]
+
+        assert trace.shape == (100,)
+        assert trace.dtype == np.float64
+        assert trace.ndim == 1
+        assert trace.is_loaded
+        assert trace.mean() == samples[100:200].mean()
+        assert trace.max() == 199
+
+        copied = trace.copy()
+        assert isinstance(copied, np.ndarray)
+        assert copied.tolist() == samples[100:200].tolist()
+        assert trace.tolist() == samples[100:200].tolist()
+        assert trace.get_file().num_reads == 1
+
+    def test_array_use(self, traces, samples):
+        trace = traces[2]
+
+        assert isinstance(np.asarray(trace), np.ndarray)
+        assert trace[0] == 200
+        assert (trace * 2).tolist() == (samples[200:] * 2).tolist()
+        assert np.mean(trace) == samples[200:].mean()
+        assert trace.get_file().num_reads == 1
+
+    def test_unknown_attribute(self, traces):
+        with pytest.raises(AttributeError):
+            traces[0].not_an_attribute
+
+    def test_special_names_do_not_read(self, traces):
+        assert not hasattr(traces[0], "__array_interface__")
+        assert not traces[0].is_loaded
+
+    def test_load_trace_data_reads_together(self, traces, samples):
+        data_reader.load_trace_data(traces, max_gap=0)
+
+        assert all(trace.is_loaded for trace in traces)
+        assert [trace.tolist() for trace in traces] == [
+            samples[100 * idx : 100 * idx + 100].tolist() for idx in range(3)
+        ]
+        assert traces[0].get_file().num_reads == 1
+        assert traces[0].read_stats == {"num_seeks": 1, "num_reads": 1, "num_bytes": 600}
+
+    def test_load_samples(self, traces, samples):
+        trace_samples = traces[0].load_samples()
+
+        assert trace_samples.dtype == np.dtype("<i2")
+        assert trace_samples.tolist() == samples[:100].tolist()
+        assert not traces[0].is_loaded
+        assert not traces[0].has_samples
+
+    def test_pickle_and_copy(self, traces, samples):
+        assert pickle.loads(pickle.dumps(traces[0])).tolist() == samples[:100].tolist()
+        assert copy.deepcopy(traces[1]).tolist() == samples[100:200].tolist()
+        assert copy.copy(traces[2]).tolist() == samples[200:].tolist()
@@ -0,0 +1,617 @@
+"""
+Tests of LoadHeka options on small synthetic files (see synthetic_files.py), which can be run without the
+PatchMaster test files used by test_load_heka.py.
+"""
+
+import io
+import numpy as np
+import pytest
+from load_heka_python import load_heka
+from load_heka_python.load_heka import REQUIRED_FIELDS, TREE_KEYS, LoadHeka
+from load_heka_python.readers import data_reader
+from load_heka_python.trees.SharedTrees import LeafRecord, RecordRow, TreeRecord
+from .synthetic_files import write_heka_file
+
+
+@pytest.fixture(scope="module")
+def synthetic_file(tmp_path_factory):
+    path = tmp_path_factory.mktemp("heka") / "synthetic_v1000.dat"
+    return write_heka_file(path, "v1000"), str(path)
+
+
+@pytest.fixture(scope="module", params=["v1000", "v9", "v9_pre_2x90"])
+def schema_file(request, tmp_path_factory):
+    """
+    Synthetic file of each schema
+    """
+    path = tmp_path_factory.mktemp("heka") / "synthetic_{0}.dat".format(request.param)
+    return write_heka_file(path, request.param, seed=1), str(path)
+
+
+@pytest.fixture
+def opened_files(monkeypatch):
+    """
+    List of the file handles opened by LoadHeka during the test.
+    """
+    opened_files = []
+
+    def open_file(*args, **kwargs):
+        fh = io.open(*args, **kwargs)
+        opened_files.append(fh)
+        return fh
+
+    monkeypatch.setattr(load_heka, "open", open_file)
+    return opened_files
+
+
+def walk_tree(record, level=0, path=()):
+    """
+    Yield (level, path, record) for a record of a parsed tree and all records below it, depth first (see
+    LoadHeka.iter_records()).
+    """
+    yield level, path, record
+    for idx, child in enumerate(record.get("ch", [])):
+        yield from walk_tree(child, level + 1, path + (idx,))
+
+
+def get_headers(tree):
+    return [dict(record["hd"]) for __, __, record in walk_tree(tree)]
+
+
+def assert_series_data_equal(data, expected):
+    assert data.keys() == expected.keys()
+    for key in expected:
+        if isinstance(expected[key], np.ndarray):
+            np.testing.assert_array_equal(data[key], expected[key])
+        else:
+            assert data[key] == expected[key], key
+
+
+class TestFields:
+
+    @pytest.mark.parametrize(
+        "fields",
+        [
+            {"NotARecord": ["TrLabel"]},
+            {"TraceRecord": ["TrLabel", "NotAnEntry"]},
+        ],
+    )
+    def test_unknown_names_raise_and_close_file(self, synthetic_file, opened_files, fields):
+        __, path = synthetic_file
+
+        with pytest.raises(BaseException, match="NotA"):
+            LoadHeka(path, fields=fields)
+
+        assert len(opened_files) == 1
+        assert opened_files[0].closed
+
+    def test_unknown_entry_of_other_tree_raises_on_open(self, synthetic_file, opened_files):
+        """
+        Entries of trees that are parsed on first access (e.g. pgf) are checked on initialisation.
+        """
+        __, path = synthetic_file
+
+        with pytest.raises(BaseException, match="NotAnEntry is not an entry of StimChannelRecord"):
+            LoadHeka(path, fields={"StimChannelRecord": ["NotAnEntry"]})
+
+        assert all(fh.closed for fh in opened_files)
+
+    def test_only_requested_and_required_entries(self, synthetic_file):
+        __, path = synthetic_file
+        fields = {"TraceRecord": ["TrSealResistance"], "SweepRecord": ["SwTime"], "GroupRecord": []}
+
+        with LoadHeka(path) as heka_file, LoadHeka(path, fields=fields) as projected_file:
+            levels = ["PulseRootRecord", "GroupRecord", "PulSeriesRecord", "SweepRecord", "TraceRecord"]
+
+            for (level, __, record), (__, __, expected) in zip(walk_tree(projected_file.pul), walk_tree(heka_file.pul)):
+                record_name = levels[level]
+                if record_name in fields:
+                    entries = set(fields[record_name]) | set(REQUIRED_FIELDS.get(record_name, []))
+                else:
+                    entries = set(expected["hd"])
+
+                assert set(record["hd"]) == entries
+                assert record["hd"] == {name: expected["hd"][name] for name in entries}
+
+    def test_projection_of_other_trees(self, synthetic_file):
+        __, path = synthetic_file
+
+        with LoadHeka(path) as heka_file, LoadHeka(path, fields={"StimChannelRecord": ["chDacUnit"]}) as projected_file:
+            channels = [channel for stim in projected_file.pgf["ch"] for channel in stim["ch"]]
+
+            assert channels
+            assert all(channel["hd"] == {"chDacUnit": "V"} for channel in channels)
+            assert get_headers(projected_file.pgf["ch"][0]["ch"][0]["ch"][0]) == get_headers(
+                heka_file.pgf["ch"][0]["ch"][0]["ch"][0]
+            )
+
+    def test_series_data_with_only_required_entries(self, synthetic_file):
+        __, path = synthetic_file
+        fields = {"TraceRecord": [], "SweepRecord": [], "PulSeriesRecord": [], "GroupRecord": []}
+
+        with LoadHeka(path) as heka_file, LoadHeka(path, fields=fields) as projected_file:
+            for series_idx, channel_idx in [(0, 0), (1, 2), (2, 1)]:
+                assert_series_data_equal(
+                    projected_file.get_series_data(0, series_idx, channel_idx),
+                    heka_file.get_series_data(0, series_idx, channel_idx),
+                )
+
+
+class TestScanMode:
+
+    def test_same_groups_and_series_as_full_parse(self, synthetic_file):
+        __, path = synthetic_file
+
+        with LoadHeka(path) as heka_file, LoadHeka(path, scan_mode=True) as scanned_file:
+            assert scanned_file.pul["hd"] == heka_file.pul["hd"]
+            assert len(scanned_file.pul["ch"]) == len(heka_file.pul["ch"])
+
+            for group, expected_group in zip(scanned_file.pul["ch"], heka_file.pul["ch"]):
+                assert group["hd"] == expected_group["hd"]
+                assert [series["hd"] for series in group["ch"]] == [series["hd"] for series in expected_group["ch"]]
+                assert all(series["ch"] == [] for series in group["ch"])
+
+            with pytest.raises(AssertionError):
+                scanned_file.get_series_data(0, 0, 0)
+
+    def test_catalog(self, synthetic_file):
+        synthetic, path = synthetic_file
+
+        catalog = LoadHeka.catalog(path)
+
+        with LoadHeka(path) as heka_file:
+            assert catalog["version"] == heka_file.version == synthetic.version
+            assert catalog["time"] == heka_file.header["oTime"]
+            assert catalog["groups"] == [
+                {
+                    "label": group["hd"]["GrLabel"],
+                    "series": [
+                        {
+                            "label": series["hd"]["SeLabel"],
+                            "num_sweeps": len(series["ch"]),
+                            "time": series["hd"]["SeTime"],
+                        }
+                        for series in group["ch"]
+                    ],
+                }
+                for group in heka_file.pul["ch"]
+            ]
+        assert [group["label"] for group in catalog["groups"]] == ["Group0", "Group1"]
+
+
+class TestUseIndex:
+
+    def test_rows_and_records_match_full_parse(self, synthetic_file):
+        __, path = synthetic_file
+
+        with LoadHeka(path) as heka_file, LoadHeka(path, use_index=True) as indexed_file:
+            pul_index = indexed_file.pul_index
+
+            for level, path_idxs, expected in walk_tree(heka_file.pul):
+                row_level, row = pul_index.get_row(*path_idxs)
+                assert row_level == level
+                assert pul_index.get_header(level, row) == expected["hd"]
+                assert pul_index.get_num_children(level, row) == len(expected.get("ch", []))
+
+                record = indexed_file.pul
+                for idx in path_idxs:
+                    record = record["ch"][idx]
+                assert record["hd"] == expected["hd"]
+                assert sorted(record) == sorted(expected)
+
+            assert get_headers(indexed_file.pul) == get_headers(heka_file.pul)
+
+    def test_trace_fields(self, synthetic_file):
+        __, path = synthetic_file
+
+        with LoadHeka(path) as heka_file, LoadHeka(path, use_index=True) as indexed_file:
+            traces = [record["hd"] for level, __, record in walk_tree(heka_file.pul) if level == 4]
+
+            for name, values in indexed_file.pul_index.trace_fields.items():
+                assert values.tolist() == [trace[name] for trace in traces]
+
+    def test_get_row_out_of_range(self, synthetic_file):
+        __, path = synthetic_file
+
+        with LoadHeka(path, use_index=True) as indexed_file:
+            with pytest.raises(IndexError):
+                indexed_file.pul_index.get_row(2)
+            with pytest.raises(IndexError):
+                indexed_file.pul_index.get_row(0, 0, 4)
+
+    @pytest.mark.filterwarnings("ignore:Data already exists")
+    def test_series_data_and_channels(self, synthetic_file):
+        __, path = synthetic_file
+
+        with LoadHeka(path) as heka_file, LoadHeka(path, use_index=True) as indexed_file:
+            for group_idx, group in enumerate(heka_file.pul["ch"]):
+                assert indexed_file.get_channels(group_idx) == heka_file.get_channels(group_idx)
+
+                for series_idx, series in enumerate(group["ch"]):
+                    assert indexed_file.get_series_channels(group_idx, series_idx) == heka_file.get_series_channels(
+                        group_idx, series_idx
+                    )
+
+                    for channel_idx in range(len(series["ch"][0]["ch"])):
+                        assert_series_data_equal(
+                            indexed_file.get_series_data(group_idx, series_idx, channel_idx),
+                            heka_file.get_series_data(group_idx, series_idx, channel_idx),
+                        )
+
+
+class TestCompact:
+
+    @pytest.mark.parametrize("key", TREE_KEYS)
+    def test_records_equal_dict_records(self, schema_file, key):
+        __, path = schema_file
+
+        with LoadHeka(path) as heka_file, LoadHeka(path, compact=True) as compact_file:
+            tree, compact_tree = getattr(heka_file, key), getattr(compact_file, key)
+            if tree is None:
+                assert compact_tree is None
+                return
+
+            records = list(walk_tree(tree))
+            compact_records = list(walk_tree(compact_tree))
+            assert [path_idxs for __, path_idxs, __ in compact_records] == [path_idxs for __, path_idxs, __ in records]
+
+            num_levels = max(level for level, __, __ in records) + 1
+            for (level, __, compact_record), (__, __, record) in zip(compact_records, records):
+                is_leaf = level == num_levels - 1
+
+                assert isinstance(compact_record, LeafRecord if key == "pul" and is_leaf else TreeRecord)
+                assert isinstance(compact_record["hd"], RecordRow if is_leaf else dict)
+                assert compact_record["hd"] == record["hd"]
+                assert dict(compact_record["hd"]) == record["hd"]
+                assert list(compact_record["hd"]) == list(record["hd"])
+                assert sorted(compact_record) == sorted(record)
+
+    def test_nested_and_string_entries(self, schema_file):
+        """
+        Leaf headers with substructures (AmplStateRecord of v9) and C strings (TrLabel, TrYUnit) are read as from
+        the header dicts.
+        """
+        synthetic, path = schema_file
+
+        with LoadHeka(path) as heka_file, LoadHeka(path, compact=True) as compact_file:
+            trace = compact_file.pul["ch"][0]["ch"][1]["ch"][0]["ch"][2]["hd"]
+            expected = heka_file.pul["ch"][0]["ch"][1]["ch"][0]["ch"][2]["hd"]
+
+            assert trace["TrLabel"] == expected["TrLabel"] == "Leak"
+            assert trace["TrYUnit"] == expected["TrYUnit"] == "A"
+            assert isinstance(trace["TrDataPoints"], int) and not isinstance(trace["TrDataPoints"], np.generic)
+            assert isinstance(trace["TrDataScaler"], float) and not isinstance(trace["TrDataScaler"], np.generic)
+
+            if synthetic.schema.name == "v9":
+                state = compact_file.amp["ch"][0]["ch"][0]["hd"]
+                expected_state = heka_file.amp["ch"][0]["ch"][0]["hd"]
+
+                assert state["AmAmplifierState"] == expected_state["AmAmplifierState"]
+                assert (
+                    state["AmAmplifierState"][0]["sSerialNumber"]
+                    == expected_state["AmAmplifierState"][0]["sSerialNumber"]
+                )
+
+    def test_record_entries(self, synthetic_file):
+        __, path = synthetic_file
+
+        with LoadHeka(path, compact=True) as compact_file:
+            sweep = compact_file.pul["ch"][0]["ch"][0]["ch"][0]
+            trace = sweep["ch"][0]
+
+            assert list(sweep) == ["hd", "ch"]
+            assert list(trace) == ["hd", "data"]
+
+            trace["data"] = "data"
+            assert trace["data"] == "data"
+
+            with pytest.raises(KeyError):
+                trace["ch"]
+            with pytest.raises(KeyError):
+                trace["ch"] = []
+            with pytest.raises(TypeError):
+                del trace["data"]
+            with pytest.raises(TypeError):
+                trace["hd"]["TrLabel"] = "Vmon"
+
+    @pytest.mark.filterwarnings("ignore:Data already exists")
+    def test_series_data(self, synthetic_file):
+        __, path = synthetic_file
+
+        with LoadHeka(path) as heka_file, LoadHeka(path, compact=True) as compact_file:
+            for series_idx, channel_idx in [(0, 0), (1, 2), (2, 1)]:
+                assert_series_data_equal(
+                    compact_file.get_series_data(1, series_idx, channel_idx),
+                    heka_file.get_series_data(1, series_idx, channel_idx),
+                )
+
+
+class TestParallel:
+
+    @pytest.mark.parametrize("parallel", ["thread", "process"])
+    def test_trees_equal_serial(self, schema_file, parallel):
+        __, path = schema_file
+
+        with LoadHeka(path) as heka_file, LoadHeka(path, parallel=parallel) as parallel_file:
+            for key in TREE_KEYS:
+                tree, parallel_tree = getattr(heka_file, key), getattr(parallel_file, key)
+
+                if tree is None:
+                    assert parallel_tree is None
+                else:
+                    assert get_headers(parallel_tree) == get_headers(tree)
+
+            assert parallel_file.tree_parse_times.keys() == heka_file.tree_parse_times.keys()
+            assert parallel_file.read_stats["num_bytes"] == heka_file.read_stats["num_bytes"]
+
+    @pytest.mark.parametrize("parallel", ["thread", "process"])
+    @pytest.mark.filterwarnings("ignore:Data already exists")
+    def test_series_data(self, synthetic_file, parallel):
+        __, path = synthetic_file
+
+        with LoadHeka(path) as heka_file, LoadHeka(path, parallel=parallel) as parallel_file:
+            for series_idx, channel_idx in [(0, 1), (1, 2), (2, 0)]:
+                assert_series_data_equal(
+                    parallel_file.get_series_data(0, series_idx, channel_idx),
+                    heka_file.get_series_data(0, series_idx, channel_idx),
+                )
+
+
+class TestMmapBackend:
+
+    def test_trees_equal_file_backend(self, schema_file):
+        __, path = schema_file
+
+        with LoadHeka(path) as heka_file, LoadHeka(path, backend="mmap") as mmap_file:
+            assert mmap_file.header == heka_file.header
+
+            for key in TREE_KEYS:
+                tree, mmap_tree = getattr(heka_file, key), getattr(mmap_file, key)
+                assert (mmap_tree is None) if tree is None else get_headers(mmap_tree) == get_headers(tree)
+
+    @pytest.mark.parametrize("kwargs", [{}, {"raw": True}, {"dtype": "float32"}])
+    @pytest.mark.filterwarnings("ignore:Data already exists")
+    def test_series_data(self, schema_file, kwargs):
+        __, path = schema_file
+
+        with LoadHeka(path) as heka_file, LoadHeka(path, backend="mmap") as mmap_file:
+            for group_idx, series_idx, channel_idx in [(0, 0, 1), (0, 1, 2), (1, 2, 0), (1, 2, 1)]:
+                assert_series_data_equal(
+                    mmap_file.get_series_data(group_idx, series_idx, channel_idx, **kwargs),
+                    heka_file.get_series_data(group_idx, series_idx, channel_idx, **kwargs),
+                )
+
+            assert mmap_file.data_read_stats == heka_file.data_read_stats
+
+    @pytest.mark.parametrize("use_index", [False, True])
+    def test_close(self, synthetic_file, use_index):
+        """
+        The mapping is closed with the file, or once the views onto it (e.g. held by the pulse tree index) are
+        deleted.
+        """
+        __, path = synthetic_file
+
+        heka_file = LoadHeka(path, backend="mmap", use_index=use_index)
+        data = heka_file.get_series_data(0, 0, 0)["data"]
+        expected = data.copy()
+        fh = heka_file.fh
+
+        heka_file.close()
+
+        assert heka_file.fh is None and heka_file.mmap is None
+        assert fh.closed
+        assert heka_file.pul["ch"][0]["ch"][0]["ch"][0]["ch"][0]["hd"]["TrLabel"] == "Imon"
+        np.testing.assert_array_equal(data, expected)
+
+        heka_file.open()
+        assert heka_file.mmap is not None
+        assert heka_file.pgf is not None
+        heka_file.close()
+
+
+class TestCloseAndOpen:
+
+    @pytest.mark.parametrize("backend", ["file", "mmap"])
+    def test_data_after_close(self, synthetic_file, backend):
+        """
+        The data of the other channels of a series is not read by get_series_data() and so cannot be read once the
+        file is closed, until it is opened again.
+        """
+        __, path = synthetic_file
+
+        with LoadHeka(path) as heka_file:
+            expected = heka_file.get_series_data(0, 0, 1)["data"]
+
+        heka_file = LoadHeka(path, backend=backend)
+        heka_file.get_series_data(0, 0, 0)
+        sweeps = heka_file.pul["ch"][0]["ch"][0]["ch"]
+        heka_file.close()
+
+        with pytest.raises(BaseException, match="File is closed"):
+            sweeps[0]["ch"][1]["data"].load()
+
+        heka_file.open()
+        for sweep_idx, sweep in enumerate(sweeps):
+            np.testing.assert_array_equal(sweep["ch"][1]["data"], expected[sweep_idx])
+        heka_file.close()
+
+
+class TestDataReads:
+
+    @staticmethod
+    def get_ranges(heka_file, group_idx, series_idx, channel_idxs):
+        sweeps = heka_file.pul["ch"][group_idx]["ch"][series_idx]["ch"]
+        return [data_reader.get_record_range(sweep["ch"][idx]) for sweep in sweeps for idx in channel_idxs]
+
+    @pytest.mark.parametrize("series_idx", [0, 1])
+    def test_only_channel_read(self, synthetic_file, series_idx):
+        """
+        The traces of a series that is not interleaved are stored one after the other, so the records of one channel
+        are separated by the other channels' data, which is not read.
+        """
+        __, path = synthetic_file
+
+        with LoadHeka(path) as heka_file:
+            heka_file.get_series_data(0, series_idx, 1)
+            ranges = self.get_ranges(heka_file, 0, series_idx, [1])
+
+            assert heka_file.data_read_stats["num_reads"] == len(ranges)
+            assert heka_file.data_read_stats["num_bytes"] == sum(stop - start for start, stop in ranges)
+
+    def test_max_read_gap(self, synthetic_file):
+        __, path = synthetic_file
+
+        with LoadHeka(path, max_read_gap=4096) as heka_file:
+            heka_file.get_series_data(0, 0, 0)
+            ranges = self.get_ranges(heka_file, 0, 0, [0])
+
+            assert heka_file.data_read_stats["num_reads"] == 1
+            assert heka_file.data_read_stats["num_bytes"] == ranges[-1][1] - ranges[0][0]
+
+    def test_interleaved_read_once(self, synthetic_file):
+        """
+        Records of one channel of an interleaved series span their whole sweep, so each sweep is read once. The records
+        of all channels of a sweep overlap and consecutive sweeps are stored next to each other, so all channels of
+        the series are read at once.
+        """
+        __, path = synthetic_file
+
+        with LoadHeka(path) as heka_file:
+            heka_file.get_series_data(0, 2, 0)
+            ranges = self.get_ranges(heka_file, 0, 2, [0])
+
+            assert heka_file.data_read_stats["num_reads"] == len(ranges)
+            assert heka_file.data_read_stats["num_bytes"] == sum(stop - start for start, stop in ranges)
+
+        with LoadHeka(path) as heka_file:
+            data_reader.fill_pul_with_data(
+                heka_file.pul, heka_file._get_data_file, 0, 2, True, heka_file.data_read_stats
+            )
+            sweeps = heka_file.pul["ch"][0]["ch"][2]["ch"]
+            data_reader.load_trace_data([trace["data"] for sweep in sweeps for trace in sweep["ch"]])
+            ranges = self.get_ranges(heka_file, 0, 2, [0, 1])
+
+            assert heka_file.data_read_stats["num_reads"] == 1
+            assert heka_file.data_read_stats["num_bytes"] == max(ranges)[1] - min(ranges)[0]
+
+
+@pytest.mark.filterwarnings("ignore:Data already exists")
+class TestGetSeriesData:
+
+    @staticmethod
+    def get_expected(synthetic, group_idx, series_idx, channel_idx):
+        """
+        The data written scaled as in the file (see SyntheticFile): integer samples by TrDataScaler, then minus
+        TrZeroData. Shorter sweeps are padded with NaN.
+        """
+        samples = [
+            sweep_samples
+            for (*sweep_key, trace_idx), sweep_samples in sorted(synthetic.samples.items())
+            if sweep_key[:2] == [group_idx, series_idx] and trace_idx == channel_idx
+        ]
+        scale = (1e-3 if channel_idx % 2 else 1e-12) if np.issubdtype(samples[0].dtype, np.integer) else 1.0
+
+        expected = np.full([len(samples), max(len(sweep) for sweep in samples)], np.nan)
+        for sweep_idx, sweep in enumerate(samples):
+            expected[sweep_idx, : len(sweep)] = sweep * scale - 0.001 * channel_idx
+
+        return expected
+
+    @pytest.mark.parametrize("group_idx, series_idx, channel_idx", [(0, 0, 0), (0, 1, 1), (0, 1, 2), (1, 2, 1)])
+    def test_data(self, synthetic_file, group_idx, series_idx, channel_idx):
+        synthetic, path = synthetic_file
+
+        with LoadHeka(path) as heka_file:
+            data = heka_file.get_series_data(group_idx, series_idx, channel_idx)
+
+        assert data["data"].dtype == np.float64 and data["dtype"] == "float64"
+        np.testing.assert_allclose(data["data"], self.get_expected(synthetic, group_idx, series_idx, channel_idx))
+
+    @pytest.mark.parametrize("series_idx, channel_idx", [(0, 0), (1, 1), (1, 2), (2, 1)])
+    def test_raw(self, synthetic_file, series_idx, channel_idx):
+        """
+        Raw samples times the scales minus the offsets are the default float64 data, other than the padding of
+        shorter sweeps (zero for integer samples).
+        """
+        synthetic, path = synthetic_file
+
+        with LoadHeka(path) as heka_file:
+            data = heka_file.get_series_data(0, series_idx, channel_idx)
+            raw = heka_file.get_series_data(0, series_idx, channel_idx, raw=True)
+
+        sample_dtype = synthetic.samples[(0, series_idx, 0, channel_idx)].dtype
+        assert raw["data"].dtype == sample_dtype and raw["dtype"] == sample_dtype.name
+
+        scaled = raw["data"] * raw["scales"][:, None] - raw["offsets"][:, None]
+        for sweep_idx, num_samples in enumerate(raw["num_samples"]):
+            assert (
+                raw["data"][sweep_idx, :num_samples].tolist()
+                == synthetic.samples[(0, series_idx, sweep_idx, channel_idx)].tolist()
+            )
+            np.testing.assert_allclose(
+                scaled[sweep_idx, :num_samples], data["data"][sweep_idx, :num_samples], rtol=1e-12
+            )
+
+    @pytest.mark.parametrize("series_idx, channel_idx", [(0, 0), (1, 1), (2, 1)])
+    def test_float32(self, synthetic_file, series_idx, channel_idx):
+        __, path = synthetic_file
+
+        with LoadHeka(path) as heka_file:
+            data = heka_file.get_series_data(0, series_idx, channel_idx)
+            data_float32 = heka_file.get_series_data(0, series_idx, channel_idx, dtype="float32")
+
+        assert data_float32["data"].dtype == np.float32 and data_float32["dtype"] == "float32"
+        np.testing.assert_allclose(data_float32["data"], data["data"], rtol=1e-6, atol=1e-9)
+
+    @pytest.mark.parametrize("kwargs", [{}, {"dtype": "float32"}, {"raw": True}, {"fill_with_mean": True}])
+    def test_padding(self, synthetic_file, kwargs):
+        """
+        The last sweep of series 1 is 20 samples shorter, it is padded with NaN or, for raw integer samples, zero.
+        """
+        __, path = synthetic_file
+
+        with LoadHeka(path) as heka_file:
+            data = heka_file.get_series_data(0, 1, 0, **kwargs)
+
+        num_samples = data["num_samples"]
+        assert num_samples[-1] == num_samples[0] - 20 == data["data"].shape[1] - 20
+
+        padding = data["data"][-1, num_samples[-1] :]
+        if kwargs.get("raw"):
+            assert padding.tolist() == [0] * 20
+        elif kwargs.get("fill_with_mean"):
+            np.testing.assert_allclose(padding, np.mean(data["data"][-1, : num_samples[-1]]))
+        else:
+            assert np.isnan(padding).all()
+        assert not np.isnan(data["data"][:, : num_samples[-1]]).any()
+        assert not np.isnan(data["data"][:-1]).any()
+
+
+class TestIterRecords:
+
+    @pytest.mark.parametrize("key", TREE_KEYS)
+    def test_matches_depth_first_walk(self, schema_file, key):
+        __, path = schema_file
+
+        with LoadHeka(path) as heka_file:
+            records = list(heka_file.iter_records("." + key))
+            tree = getattr(heka_file, key)
+
+            if tree is None:
+                assert records == []
+                return
+
+            expected = [(level, path_idxs, record["hd"]) for level, path_idxs, record in walk_tree(tree)]
+            assert [record[:2] for record in records] == [record[:2] for record in expected]
+            assert records == expected
+
+    def test_first_records(self, synthetic_file):
+        __, path = synthetic_file
+
+        with LoadHeka(path) as heka_file:
+            records = heka_file.iter_records(".pul")
+            assert next(records)[:2] == (0, ())
+            assert next(records)[:2] == (1, (0,))
+            assert next(records)[:2] == (2, (0, 0))
+            assert next(records)[:2] == (3, (0, 0, 0))
+            assert next(records)[:2] == (4, (0, 0, 0, 0))
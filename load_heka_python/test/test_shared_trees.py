@@ -0,0 +1,307 @@
+import copy
+import pickle
+import struct
+import warnings
+import numpy as np
+import pytest
+from load_heka_python.readers import stim_reader
+from load_heka_python.trees import TreeSchemas
+from load_heka_python.trees.SharedTrees import (
+    BIT_FLAG_DECODERS,
+    AmplifierState_v9,
+    DataKind,
+    LazySubstruct,
+    StimToDacID,
+    UserParamDescrType,
+    cstr,
+    cstr_column,
+    get_compiled_description,
+    get_entry_details,
+)
+from .synthetic_files import pack_record
+
+WIDTH = 8
+
+ROWS = {
+    "empty": [b"\x00" * WIDTH],
+    "short": [b"Imon\x00\x00\x00\x00", b"Vmon\x00\x00\x00\x00"],
+    "bytes_after_null": [b"Imon\x00abc", b"Imon\x00xyz", b"Imon\x00\x00\x00\x00"],
+    "no_null": [b"ABCDEFGH", b"Imon\x00\x00\x00\x00"],
+    "all_no_null": [b"ABCDEFGH", b"ABCDEFGH"],
+    "full_minus_one": [b"ABCDEFG\x00", b"AB\x00CDEFG"],
+    "utf8": ["µA\x00".encode("utf-8") + b"\x00" * 4],
+    "invalid_utf8": [b"\xff\xfeA\x00\x00\x00\x00\x00"],
+    "trailing_spaces": [b"A  \x00\x00\x00\x00\x00", b"A\x00\x00\x00\x00\x00\x00\x00"],
+    "mixed": [b"Imon\x00abc", b"\x00" * WIDTH, b"ABCDEFGH", b"Vmon\x00\x00\x00\x00", b"Imon\x00\x00\x00\x00"],
+}
+
+
+class TestCstrColumn:
+    """
+    cstr_column() must give the same result as cstr() record by record.
+    """
+
+    @pytest.mark.parametrize("name", ROWS.keys())
+    @pytest.mark.parametrize("dtype", ["V{0}".format(WIDTH), "S{0}".format(WIDTH)])
+    def test_matches_cstr(self, name, dtype):
+        rows = ROWS[name]
+        column = np.frombuffer(b"".join(rows), dtype=dtype)
+
+        assert cstr_column(column) == [cstr(row) for row in rows]
+
+    def test_no_rows(self):
+        assert cstr_column(np.zeros(0, dtype="V{0}".format(WIDTH))) == []
+
+    def test_column_of_structured_array(self):
+        rows = ROWS["mixed"]
+        records = np.zeros(len(rows), dtype=[("before", "<i4"), ("label", "V{0}".format(WIDTH)), ("after", "<f8")])
+        records["label"] = [np.void(row) for row in rows]
+
+        assert cstr_column(records["label"]) == [cstr(row) for row in rows]
+
+
+SCHEMA_RECORDS = [
+    (schema_name, record_name)
+    for schema_name in ["v9", "v1000"]
+    for record_name in TreeSchemas.get_schema_by_name(schema_name).records
+]
+
+
+def pack_records(Record, endian, num_records=5, seed=0):
+    """
+    Pack records of random values (see synthetic_files.pack_record()) one after the other, each followed by its
+    number of children, as stored at the lowest level of a tree.
+    """
+    rng = np.random.default_rng(seed)
+    return b"".join(pack_record(Record, rng, endian=endian) + struct.pack(endian + "i", 0) for __ in range(num_records))
+
+
+class TestUnpackRecords:
+    """
+    Records unpacked together with numpy (CompiledDescription.unpack_records(), unpack_columns()) must be decoded
+    exactly as when unpacked one at a time with struct (CompiledDescription.unpack()).
+    """
+
+    @pytest.mark.parametrize("schema_name, record_name", SCHEMA_RECORDS)
+    @pytest.mark.parametrize("endian", ["<", ">"])
+    def test_matches_struct(self, schema_name, record_name, endian):
+        Record = TreeSchemas.get_schema_by_name(schema_name).records[record_name]
+        fields = None
+
+        if endian == ">":  # bit options are only decoded for little endian, in both paths
+            entries = [get_entry_details(entry) for entry in Record().description]
+            fields = [name for name, __, decoder in entries if decoder not in BIT_FLAG_DECODERS]
+
+        compiled = get_compiled_description(Record(), endian, fields)
+        buffer = pack_records(Record, endian)
+
+        headers, nchilds = compiled.unpack_records(buffer, endian)
+
+        record_size = compiled.size + 4
+        assert len(headers) == len(buffer) // record_size
+        assert headers == [compiled.unpack(buffer, offset)[0] for offset in range(0, len(buffer), record_size)]
+        assert nchilds.tolist() == [0] * len(headers)
+
+    def test_substructures_are_decoded(self):
+        Record = TreeSchemas.get_schema_by_name("v9").PulSeriesRecord
+        compiled = get_compiled_description(Record())
+        buffer = pack_records(Record, "<", num_records=1)
+
+        header = compiled.unpack_records(buffer)[0][0]
+        expected = compiled.unpack(buffer)[0]
+
+        assert len(header["SeAmplifierState"]) == 1
+        assert header["SeAmplifierState"][0] == expected["SeAmplifierState"][0]
+        assert header["SeAmplifierState"][0]["sSerialNumber"] == expected["SeAmplifierState"][0]["sSerialNumber"]
+
+    def test_nchilds(self):
+        Record = TreeSchemas.get_schema_by_name("v1000").TraceRecord
+        rng = np.random.default_rng(0)
+        buffer = b"".join(pack_record(Record, rng) + struct.pack("<i", num) for num in [0, 3, 7])
+
+        __, nchilds = get_compiled_description(Record()).unpack_records(buffer)
+
+        assert nchilds.tolist() == [0, 3, 7]
+
+
+class TestLazySubstruct:
+    """
+    LazySubstruct must behave as the tuple of header dicts decoded eagerly by CompiledDescription.unpack().
+    """
+
+    @pytest.fixture
+    def description(self):
+        return UserParamDescrType(4)
+
+    @pytest.fixture
+    def raw(self):
+        rng = np.random.default_rng(0)
+        names = [{"Name": "Param{0}".format(idx).encode().ljust(32, b"\0")} for idx in range(4)]
+        return b"".join(pack_record(UserParamDescrType, rng, values) for values in names)
+
+    @pytest.fixture
+    def expected(self, description, raw):
+        return get_compiled_description(description).unpack(raw)
+
+    def test_not_decoded_until_accessed(self, description, raw):
+        substruct = LazySubstruct(raw, description)
+
+        assert len(substruct) == 4
+        assert substruct._records is None
+
+        substruct[0]
+        assert substruct._records is not None
+
+    def test_equals_eager_decoding(self, description, raw, expected):
+        substruct = LazySubstruct(raw, description)
+
+        assert substruct == expected
+        assert expected == substruct
+        assert substruct == LazySubstruct(raw, description)
+        assert tuple(substruct) == expected
+        assert [header["Name"] for header in substruct] == ["Param0", "Param1", "Param2", "Param3"]
+
+    def test_not_equal_to_other_values(self, description, raw, expected):
+        substruct = LazySubstruct(raw, description)
+
+        assert substruct != expected[:3]
+        assert substruct != LazySubstruct(raw[40:] + raw[:40], description)
+
+    def test_indexing_and_slicing(self, description, raw, expected):
+        substruct = LazySubstruct(raw, description)
+
+        assert len(substruct) == len(expected)
+        assert substruct[0] == expected[0]
+        assert substruct[-1] == expected[-1]
+        assert substruct[1:3] == expected[1:3]
+        assert substruct[::2] == expected[::2]
+        assert substruct.index(expected[2]) == 2
+
+        with pytest.raises(IndexError):
+            substruct[4]
+
+    @pytest.mark.parametrize("decode_first", [False, True])
+    def test_pickle_and_copy(self, description, raw, expected, decode_first):
+        substruct = LazySubstruct(raw, description)
+        if decode_first:
+            substruct[0]
+
+        for loaded in [pickle.loads(pickle.dumps(substruct)), copy.deepcopy(substruct)]:
+            assert isinstance(loaded, LazySubstruct)
+            assert loaded._records is None
+            assert loaded == expected
+
+    def test_nested_in_record(self):
+        """
+        Substructures of a record decoded with unpack() and unpack_records() are LazySubstruct, with the endian
+        of the record.
+        """
+        rng = np.random.default_rng(0)
+        Record = TreeSchemas.get_schema_by_name("v9").PulSeriesRecord
+        raw = pack_record(Record, rng, endian=">")
+        compiled = get_compiled_description(Record(), ">")
+
+        substruct = compiled.unpack(raw)[0]["SeAmplifierState"]
+
+        assert isinstance(substruct, LazySubstruct)
+        assert substruct.endian == ">"
+        assert substruct == get_compiled_description(AmplifierState_v9(), ">").unpack(bytes(substruct.raw))
+
+
+DATA_KIND_NAMES = ["IsLittleEndian", "IsLeak", "IsVirtual", "IsImon", "IsVmon", "Clip"]
+
+STIM_TO_DAC_ID_NAMES = [
+    "UseStimScale",
+    "UseRelative",
+    "UseFileTemplate",
+    "UseForLockIn",
+    "UseForWavelength",
+    "UseScaling",
+    "UseForChirp",
+    "UseForImaging",
+]
+
+# int16 entry values, the bits above the options are ignored
+VALUES = list(range(256)) + [256, 257, 0x4001, -1, -32768]
+
+
+def byte_to_option_dict(names, value):
+    """
+    Dict of bools of each option decoded from the low byte of the value, as decoded before BitFlags.
+    """
+    bits = np.unpackbits(np.array(value & 0xFF, dtype=np.uint8), bitorder="little").astype(bool)
+    return dict(zip(names, bits.tolist()))
+
+
+class TestBitFlags:
+    """
+    BitFlags must read as the dict of bools previously decoded for TrDataKind and chStimToDacID.
+    """
+
+    @pytest.mark.parametrize("Flags, names", [(DataKind, DATA_KIND_NAMES), (StimToDacID, STIM_TO_DAC_ID_NAMES)])
+    def test_from_byte(self, Flags, names):
+        for value in VALUES:
+            flags = Flags.from_byte(value, "<")
+            expected = byte_to_option_dict(names, value)
+
+            assert flags.as_dict() == expected
+            assert list(flags.keys()) == names
+            assert {name: flags[name] for name in names} == expected
+            assert Flags(int(flags)) == flags
+
+    @pytest.mark.parametrize("Flags", [DataKind, StimToDacID])
+    def test_from_column(self, Flags):
+        column = np.array(VALUES, dtype=np.int16)
+
+        flags = Flags.from_column(column, "<")
+
+        assert flags == [Flags.from_byte(value, "<") for value in column.tolist()]
+        assert [item.as_dict() for item in flags] == [Flags.from_byte(value, "<").as_dict() for value in VALUES]
+        assert flags[0] is flags[256]  # shared between records of the same value
+
+    @pytest.mark.parametrize("Flags", [DataKind, StimToDacID])
+    def test_big_endian_not_supported(self, Flags):
+        with pytest.raises(AssertionError):
+            Flags.from_byte(1, ">")
+        with pytest.raises(AssertionError):
+            Flags.from_column(np.array([1], dtype=">i2"), ">")
+
+    def test_unknown_option(self):
+        with pytest.raises(KeyError):
+            DataKind.from_byte(1, "<")["UseStimScale"]
+
+    @pytest.mark.parametrize("experimental_mode", [False, True])
+    def test_stim_reader_options(self, experimental_mode):
+        """
+        stim_reader reads chStimToDacID options by name, e.g. chStimToDacID["UseRelative"]
+        """
+        with warnings.catch_warnings():
+            warnings.simplefilter("ignore")
+
+            for value in range(256):
+                dac = {"hd": {"chStimToDacID": StimToDacID.from_byte(value, "<")}}
+                expected_dac = {"hd": {"chStimToDacID": byte_to_option_dict(STIM_TO_DAC_ID_NAMES, value)}}
+
+                assert stim_reader.check_header(dac, experimental_mode) == stim_reader.check_header(
+                    expected_dac, experimental_mode
+                )
+
+    def test_stim_reader_use_relative(self):
+        stim_sweep = {
+            "hd": {"stSampleInterval": 1e-4, "stNumberSweeps": 1},
+            "ch": [
+                {
+                    "hd": {
+                        "chDacUnit": "V",
+                        "chHolding": 0.0,
+                        "chStimToDacID": StimToDacID.from_byte(value, "<"),
+                    },
+                    "ch": [{"hd": {"seVoltage": 0.01}}],
+                }
+                for value in [StimToDacID.UseStimScale, StimToDacID.UseStimScale | StimToDacID.UseRelative]
+            ],
+        }
+
+        for stim_channel_idx, use_relative in [(0, False), (1, True)]:
+            __, info = stim_reader.get_dac_and_important_params(stim_sweep, stim_channel_idx, 1)
+            assert info["use_relative"] is use_relative
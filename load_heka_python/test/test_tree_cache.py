@@ -0,0 +1,94 @@
+import os
+import pytest
+from load_heka_python.readers import tree_cache
+
+
+class TestTreeCache:
+    """
+    Cache keys, eviction and recovery of readers/tree_cache.py, on small files written to tmp_path.
+    """
+
+    @pytest.fixture
+    def heka_path(self, tmp_path):
+        path = tmp_path / "file.dat"
+        path.write_bytes(b"\x00" * 100)
+        return str(path)
+
+    @pytest.fixture
+    def header(self):
+        return {"oTime": 1234.5}
+
+    def test_key_is_stable_for_unchanged_file(self, heka_path, header):
+        assert tree_cache.get_file_key(heka_path, header) == tree_cache.get_file_key(heka_path, header)
+
+    def test_key_changes_with_size(self, heka_path, header):
+        key = tree_cache.get_file_key(heka_path, header)
+
+        stat = os.stat(heka_path)
+        with open(heka_path, "ab") as fh:
+            fh.write(b"\x00")
+        os.utime(heka_path, ns=(stat.st_atime_ns, stat.st_mtime_ns))
+
+        assert tree_cache.get_file_key(heka_path, header) != key
+
+    def test_key_changes_with_mtime(self, heka_path, header):
+        key = tree_cache.get_file_key(heka_path, header)
+
+        stat = os.stat(heka_path)
+        os.utime(heka_path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10**9))
+
+        assert tree_cache.get_file_key(heka_path, header) != key
+
+    def test_key_changes_with_header_time_and_options(self, heka_path, header):
+        key = tree_cache.get_file_key(heka_path, header)
+
+        assert tree_cache.get_file_key(heka_path, {"oTime": 1.0}) != key
+        assert tree_cache.get_file_key(heka_path, header, options=(None, True, False)) != key
+
+    def test_save_and_load(self, tmp_path):
+        tree = {"hd": {"RoVersion": 1}, "ch": [{"hd": {"GrLabel": "E-1"}, "ch": []}]}
+        tree_cache.save_tree(str(tmp_path), "key", "pul", tree)
+
+        assert tree_cache.load_tree(str(tmp_path), "key", "pul") == tree
+        assert tree_cache.load_tree(str(tmp_path), "key", "pgf") is False
+        assert not [filename for filename in os.listdir(tmp_path) if filename.endswith(".tmp")]
+
+    def test_corrupt_cache_file_is_removed(self, tmp_path):
+        cache_path = tree_cache.get_cache_path(str(tmp_path), "key", "pul")
+        with open(cache_path, "wb") as fh:
+            fh.write(b"not a pickle")
+
+        assert tree_cache.load_tree(str(tmp_path), "key", "pul") is False
+        assert not os.path.exists(cache_path)
+
+    def test_truncated_cache_file_is_removed(self, tmp_path):
+        tree_cache.save_tree(str(tmp_path), "key", "pul", {"hd": {}, "ch": list(range(1000))})
+        cache_path = tree_cache.get_cache_path(str(tmp_path), "key", "pul")
+        with open(cache_path, "r+b") as fh:
+            fh.truncate(os.path.getsize(cache_path) // 2)
+
+        assert tree_cache.load_tree(str(tmp_path), "key", "pul") is False
+        assert not os.path.exists(cache_path)
+
+    def test_evict_least_recently_used(self, tmp_path):
+        cache_dir = str(tmp_path)
+        paths = []
+        for idx, key in enumerate(["a", "b", "c"]):
+            tree_cache.save_tree(cache_dir, key, "pul", b"\x00" * 1000)
+            paths.append(tree_cache.get_cache_path(cache_dir, key, "pul"))
+            os.utime(paths[-1], ns=(idx * 10**9, idx * 10**9))
+
+        # loading "a" makes it the most recently used
+        assert tree_cache.load_tree(cache_dir, "a", "pul") == b"\x00" * 1000
+
+        tree_cache.evict(cache_dir, max_cache_bytes=2 * os.path.getsize(paths[0]))
+
+        assert [os.path.exists(path) for path in paths] == [True, False, True]
+
+    def test_evict_ignores_other_files(self, tmp_path):
+        other_path = tmp_path / "other.txt"
+        other_path.write_bytes(b"\x00" * 1000)
+        tree_cache.save_tree(str(tmp_path), "key", "pul", b"\x00" * 1000, max_cache_bytes=0)
+
+        assert other_path.exists()
+        assert not os.path.exists(tree_cache.get_cache_path(str(tmp_path), "key", "pul"))
@@ -0,0 +1,87 @@
+import pickle
+import pytest
+from load_heka_python.trees import TreeSchemas
+from load_heka_python.trees import Trees_v9
+
+
+def get_entries(Record):
+    return [tuple(entry) + (None,) * (3 - len(entry)) for entry in Record().description]
+
+
+class TestDiffSchema:
+
+    def test_base_schema_has_no_differences(self):
+        diff = TreeSchemas.diff_schema(TreeSchemas.BASE_SCHEMA)
+        base_schema = TreeSchemas.get_schema_by_name(TreeSchemas.BASE_SCHEMA)
+
+        assert diff["added"] == diff["removed"] == []
+        assert diff["changed"] == {}
+        assert diff["shared"] == sorted(base_schema.records)
+
+    def test_v9_changed_records(self):
+        """
+        Trees_v9 declares the records that differ from Trees_v1000 and imports the others.
+        """
+        declared = sorted(
+            name for name, Record in vars(Trees_v9).items() if getattr(Record, "__module__", None) == Trees_v9.__name__
+        )
+
+        diff = TreeSchemas.diff_schema("v9")
+
+        assert diff["added"] == diff["removed"] == []
+        assert sorted(diff["changed"]) == declared
+        assert sorted(diff["shared"] + declared) == sorted(TreeSchemas.get_schema_by_name("v9").records)
+
+    @pytest.mark.parametrize("record_name", sorted(TreeSchemas.diff_schema("v9")["changed"]))
+    def test_v9_changed_entries(self, record_name):
+        schema, base_schema = TreeSchemas.get_schema_by_name("v9"), TreeSchemas.get_schema_by_name("v1000")
+        entries = {entry[0]: entry[1:] for entry in get_entries(schema.records[record_name])}
+        base_entries = {entry[0]: entry[1:] for entry in get_entries(base_schema.records[record_name])}
+
+        changed = TreeSchemas.diff_schema("v9")["changed"][record_name]
+
+        assert set(changed["added"]) == entries.keys() - base_entries.keys()
+        assert set(changed["removed"]) == base_entries.keys() - entries.keys()
+        assert set(changed["changed"]) == {
+            name for name in entries.keys() & base_entries.keys() if entries[name] != base_entries[name]
+        }
+
+    def test_v9_sweep_record(self):
+        changed = TreeSchemas.diff_schema("v9")["changed"]["SweepRecord"]
+
+        assert changed == {
+            "added": [],
+            "removed": ["SwPipPressure", "SwRMSNoise", "SwSwUserParamEx"],
+            "changed": ["SwSwUserParams"],
+        }
+
+    def test_pre_2x90_only_has_pulse_records(self):
+        diff = TreeSchemas.diff_schema("v9_pre_2x90")
+
+        assert sorted(diff["changed"]) == [
+            "GroupRecord",
+            "PulSeriesRecord",
+            "PulseRootRecord",
+            "SweepRecord",
+            "TraceRecord",
+        ]
+        assert diff["added"] == []
+        assert "StimChannelRecord" in diff["removed"] and "AmplStateRecord" in diff["removed"]
+        assert "MarkerRecord" in diff["shared"]
+
+
+class TestSchema:
+
+    def test_shared_between_calls_and_pickle(self):
+        schema = TreeSchemas.get_schema("v2x90.2, 22-Nov-2016")
+
+        assert schema is TreeSchemas.get_schema_by_name("v9")
+        assert pickle.loads(pickle.dumps(schema)) is schema
+        assert schema.TraceRecord is schema.records["TraceRecord"]
+
+        with pytest.raises(AttributeError):
+            schema.NotARecord
+
+    def test_unknown_version(self):
+        with pytest.raises(BaseException, match="Version not current supported"):
+            TreeSchemas.get_schema("v0")
@@ -2,6 +2,12 @@
 Module for Tree specification and decoding functions shared between v9 and v1000s
 """
 
+from collections.abc import Mapping, MutableMapping, Sequence
+from enum import IntFlag
+from functools import partial
+from operator import itemgetter
+import struct
+import sys
 import numpy as np
 
 # ----------------------------------------------------------------------------------------------------------------------------------------------------
@@ -20,11 +26,100 @@ def cstr(byte):
     return byte[:ind].decode("utf-8", errors="ignore")
 
 
+def cstr_column(column):
+    """
+    Convert a numpy column of fixed-width C string bytes (raw "V" or "S" dtype, one row per record) with cstr().
+
+    All bytes after the first null are zeroed so rows of the same string are equal (and columns after the longest
+    string dropped), then each unique string is decoded once and the (interned) result shared between all records
+    with that string. Returns a list.
+    """
+    num_bytes = column.dtype.itemsize
+    codes = np.ascontiguousarray(column).view(np.uint8).reshape(len(column), num_bytes)
+
+    is_null = codes == 0
+    first_null = np.where(is_null.any(axis=1), is_null.argmax(axis=1), num_bytes)
+
+    width = int(min(first_null.max(initial=0) + 1, num_bytes))
+    codes = np.where(np.arange(width) >= first_null[:, np.newaxis], 0, codes[:, :width])
+
+    unique_strings, inverse = np.unique(
+        np.ascontiguousarray(codes).view("V{0}".format(width)).ravel(), return_inverse=True
+    )
+
+    decoded = [cstr(item) for item in unique_strings.tolist()]
+    decoded = [sys.intern(item) if isinstance(item, str) else item for item in decoded]
+
+    return [decoded[idx] for idx in inverse.ravel().tolist()]
+
+
 def get_fmt(description):
     fmt = "".join(item[1] for item in description)
     return fmt
 
 
+# struct format characters and their (standard size) numpy equivalent
+STRUCT_TO_NUMPY_TYPES = {
+    "b": "i1",
+    "B": "u1",
+    "?": "?",
+    "h": "i2",
+    "H": "u2",
+    "i": "i4",
+    "I": "u4",
+    "f": "f4",
+    "d": "f8",
+}
+
+
+def split_fmt(fmt):
+    """
+    Split a struct format of a single entry (e.g. "i", "32s", "10d") into its repeat count and type character.
+    """
+    fmt = fmt.strip()
+    count = int(fmt[:-1]) if len(fmt) > 1 else 1
+    return count, fmt[-1]
+
+
+def get_dtype(description, endian="<"):
+    """
+    Build a packed numpy structured dtype equivalent to the struct format of a description.
+
+    Strings ("s", "c") are fixed-width bytes, arrays (e.g. "10d") are sub-arrays and entries decoded
+    with another Description are nested structured dtypes. Where an entry name is repeated (e.g. SeFiller1 in
+    PulSeriesRecord) the last entry is kept, matching the header dictionary.
+    """
+    fields = {}
+    offset = 0
+    for entry in description:
+        name, fmt = entry[0], entry[1]
+        decoder = entry[2] if len(entry) == 3 else None
+        count, type_ = split_fmt(fmt)
+
+        if decoder is not None and not callable(decoder):
+            field_dtype = decoder.get_dtype(endian)
+            assert field_dtype.itemsize == count, "substructure size does not match its format"
+        elif type_ == "s":
+            field_dtype = np.dtype("S{0}".format(count))
+        elif type_ == "c":
+            field_dtype = np.dtype(("S1", (count,))) if count > 1 else np.dtype("S1")
+        else:
+            numpy_type = np.dtype(endian + STRUCT_TO_NUMPY_TYPES[type_])
+            field_dtype = np.dtype((numpy_type, (count,))) if count > 1 else numpy_type
+
+        fields[name] = (field_dtype, offset)
+        offset += field_dtype.itemsize
+
+    return np.dtype(
+        {
+            "names": list(fields.keys()),
+            "formats": [field[0] for field in fields.values()],
+            "offsets": [field[1] for field in fields.values()],
+            "itemsize": offset,
+        }
+    )
+
+
 def get_data_kind(byte, endian):
     """
     Function writted by Luke Campangola
@@ -55,11 +150,7 @@ def get_data_kind(byte, endian):
                          -> set if amplifier of trace was clipping
     *)
     """
-    opts = dict(
-        zip(["IsLittleEndian", "IsLeak", "IsVirtual", "IsImon", "IsVmon", "Clip"], byte_to_bools(byte, endian)[0:7])
-    )
-
-    return opts
+    return DataKind.from_byte(byte, endian)
 
 
 def get_stim_to_dac_id(byte, endian):
@@ -79,35 +170,71 @@ def get_stim_to_dac_id(byte, endian):
          bit 14 (UseReserved)
          bit 15 (UseReserved)
     """
-    opts = dict(
-        zip(
-            [
-                "UseStimScale",
-                "UseRelative",
-                "UseFileTemplate",
-                "UseForLockIn",
-                "UseForWavelength",
-                "UseScaling",
-                "UseForChirp",
-                "UseForImaging",
-            ],
-            byte_to_bools(byte, endian),
-        )
-    )
-    return opts
+    return StimToDacID.from_byte(byte, endian)
 
 
-def byte_to_bools(byte, endian):
+class BitFlags(IntFlag):
     """
-    Convert a byte to 8 bools (byte > bits > bool)
+    Bit options of a record entry (e.g. TrDataKind) as an IntFlag. Options can be read by name as for a dict,
+    e.g. data_kind["IsLeak"], and as_dict() returns the dict of all options.
     """
-    assert endian == "<", "big endian not tested for unpacking byte to bool options"
 
-    bitorder = "big" if endian == ">" else "little"
-    bits = np.unpackbits(np.array(byte, dtype=np.uint8), bitorder=bitorder)
-    list_of_bools = bits.astype(bool)
+    @classmethod
+    def from_byte(cls, byte, endian):
+        assert endian == "<", "big endian not tested for unpacking byte to bool options"
+        return cls(byte & cls.get_mask())
+
+    @classmethod
+    def from_column(cls, column, endian):
+        """
+        Decode a numpy column of the entry for many records at once. Each unique value is converted once
+        and shared between records with that value. Returns a list.
+        """
+        assert endian == "<", "big endian not tested for unpacking byte to bool options"
+
+        unique_values, inverse = np.unique(column.astype(np.int64) & cls.get_mask(), return_inverse=True)
+        flags = [cls(value) for value in unique_values.tolist()]
+
+        return [flags[idx] for idx in inverse.ravel().tolist()]
+
+    @classmethod
+    def get_mask(cls):
+        mask = 0
+        for member in cls.__members__.values():
+            mask |= member.value
+        return mask
+
+    def __getitem__(self, name):
+        return bool(self & type(self).__members__[name])
+
+    def keys(self):
+        return list(type(self).__members__.keys())
+
+    def as_dict(self):
+        return {name: self[name] for name in self.keys()}
 
-    return list_of_bools
+
+class DataKind(BitFlags):
+    IsLittleEndian = 1
+    IsLeak = 2
+    IsVirtual = 4
+    IsImon = 8
+    IsVmon = 16
+    Clip = 32
+
+
+class StimToDacID(BitFlags):
+    UseStimScale = 1
+    UseRelative = 2
+    UseFileTemplate = 4
+    UseForLockIn = 8
+    UseForWavelength = 16
+    UseScaling = 32
+    UseForChirp = 64
+    UseForImaging = 128
+
+
+BIT_FLAG_DECODERS = {get_data_kind: DataKind, get_stim_to_dac_id: StimToDacID}
 
 
 # ----------------------------------------------------------------------------------------------------------------------------------------------------
@@ -131,6 +258,377 @@ class Description:
     def get_description(self):
         return self.description * self.n
 
+    def get_dtype(self, endian="<"):
+        """
+        Numpy structured dtype of the record (a sub-array dtype of n records if n > 1)
+        """
+        dtype = get_dtype(self.description, endian)
+        if self.n > 1:
+            dtype = np.dtype((dtype, (self.n,)))
+        return dtype
+
+
+def get_entry_details(entry):
+    """ """
+    if len(entry) == 2:
+        name, fmt = entry
+        decoder = None
+    else:
+        name, fmt, decoder = entry
+
+    return name, fmt, decoder
+
+
+def decoder_is_class(decoder):
+    is_class = False if (decoder is None or callable(decoder)) else True
+    return is_class
+
+
+def get_raw_dtype(dtype):
+    """
+    Get a dtype with the same layout as a structured dtype but with every field as raw bytes.
+    """
+    names = dtype.names
+    return np.dtype(
+        {
+            "names": names,
+            "formats": ["V{0}".format(dtype.fields[name][0].itemsize) for name in names],
+            "offsets": [dtype.fields[name][1] for name in names],
+            "itemsize": dtype.itemsize,
+        }
+    )
+
+
+# ----------------------------------------------------------------------------------------------------------------------------------------------------
+# Compiled Descriptions
+# ----------------------------------------------------------------------------------------------------------------------------------------------------
+
+_compiled_descriptions = {}
+
+
+def get_compiled_description(description, endian="<", fields=None):
+    """
+    Return the CompiledDescription of a Description instance. These are built once per (class, endian, n)
+    and cached at module level, so formats and decoders are not re-derived for every record.
+
+    fields - optional list of entry names to decode, all other entries are skipped (see CompiledDescription).
+    """
+    fields = None if fields is None else frozenset(fields)
+    key = (type(description), endian, description.n, fields)
+
+    compiled = _compiled_descriptions.get(key)
+    if compiled is None:
+        compiled = _compiled_descriptions[key] = CompiledDescription(description, endian, fields)
+
+    return compiled
+
+
+class CompiledDescription:
+    def __init__(self, description, endian="<", fields=None):
+        """
+        Precompiled decoder for a Description. Holds the struct.Struct for the record (repeated n times), the
+        position of each entry in the unpacked items and a flat dispatch table of decoders, so unpacking a record
+        is a single unpack_from followed by a loop over entries that need decoding.
+
+        Entries that are a single item without a decoder are copied straight from the unpacked items. The
+        remaining entries (arrays, decoded values and substructures, which are themselves compiled) are listed
+        in self.decoders as (name, start, stop, decoder), with stop None for single items.
+
+        The numpy dtype of a single record is also held, for unpacking many records at once in unpack_records().
+
+        If fields is given, only these entries are included in the header dict. All other entries are skipped
+        and never passed through their decoder.
+        """
+        self.name = type(description).__name__
+        self.n = description.n
+        self.size = description.size
+        self.struct = struct.Struct(endian + description.get_fmt())
+
+        assert self.struct.size == description.get_size(), "{0} format does not match its size".format(self.name)
+
+        self.dtype = get_dtype(description.description, endian)
+        self.raw_dtype = get_raw_dtype(self.dtype)
+
+        entries = [get_entry_details(entry) for entry in description.description]
+        last_entries = {entry[0]: idx for idx, entry in enumerate(entries)}
+
+        if fields is not None:
+            for name in fields:
+                if name not in last_entries:
+                    raise BaseException("{0} is not an entry of {1}".format(name, self.name))
+
+        included = [entry[0] for entry in entries if fields is None or entry[0] in fields]
+        self.template = dict.fromkeys(included)  # keeps entry order of the header dict
+        self.simple_names = []
+        self.simple_idx = []
+        self.decoders = []
+        self.columns = []
+
+        i = 0
+        for idx, (name, fmt, decoder) in enumerate(entries):
+
+            count, type_ = split_fmt(fmt)
+            num_items = 1 if type_ == "s" else count
+
+            # repeated names are overwritten in the header dict, only the last is decoded
+            if last_entries[name] == idx and name in self.template:
+
+                decoder = self._get_decoder(decoder, endian)
+                if num_items == 1 and decoder is None:
+                    self.simple_names.append(name)
+                    self.simple_idx.append(i)
+                else:
+                    self.decoders.append((name, i, i + num_items if num_items > 1 else None, decoder))
+
+                self.columns.append((name, type_ in ["s", "c"], num_items > 1, decoder))
+
+            i += num_items
+
+        self.num_items = i
+        self.get_simple_items = itemgetter(*self.simple_idx) if len(self.simple_idx) > 1 else None
+
+    @staticmethod
+    def _get_decoder(decoder, endian):
+        if decoder is None:
+            return None
+        if decoder_is_class(decoder):
+            return partial(LazySubstruct, description=decoder, endian=endian)
+        if decoder in [get_stim_to_dac_id, get_data_kind]:
+            return partial(decoder, endian=endian)
+        return decoder
+
+    def unpack(self, buffer, offset=0):
+        """
+        Unpack all n records in buffer (starting at offset) and return as a tuple of header dicts.
+        """
+        items = self.struct.unpack_from(buffer, offset)
+
+        if self.n == 1:
+            return (self.decode(items),)
+
+        return tuple(self.decode(items[i * self.num_items : (i + 1) * self.num_items]) for i in range(self.n))
+
+    def decode(self, items):
+        """
+        Decode the struct items of a single record into a header dict.
+        """
+        header = self.template.copy()
+
+        if self.get_simple_items:
+            header.update(zip(self.simple_names, self.get_simple_items(items)))
+        elif self.simple_idx:
+            header[self.simple_names[0]] = items[self.simple_idx[0]]
+
+        for name, start, stop, decoder in self.decoders:
+            item = items[start] if stop is None else items[start:stop]
+            header[name] = decoder(item) if decoder else item
+
+        return header
+
+    def unpack_records(self, buffer, endian="<"):
+        """
+        Unpack records stored one after the other, each followed by its number of children as int32
+        (e.g. all TraceRecords of a sweep).
+
+        The records are read into a numpy structured array with a single np.frombuffer call (see get_dtype())
+        and each entry is then converted for all records at once, rather than record-by-record as in unpack().
+        Strings and substructures are taken as raw bytes so they are decoded exactly as they are by struct.
+
+        Returns the list of header dicts and an array of the number of children of each record.
+        """
+        columns, nchilds = self.unpack_columns(buffer, endian)
+
+        header_dicts = [dict(zip(columns.keys(), values)) for values in zip(*columns.values())]
+
+        return header_dicts, nchilds
+
+    def unpack_table(self, buffer, endian="<"):
+        """
+        As unpack_records(), but return the records as a RecordTable rather than a list of header dicts.
+        Entries without a decoder are kept as numpy arrays.
+        """
+        columns, nchilds = self.unpack_columns(buffer, endian, keep_numeric=True)
+
+        return RecordTable(columns), nchilds
+
+    def unpack_columns(self, buffer, endian, keep_numeric=False):
+        """
+        Unpack the entries of records stored one after the other (see unpack_records()) into a dict of columns,
+        each a list with the entry of every record. If keep_numeric, entries that are numeric and not decoded
+        are numpy arrays (copied, so the buffer is not kept alive).
+        """
+        nchilds_dtype = endian + "i4"
+        records = np.frombuffer(buffer, dtype=np.dtype([("hd", self.dtype), ("nchilds", nchilds_dtype)]))
+        raw_headers = records.view(np.dtype([("hd", self.raw_dtype), ("nchilds", nchilds_dtype)]))["hd"]
+        headers = records["hd"]
+
+        columns = dict.fromkeys(self.template)
+        for name, is_bytes, is_array, decoder in self.columns:
+
+            if keep_numeric and not is_bytes and decoder is None:
+                columns[name] = headers[name].copy()
+                continue
+
+            if is_bytes and decoder is cstr:
+                columns[name] = cstr_column(raw_headers[name])
+                continue
+
+            if isinstance(decoder, partial) and decoder.func in BIT_FLAG_DECODERS:
+                columns[name] = BIT_FLAG_DECODERS[decoder.func].from_column(headers[name], endian)
+                continue
+
+            if is_bytes:
+                items = raw_headers[name].tolist()
+            elif is_array:
+                items = [tuple(item) for item in headers[name].tolist()]
+            else:
+                items = headers[name].tolist()
+
+            columns[name] = items if decoder is None else [decoder(item) for item in items]
+
+        return columns, records["nchilds"]
+
+
+class LazySubstruct(Sequence):
+    """
+    Substructure entry of a record (e.g. SeOldAmpState, SeOldLockInParams, SeSeriesUserParams1) held as its raw
+    bytes. The n header dicts are only decoded on first access, after which it behaves as the tuple returned by
+    CompiledDescription.unpack() (indexing, iteration, len, comparison with a tuple).
+    """
+
+    __slots__ = ("raw", "description", "endian", "_records")
+
+    def __init__(self, raw, description, endian="<"):
+        self.raw = raw
+        self.description = description
+        self.endian = endian
+        self._records = None
+
+    @property
+    def records(self):
+        if self._records is None:
+            self._records = get_compiled_description(self.description, self.endian).unpack(self.raw)
+        return self._records
+
+    def __getitem__(self, idx):
+        return self.records[idx]
+
+    def __len__(self):
+        return self.description.n
+
+    def __eq__(self, other):
+        if isinstance(other, LazySubstruct):
+            other = other.records
+        return self.records == other
+
+    def __repr__(self):
+        return repr(self.records)
+
+    def __reduce__(self):
+        return (LazySubstruct, (self.raw, self.description, self.endian))
+
+
+# ----------------------------------------------------------------------------------------------------------------------------------------------------
+# Compact Records
+# ----------------------------------------------------------------------------------------------------------------------------------------------------
+
+
+class RecordTable:
+    def __init__(self, columns):
+        """
+        Struct-of-arrays store for the headers of many records of the same Description (e.g. all TraceRecords
+        of a tree). columns is a dict of entry name to a numpy array or list with the entry for every record.
+        The header of each record is a RecordRow that reads from the columns.
+        """
+        self.columns = columns
+
+    def __len__(self):
+        return len(next(iter(self.columns.values()))) if self.columns else 0
+
+    def get_rows(self):
+        return [RecordRow(self, row) for row in range(len(self))]
+
+
+class RecordRow(Mapping):
+    """
+    Read-only header of a single record in a RecordTable, accessed as the header dict (e.g. hd["TrLabel"]).
+    Values are returned as python types, as in the header dicts.
+    """
+
+    __slots__ = ("table", "row")
+
+    def __init__(self, table, row):
+        self.table = table
+        self.row = row
+
+    def __getitem__(self, name):
+        value = self.table.columns[name][self.row]
+
+        if isinstance(value, np.ndarray):
+            return tuple(value.tolist())
+        if isinstance(value, np.generic):
+            return value.item()
+        return value
+
+    def __iter__(self):
+        return iter(self.table.columns)
+
+    def __len__(self):
+        return len(self.table.columns)
+
+    def __repr__(self):
+        return repr(dict(self))
+
+
+class SlottedRecord(MutableMapping):
+    """
+    Record of a tree with a fixed set of entries (see TreeRecord, LeafRecord) stored in slots rather than a dict,
+    used in place of the {"hd": ..., "ch": ...} record dicts when loading with compact=True.
+    """
+
+    __slots__ = ()
+    _keys = ()
+
+    def __getitem__(self, key):
+        if key not in self._keys:
+            raise KeyError(key)
+        return getattr(self, key)
+
+    def __setitem__(self, key, value):
+        if key not in self._keys:
+            raise KeyError(key)
+        setattr(self, key, value)
+
+    def __delitem__(self, key):
+        raise TypeError("Entries cannot be removed from a tree record")
+
+    def __iter__(self):
+        return iter(self._keys)
+
+    def __len__(self):
+        return len(self._keys)
+
+    def __repr__(self):
+        return repr(dict(self))
+
+
+class TreeRecord(SlottedRecord):
+    __slots__ = ("hd", "ch")
+    _keys = ("hd", "ch")
+
+    def __init__(self, hd, ch):
+        self.hd = hd
+        self.ch = ch
+
+
+class LeafRecord(SlottedRecord):
+    __slots__ = ("hd", "data")
+    _keys = ("hd", "data")
+
+    def __init__(self, hd, data=None):
+        self.hd = hd
+        self.data = data
+
 
 # ----------------------------------------------------------------------------------------------------------------------------------------------------
 # Shared StimTree methods (same v9 and v1000)
@@ -534,7 +1032,7 @@ class MethodChannelRecord(Description):
             ("chCompressionFactor", "i"),  # (* INT32 *)
             ("chYUnit", "8s", cstr),  # (* String8Type *)
             ("chAdcChannel", "h"),  # (* INT16 *)
-            ("chAdcMode", "n"),  # (* BYTE *)
+            ("chAdcMode", "b"),  # (* BYTE *)
             ("chDoWrite", "?"),  # (* BOOLEAN *)
             ("stLeakStore", "b"),  # (* BYTE *)
             ("chAmplMode", "b"),  # (* BYTE *)
@@ -589,7 +1087,7 @@ class MethodChannelRecord(Description):
             ("chTraceMathFormat", "b"),  # (* BYTE *)
             ("chHasChirp", "?"),  # (* BOOLEAN *)
             ("chSquare_Kind", "b"),  # (* BYTE *)
-            ("chFiller1", "6s"),  # (* ARRAY[0..5] OF CHAR *)
+            ("chFiller1", "5s"),  # (* ARRAY[0..5] OF CHAR *)  (typo on the spec file, see Trees_v9)
             ("chSquare_BaseIncr", "d"),  # (* LONGREAL *)
             ("chSquare_Cycle", "d"),  # (* LONGREAL *)
             ("chSquare_PosAmpl", "d"),  # (* LONGREAL *)
@@ -661,7 +1159,7 @@ class MethodRootRecord(Description):
             # (* StimParams     = 10  *)
             # (* StimParamChars = 320 *)
             ("roParams", "10d"),  # (* ARRAY[0..9] OF LONGREAL *)
-            ("roParamText", "32s"),  # (* ARRAY[0..9],[0..31]OF CHAR *)
+            ("roParamText", "320s"),  # (* ARRAY[0..9],[0..31]OF CHAR *)
             ("roReserved", "128s", cstr),  # (* String128Type *)
             ("roFiller2", "i"),  # (* INT32 *)
             ("roCRC", "I"),  # (* CARD32 *)
@@ -0,0 +1,158 @@
+from importlib import import_module
+import inspect
+from .SharedTrees import Description, MarkerRootRecord, MarkerRecord, get_compiled_description
+
+# Schema that other schemas are declared and diffed against (see diff_schema())
+BASE_SCHEMA = "v1000"
+
+# Tree module declaring the record layouts of each schema. Trees_v9 only declares the records that differ from
+# Trees_v1000 and imports the rest, so records with the same layout are the same class (and compiled once).
+SCHEMA_MODULES = {
+    "v9_pre_2x90": "Trees_v9_pre_2x90",
+    "v9": "Trees_v9",
+    "v1000": "Trees_v1000",
+}
+
+# Bundle header oVersion of files written with each schema
+SCHEMA_VERSIONS = {
+    "v9_pre_2x90": ["v2x65, 19-Dec-2011"],
+    "v9": ["v2x90.2, 22-Nov-2016"],
+    "v1000": [
+        "v2x90.3, 19-Mar-2018",
+        "v2x90.4, 30-Oct-2018",
+        "v2x90.5, 09-Apr-2019",
+        "1.2.0 [Build 1469]",
+        "1.3.0 [Build 1008]",
+        "1.4.1 [Build 1036]",
+        "1.5.0 [Build 1061]",
+        "v2x91, 23-Feb-2021",
+        "v2x91, 06-Jul-2020",
+        "v2x92, 23-February-2023",
+        "v2x92, 1-June-2023",
+    ],
+}
+
+VERSION_SCHEMAS = {version: name for name, versions in SCHEMA_VERSIONS.items() for version in versions}
+
+# Marker Records are the same between all versions so are declared in SharedTrees
+SHARED_RECORDS = {"MarkerRootRecord": MarkerRootRecord, "MarkerRecord": MarkerRecord}
+
+# ----------------------------------------------------------------------------------------------------------------------------------------------------
+# Schema Registry
+# ----------------------------------------------------------------------------------------------------------------------------------------------------
+
+_schemas = {}
+
+
+def get_schema(version):
+    """
+    Get the Schema for a bundle header oVersion. Schemas are created once per process and shared by all files
+    of the same version.
+    """
+    if version not in VERSION_SCHEMAS:
+        raise BaseException("Version not current supported, please contact support@easyelectrophysiology.com")
+
+    return get_schema_by_name(VERSION_SCHEMAS[version])
+
+
+def get_schema_by_name(name):
+    schema = _schemas.get(name)
+    if schema is None:
+        schema = _schemas[name] = Schema(name)
+
+    return schema
+
+
+class Schema:
+    def __init__(self, name):
+        """
+        Record layouts of one HEKA file version, declared in its Trees module (see SCHEMA_MODULES).
+
+        self.records holds the Description class of every record in the schema (including SHARED_RECORDS) by name.
+        Records are also available as attributes, e.g. schema.TraceRecord, in the same way as the Trees module.
+
+        Compiled descriptions (struct, dtype, offsets and decoders, see SharedTrees.CompiledDescription) are created
+        on first use with get_compiled() and cached per process by class, so files of different versions share
+        the compiled descriptions of records that have the same layout.
+        """
+        self.name = name
+        self.Trees = import_module("." + SCHEMA_MODULES[name], __package__)
+
+        self.records = dict(SHARED_RECORDS)
+        for record_name, Record in vars(self.Trees).items():
+            if inspect.isclass(Record) and issubclass(Record, Description) and Record is not Description:
+                self.records[record_name] = Record
+
+    def __getattr__(self, name):
+        if name == "records":  # not yet set, e.g. while unpickling
+            raise AttributeError(name)
+        try:
+            return self.records[name]
+        except KeyError:
+            raise AttributeError(name)
+
+    def __reduce__(self):
+        """
+        Schemas hold their (unpicklable) Trees module, so are passed to other processes by name.
+        """
+        return get_schema_by_name, (self.name,)
+
+    def __repr__(self):
+        return "Schema({0})".format(self.name)
+
+    def get_compiled(self, record_name, endian="<", fields=None):
+        """
+        Get the CompiledDescription of a record of the schema, used to unpack all tree records (see
+        LoadHeka._get_compiled_descriptions()).
+        """
+        return get_compiled_description(self.records[record_name](), endian, fields)
+
+    def get_layout(self, record_name):
+        return get_layout(self.records[record_name])
+
+
+def get_layout(Record):
+    """
+    Layout of a record as a list of (name, fmt, decoder) entries, with decoder None for entries that are not decoded.
+    """
+    return [tuple(entry) + (None,) * (3 - len(entry)) for entry in Record().description]
+
+
+def diff_schema(name, base=BASE_SCHEMA):
+    """
+    Compare the record layouts of a schema to a base schema. Returns a dict with:
+        "added", "removed" - names of records only in the schema or only in the base schema.
+        "shared" - names of records with the same class in both schemas.
+        "changed" - dict of record name to {"added": [...], "removed": [...], "changed": [...]}, the names of
+                    entries only in the schema, only in the base schema or with a different format or decoder.
+    """
+    schema, base_schema = get_schema_by_name(name), get_schema_by_name(base)
+
+    diff = {
+        "added": sorted(set(schema.records) - set(base_schema.records)),
+        "removed": sorted(set(base_schema.records) - set(schema.records)),
+        "shared": [],
+        "changed": {},
+    }
+
+    for record_name in sorted(set(schema.records) & set(base_schema.records)):
+        layout, base_layout = schema.get_layout(record_name), base_schema.get_layout(record_name)
+
+        if schema.records[record_name] is base_schema.records[record_name]:
+            diff["shared"].append(record_name)
+
+        elif layout != base_layout:
+            entries = {entry[0]: entry[1:] for entry in layout}
+            base_entries = {entry[0]: entry[1:] for entry in base_layout}
+
+            diff["changed"][record_name] = {
+                "added": [entry_name for entry_name in entries if entry_name not in base_entries],
+                "removed": [entry_name for entry_name in base_entries if entry_name not in entries],
+                "changed": [
+                    entry_name
+                    for entry_name in entries
+                    if entry_name in base_entries and entries[entry_name] != base_entries[entry_name]
+                ],
+            }
+
+    return diff
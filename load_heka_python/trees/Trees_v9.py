@@ -1,23 +1,24 @@
 from .SharedTrees import cstr, Description, AmplifierState_v9, LockInParams_v9, UserParamDescrType
 
-from .SharedTrees import (
-    get_segment_class,
-    get_data_kind,
-    get_seg_store_type,
-    get_leak_comp_type,
-    get_break_type,
-    get_leak_hold_type,
-    get_leak_store_type,
-    get_adc_type,
-    get_auto_ranging_type,
-    get_ampl_mode_type,
-    get_ext_trigger_type,
-    get_increment_mode_type,
-    get_stim_to_dac_id,
-    get_recording_mode,
+from .SharedTrees import get_leak_comp_type, get_auto_ranging_type, get_ext_trigger_type
+
+# Records with the same layout as v1000 are declared once in Trees_v1000, only records that differ are declared below.
+# These are not used here, but imported so they are records of this module (see TreeSchemas.Schema).
+from .Trees_v1000 import (  # noqa: F401
+    StimStimSegmentRecord,
+    StimChannelRecord,
+    TraceRecord,
+    GroupRecord,
+    PulseRootRecord,
+    AmpSeriesRecord,
+    AmpRootRecord,
+    ChemicalRecord,
+    SolutionRecord,
+    FunctionRecord,
+    ScalingRecord,
+    EntryRecord,
 )
 
-
 """
 ------------------------------------------------------------------------------------------------------------------------------------------------------
   StimFile_v9
@@ -119,116 +120,6 @@ SegStoreType         = (SegNoStore,
 """
 
 
-class StimStimSegmentRecord(Description):
-    def __init__(self, n=1):
-        super(StimStimSegmentRecord, self).__init__(n)
-
-        self.description = [
-            ("seMark", "i"),  # (* INT32 *)
-            ("seClass", "b", get_segment_class),  # (* BYTE *)
-            ("seStoreKind", "b", get_seg_store_type),  # (* BYTE *)
-            ("seVoltageIncMode", "b", get_increment_mode_type),  # (* BYTE *)
-            ("seDurationIncMode", "b", get_increment_mode_type),  # (* BYTE *)
-            ("seVoltage", "d"),  # (* LONGREAL *)
-            ("seVoltageSource", "i"),  # (* INT32 *)
-            ("seDeltaVFactor", "d"),  # (* LONGREAL *)
-            ("seDeltaVIncrement", "d"),  # (* LONGREAL *)
-            ("seDuration", "d"),  # (* LONGREAL *)
-            ("seDurationSource", "i"),  # (* INT32 *)
-            ("seDeltaTFactor", "d"),  # (* LONGREAL *)
-            ("seDeltaTIncrement", "d"),  # (* LONGREAL *)
-            ("seFiller1", "i"),  # (* INT32 *)
-            ("seCRC", "I"),  # (* CARD32 *)
-            ("seScanRate", "d"),  # (* LONGREAL *)
-        ]
-
-        self.size = 80
-
-
-class StimChannelRecord(Description):
-    def __init__(self, n=1):
-        super(StimChannelRecord, self).__init__(n)
-
-        self.description = [
-            ("chMark", "i"),  # (* INT32 *)
-            ("chLinkedChannel", "i"),  # (* INT32 *)
-            ("chCompressionFactor", "i"),  # (* INT32 *)
-            ("chYUnit", "8s", cstr),  # (* String8Type *)
-            ("chAdcChannel", "h"),  # (* INT16 *)
-            ("chAdcMode", "b", get_adc_type),  # (* BYTE *)
-            ("chDoWrite", "?"),  # (* BOOLEAN *)
-            ("stLeakStore", "b", get_leak_store_type),  # (* BYTE *)
-            ("chAmplMode", "b", get_ampl_mode_type),  # (* BYTE *)
-            ("chOwnSegTime", "?"),  # (* BOOLEAN *)
-            ("chSetLastSegVmemb", "?"),  # (* BOOLEAN *)
-            ("chDacChannel", "h"),  # (* INT16 *)
-            ("chDacMode", "b"),  # (* BYTE *)
-            ("chHasLockInSquare", "b"),  # (* BYTE *)
-            ("chRelevantXSegment", "i"),  # (* INT32 *)
-            ("chRelevantYSegment", "i"),  # (* INT32 *)
-            ("chDacUnit", "8s", cstr),  # (* String8Type *)
-            ("chHolding", "d"),  # (* LONGREAL *)
-            ("chLeakHolding", "d"),  # (* LONGREAL *)
-            ("chLeakSize", "d"),  # (* LONGREAL *)
-            ("chLeakHoldMode", "b", get_leak_hold_type),  # (* BYTE *)
-            ("chLeakAlternate", "?"),  # (* BOOLEAN *)
-            ("chAltLeakAveraging", "?"),  # (* BOOLEAN *)
-            ("chLeakPulseOn", "?"),  # (* BOOLEAN *)
-            ("chStimToDacID", "h", get_stim_to_dac_id),  # (* SET16 *)
-            ("chCompressionMode", "h"),  # (* SET16 *)
-            ("chCompressionSkip", "i"),  # (* INT32 *)
-            ("chDacBit", "h"),  # (* INT16 *)
-            ("chHasLockInSine", "?"),  # (* BOOLEAN *)
-            ("chBreakMode", "b", get_break_type),  # (* BYTE *)
-            ("chZeroSeg", "i"),  # (* INT32 *)
-            ("chStimSweep", "i"),  # (* INT32 *)
-            ("chSine_Cycle", "d"),  # (* LONGREAL *)
-            ("chSine_Amplitude", "d"),  # (* LONGREAL *)
-            ("chLockIn_VReversal", "d"),  # (* LONGREAL *)
-            ("chChirp_StartFreq", "d"),  # (* LONGREAL *)
-            ("chChirp_EndFreq", "d"),  # (* LONGREAL *)
-            ("chChirp_MinPoints", "d"),  # (* LONGREAL *)
-            ("chSquare_NegAmpl", "d"),  # (* LONGREAL *)
-            ("chSquare_DurFactor", "d"),  # (* LONGREAL *)
-            ("chLockIn_Skip", "i"),  # (* INT32 *)
-            ("chPhoto_MaxCycles", "i"),  # (* INT32 *)
-            ("chPhoto_SegmentNo", "i"),  # (* INT32 *)
-            ("chLockIn_AvgCycles", "i"),  # (* INT32 *)
-            ("chImaging_RoiNo", "i"),  # (* INT32 *)
-            ("chChirp_Skip", "i"),  # (* INT32 *)
-            ("chChirp_Amplitude", "d"),  # (* LONGREAL *)
-            ("chPhoto_Adapt", "b"),  # (* BYTE *)
-            ("chSine_Kind", "b"),  # (* BYTE *)
-            ("chChirp_PreChirp", "b"),  # (* BYTE *)
-            ("chSine_Source", "b"),  # (* BYTE *)
-            ("chSquare_NegSource", "b"),  # (* BYTE *)
-            ("chSquare_PosSource", "b"),  # (* BYTE *)
-            ("chChirp_Kind", "b"),  # (* BYTE *)
-            ("chChirp_Source", "b"),  # (* BYTE *)
-            ("chDacOffset", "d"),  # (* LONGREAL *)
-            ("chAdcOffset", "d"),  # (* LONGREAL *)
-            ("chTraceMathFormat", "b"),  # (* BYTE *)
-            ("chHasChirp", "?"),  # (* BOOLEAN *)
-            ("chSquare_Kind", "b"),  # (* BYTE *)
-            (
-                "chFiller1",
-                "5s",
-                cstr,
-            ),  # (* ARRAY[0..5] OF CHAR *) (This seems to be a typo on the spec file and should be (* ARRAY[0..4] OF CHAR *)
-            ("chSquare_BaseIncr", "d"),  # (* LONGREAL *)
-            ("chSquare_Cycle", "d"),  # (* LONGREAL *)
-            ("chSquare_PosAmpl", "d"),  # (* LONGREAL *)
-            ("chCompressionOffset", "i"),  # (* INT32 *)
-            ("chPhotoMode", "i"),  # (* INT32 *)
-            ("chBreakLevel", "d"),  # (* LONGREAL *)
-            ("chTraceMath", "128s", cstr),  # (* String128Type *)
-            ("chFiller2", "i"),  # (* INT32 *)
-            ("chCRC", "I"),  # (* CARD32 *)
-        ]
-
-        self.size = 400
-
-
 class StimStimulationRecord(Description):
     def __init__(self, n=1):
         super(StimStimulationRecord, self).__init__(n)
@@ -341,80 +232,6 @@ see definition in AmplTreeFile_v9.txt
 """
 
 
-class TraceRecord(Description):
-    def __init__(self, n=1):
-        super(TraceRecord, self).__init__(n)
-
-        self.description = [
-            ("TrMark", "i"),  # (* INT32 *)
-            ("TrLabel", "32s", cstr),  # (* String32Type *)
-            ("TrTraceID", "i"),  # (* INT32 *)
-            ("TrData", "i"),  # (* INT32 *)
-            ("TrDataPoints", "i"),  # (* INT32 *)
-            ("TrInternalSolution", "i"),  # (* INT32 *)
-            ("TrAverageCount", "i"),  # (* INT32 *)
-            ("TrLeakID", "i"),  # (* INT32 *)
-            ("TrLeakTraces", "i"),  # (* INT32 *)
-            ("TrDataKind", "h", get_data_kind),  # (* SET16 *)
-            ("TrUseXStart", "?"),  # (* BOOLEAN *)
-            ("TrTcKind", "b"),  # (* BYTE *)
-            ("TrRecordingMode", "b", get_recording_mode),  # (* BYTE *)
-            ("TrAmplIndex", "c"),  # (* CHAR *)
-            ("TrDataFormat", "b"),  # (* BYTE *)
-            ("TrDataAbscissa", "b"),  # (* BYTE *)
-            ("TrDataScaler", "d"),  # (* LONGREAL *)
-            ("TrTimeOffset", "d"),  # (* LONGREAL *)
-            ("TrZeroData", "d"),  # (* LONGREAL *)
-            ("TrYUnit", "8s", cstr),  # (* String8Type *)
-            ("TrXInterval", "d"),  # (* LONGREAL *)
-            ("TrXStart", "d"),  # (* LONGREAL *)
-            ("TrXUnit", "8s", cstr),  # (* String8Type *)
-            ("TrYRange", "d"),  # (* LONGREAL *)
-            ("TrYOffset", "d"),  # (* LONGREAL *)
-            ("TrBandwidth", "d"),  # (* LONGREAL *)
-            ("TrPipetteResistance", "d"),  # (* LONGREAL *)
-            ("TrCellPotential", "d"),  # (* LONGREAL *)
-            ("TrSealResistance", "d"),  # (* LONGREAL *)
-            ("TrCSlow", "d"),  # (* LONGREAL *)
-            ("TrGSeries", "d"),  # (* LONGREAL *)
-            ("TrRsValue", "d"),  # (* LONGREAL *)
-            ("TrGLeak", "d"),  # (* LONGREAL *)
-            ("TrMConductance", "d"),  # (* LONGREAL *)
-            ("TrLinkDAChannel", "i"),  # (* INT32 *)
-            ("TrValidYrange", "?"),  # (* BOOLEAN *)
-            ("TrAdcMode", "b"),  # (* CHAR *)        # "c" is not read properly
-            ("TrAdcChannel", "h"),  # (* INT16 *)
-            ("TrYmin", "d"),  # (* LONGREAL *)
-            ("TrYmax", "d"),  # (* LONGREAL *)
-            ("TrSourceChannel", "i"),  # (* INT32 *)
-            ("TrExternalSolution", "i"),  # (* INT32 *)
-            ("TrCM", "d"),  # (* LONGREAL *)
-            ("TrGM", "d"),  # (* LONGREAL *)
-            ("TrPhase", "d"),  # (* LONGREAL *)
-            ("TrDataCRC", "I"),  # (* CARD32 *)
-            ("TrCRC", "I"),  # (* CARD32 *)
-            ("TrGS", "d"),  # (* LONGREAL *)
-            ("TrSelfChannel", "i"),  # (* INT32 *)
-            ("TrInterleaveSize", "i"),  # (* INT32 *)
-            ("TrInterleaveSkip", "i"),  # (* INT32 *)
-            ("TrImageIndex", "i"),  # (* INT32 *)
-            ("TrTrMarkers", "10d"),  # (* ARRAY[0..9] OF LONGREAL *)
-            ("TrSECM_X", "d"),  # (* LONGREAL *)
-            ("TrSECM_Y", "d"),  # (* LONGREAL *)
-            ("TrSECM_Z", "d"),  # (* LONGREAL *)
-            ("TrTrHolding", "d"),  # (* LONGREAL *)
-            ("TrTcEnumerator", "i"),  # (* INT32 *)
-            ("TrXTrace", "i"),  # (* INT32 *)
-            ("TrIntSolValue", "d"),  # (* LONGREAL *)
-            ("TrExtSolValue", "d"),  # (* LONGREAL *)
-            ("TrIntSolName", "32s", cstr),  # (* String32Size *)
-            ("TrExtSolName", "32s", cstr),  # (* String32Size *)
-            ("TrDataPedestal", "d"),  # (* LONGREAL *)
-        ]
-
-        self.size = 512
-
-
 class SweepRecord(Description):
     def __init__(self, n=1):
         super(SweepRecord, self).__init__(n)
@@ -474,45 +291,6 @@ class PulSeriesRecord(Description):
         self.size = 1408
 
 
-class GroupRecord(Description):
-    def __init__(self, n=1):
-        super(GroupRecord, self).__init__(n)
-
-        self.description = [
-            ("GrMark", "i"),  # (* INT32 *)
-            ("GrLabel", "32s", cstr),  # (* String32Size *)
-            ("GrText", "80s", cstr),  # (* String32Size *)
-            ("GrExperimentNumber", "i"),  # (* INT32 *)
-            ("GrGroupCount", "i"),  # (* INT32 *)
-            ("GrCRC", "I"),  # (* CARD32 *)
-            ("GrMatrixWidth", "d"),  # (* LONGREAL *)
-            ("GrMatrixHeight", "d"),  # (* LONGREAL *)
-        ]
-        self.size = 144
-
-
-class PulseRootRecord(Description):
-    def __init__(self, n=1):
-        super(PulseRootRecord, self).__init__(n)
-
-        self.description = [
-            ("RoVersion", "i"),  # (* INT32 *)
-            ("RoMark", "i"),  # (* INT32 *)
-            ("RoVersionName", "32s", cstr),  # (* String32Type *)
-            ("RoAuxFileName", "80s", cstr),  # (* String80Type *)
-            ("RoRootText", "400s", cstr),  # (* String400Type *)
-            ("RoStartTime", "d"),  # (* LONGREAL *)
-            ("RoMaxSamples", "i"),  # (* INT32 *)
-            ("RoCRC", "I"),  # (* CARD32 *)
-            ("RoFeatures", "h"),  # (* SET16 *)
-            ("RoFiller1", "h"),  # (* INT16 *)
-            ("RoFiller2", "i"),  # (* INT32 *)
-            ("RoTcEnumerator", "32h"),  # (* ARRAY[0..Max_TcKind_M1] OF INT16 *)
-            ("RoTcKind", "32s", cstr),  # (* ARRAY[0..Max_TcKind_M1] OF INT8 *)
-        ]
-        self.size = 640
-
-
 """
 ------------------------------------------------------------------------------------------------------------------------------------------------------
   AmplTreeFile_v9
@@ -562,38 +340,6 @@ class AmplStateRecord(Description):
         self.size = 560
 
 
-class AmpSeriesRecord(Description):
-    def __init__(self, n=1):
-        super(AmpSeriesRecord, self).__init__(n)
-
-        self.description = [
-            ("SeMark", "i"),  # (* INT32 *)
-            ("SeSeriesCount", "i"),  # (* INT32 *)
-            ("SeFiller1", "i"),  # (* INT32 *)
-            ("SeCRC", "I"),  # (* CARD32 *)
-        ]
-        self.size = 16
-
-
-class AmpRootRecord(Description):
-    def __init__(self, n=1):
-        super(AmpRootRecord, self).__init__(n)
-
-        self.description = [
-            ("RoVersion", "i"),  # (* INT32 *)
-            ("RoMark", "i"),  # (* INT32 *)
-            ("RoVersionName", "32s", cstr),  # (* String32Type *)
-            ("RoAmplifierName", "32s", cstr),  # (* String32Type *)
-            ("RoAmplifier", "c"),  # (* CHAR *)
-            ("RoADBoard", "c"),  # (* CHAR *)
-            ("RoCreator", "c"),  # (* CHAR *)
-            ("RoFiller1", "b"),  # (* BYTE *)
-            ("RoCRC", "I"),  # (* CARD32 *)
-        ]
-
-        self.size = 80
-
-
 """
 ------------------------------------------------------------------------------------------------------------------------------------------------------
   SolutionsFile_v9.txt
@@ -610,36 +356,6 @@ ChemicalLevel = 2;
 """
 
 
-class ChemicalRecord(Description):
-    def __init__(self, n=1):
-        super(ChemicalRecord, self).__init__(n)
-
-        self.description = [
-            ("ChConcentration", "f"),  # (* REAL *)
-            ("ChName", "30s"),  # (* ChemicalNameSize *)
-            ("ChSpare1", "h"),  # (* INT16 *)
-            ("ChCRC", "I"),  # (* CARD32 *)
-        ]
-        self.size = 40
-
-
-class SolutionRecord(Description):
-    def __init__(self, n=1):
-        super(SolutionRecord, self).__init__(n)
-
-        self.description = [
-            ("SoNumber", "i"),  # (* INT32 *)
-            ("SoName", "80s", cstr),  # (* SolutionNameSize *)
-            ("SoNumeric", "f"),  # (* REAL *)
-            ("SoNumericName", "30s", cstr),  # (* ChemicalNameSize *)
-            ("SopH", "f"),  # (* REAL *)
-            ("SopHCompound", "30s", cstr),  # (* ChemicalNameSize *)
-            ("SoOsmol", "f"),  # (* REAL *)
-            ("SoCRC", "I"),  # (* CARD32 *)
-        ]
-        self.size = 160
-
-
 class SolutionsRootRecord(Description):
     def __init__(self, n=1):
         super(SolutionsRootRecord, self).__init__(n)
@@ -806,87 +522,6 @@ SearchDirectionType  = ( Search_All,
 """
 
 
-class FunctionRecord(Description):
-    def __init__(self, n=1):
-        super(FunctionRecord, self).__init__(n)
-
-        self.description = [
-            ("fnMark", "i"),  # (* INT32 *)
-            ("fnName", "32s", cstr),  # (* String32Size *)
-            ("fnUnit", "8s", cstr),  # (* String8Size *)
-            ("fnLeftOperand", "h"),  # (* INT16 *)
-            ("fnRightOperand", "h"),  # (* INT16 *)
-            ("fnLeftBound", "d"),  # (* LONGREAL *)
-            ("fnRightBound", "d"),  # (* LONGREAL *)
-            ("fnConstant", "d"),  # (* LONGREAL *)
-            ("fnXSegmentOffset", "i"),  # (* INT32 *)
-            ("fnYSegmentOffset", "i"),  # (* INT32 *)
-            ("fnTcEnumarator", "h"),  # (* INT16  *)
-            ("fnFunction", "b"),  # (* BYTE *)
-            ("fnDoNotebook", "?"),  # (* BOOLEAN *)
-            ("fnNoFit", "?"),  # (* BOOLEAN *)
-            ("fnNewName", "?"),  # (* BOOLEAN *)
-            ("fnTargetValue", "h"),  # (* INT16 *)
-            ("fnCursorKind", "b"),  # (* BYTE *)
-            ("fnTcKind1", "b"),  # (* 3 BYTE *)  not sure why it says 3 byte, it only adds 1 byte in the spec file
-            ("fnTcKind2", "b"),  # (* 3 BYTE *)
-            ("fnCursorSource", "b"),  # (* BYTE *)
-            ("fnCRC", "I"),  # (* CARD32 *)
-            ("fnEquation", "64s", cstr),  # (* String64Size *)
-            ("fnBaselineMode", "b"),  # (* BYTE *)
-            ("fnSearchDirection", "b"),  # (* BYTE *)
-            ("fnSourceValue", "h"),  # (* INT16 *)
-            ("fnCursorAnker", "h"),  # (* INT16 *)
-            ("fnSpare1", "h"),  # (* INT16 *)
-        ]
-        self.size = 168
-
-
-class ScalingRecord(Description):
-    def __init__(self, n=1):
-        super(ScalingRecord, self).__init__(n)
-
-        self.description = [
-            ("scMinValue", "d"),  # (* LONGREAL *)
-            ("scMaxValue", "d"),  # (* LONGREAL *)
-            ("scGridFactor", "d"),  # (* LONGREAL *)
-            ("scTicLength", "h"),  # (* INT16 *)
-            ("scTicNumber", "h"),  # (* INT16 *)
-            ("scTicDirection", "b"),  # (* BYTE *)
-            ("scAxisLevel", "b"),  # (* BYTE *)
-            ("scAxisType", "b"),  # (* BYTE *)
-            ("scScaleMode", "b"),  # (* BYTE *)
-            ("scNoUnit", "?"),  # (* BOOLEAN *)
-            ("scObsolete", "?"),  # (* BOOLEAN *)
-            ("scZeroLine", "?"),  # (* BOOLEAN *)
-            ("scGrid", "?"),  # (* BOOLEAN *)
-            ("scNice", "?"),  # (* BOOLEAN *)
-            ("scLabel", "?"),  # (* BOOLEAN *)
-            ("scCentered", "?"),  # (* BOOLEAN *)
-            ("scIncludeZero", "?"),  # (* BOOLEAN *)
-        ]
-        self.size = 40
-
-
-class EntryRecord(Description):
-    def __init__(self, n=1):
-        super(EntryRecord, self).__init__(n)
-
-        self.description = [
-            ("enXWave", "h"),  # (* INT16 *)
-            ("enYWave", "h"),  # (* INT16 *)
-            ("enMarkerSize", "h"),  # (* INT16 *)
-            ("enMarkerColorRed", "H"),  # (* CARD16 *)
-            ("enMarkerColorGreen", "H"),  # (* CARD16 *)
-            ("enMarkerColorBlue", "H"),  # (* CARD16 *)
-            ("enMarkerKind", "b"),  # (* BYTE *)
-            ("enEActive", "?"),  # (* BOOLEAN *)
-            ("enLine", "?"),  # (* BOOLEAN *)
-            ("enTraceColor", "?"),  # (* BOOLEAN *)
-        ]
-        self.size = 16
-
-
 class GraphRecord(Description):
     def __init__(self, n=1):
         super(GraphRecord, self).__init__(n)